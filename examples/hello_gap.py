@@ -3,6 +3,9 @@ import os
 import pprint
 import gap_client
 
+# Show the client's log messages, importing gap_client no longer configures logging
+gap_client.enable_logging()
+
 
 def get_env(key, fallback = None, do_debug = True):
 	global env
@@ -0,0 +1,965 @@
+import asyncio
+import json
+import logging
+import time
+import httpx
+from .helpers import *
+from .log import pretty
+from .cache import *
+from .retry import *
+from .token_cache import *
+from .spans import timed
+
+logger = logging.getLogger(__name__)
+
+
+#######################################################################
+
+
+class AsyncClientCredentialsAuth(httpx.Auth):
+	"""
+	OAuth2 client credentials grant for httpx. The token is fetched on first use and renewed when it is about to expire.
+	Concurrent requests share one token fetch, and with a token_cache the token is shared with other clients and processes too
+	"""
+	requires_response_body = True
+
+	def __init__(self, token_url:str, client_id:str, client_secret:str, scope:str = "all", resource:str = None, leeway:int = 20, token_cache:FileTokenCache = None):
+		self.token_url = token_url
+		self.client_id = client_id
+		self.client_secret = client_secret
+		self.scope = scope
+		self.resource = resource
+		self.leeway = leeway
+		self.access_token = None
+		self.expires_at = 0
+		self.token_cache = token_cache
+		self.cache_key = token_cache.key(token_url, client_id, scope, resource) if token_cache else None
+		self._lock = None
+
+	async def lock_token_cache(self):
+		"""
+		Take the cross-process lock of the token cache. The lock is polled rather than waited for, since a blocking
+		flock would stall the event loop. Returns the handle for token_cache.unlock
+		"""
+		delay = 0.005
+		while True:
+			handle = self.token_cache.try_lock(self.cache_key)
+			if handle:
+				return handle
+			await asyncio.sleep(delay)
+			delay = min(delay * 2, 0.1)
+
+	def is_expired(self):
+		return not self.access_token or time.time() + self.leeway >= self.expires_at
+
+	def token_request(self):
+		data = {
+			  "grant_type": "client_credentials"
+			, "client_id": self.client_id
+			, "client_secret": self.client_secret
+			, "scope": self.scope
+		}
+		if self.resource:
+			data["resource"] = self.resource
+		return httpx.Request("POST", self.token_url, data = data, headers = {"Accept": "application/json"})
+
+	def update_token(self, res):
+		res.raise_for_status()
+		raw_result = response_json(res)
+		self.access_token = raw_result.get("access_token")
+		expires_in = raw_result.get("expires_in")
+		self.expires_at = time.time() + float(expires_in) if expires_in else float("inf")
+		if self.token_cache and expires_in:
+			self.token_cache.save(self.cache_key, self.access_token, self.expires_at, token_type=raw_result.get("token_type", "Bearer"), scope=raw_result.get("scope"))
+
+	def load_cached_token(self):
+		entry = self.token_cache.load(self.cache_key)
+		if entry:
+			self.access_token = entry.get("access_token")
+			self.expires_at = entry.get("expires_at")
+
+	async def async_auth_flow(self, request):
+		# The lock must be created inside the running event loop
+		if self._lock is None:
+			self._lock = asyncio.Lock()
+		if self.is_expired():
+			async with self._lock:
+				if self.is_expired():
+					if self.token_cache:
+						self.load_cached_token()
+					if self.is_expired() and self.token_cache:
+						# Held until the new token is saved, so clients that start together wait for the first fetch
+						handle = await self.lock_token_cache()
+						try:
+							self.load_cached_token()
+							if self.is_expired():
+								res = yield self.token_request()
+								self.update_token(res)
+						finally:
+							self.token_cache.unlock(handle)
+					elif self.is_expired():
+						res = yield self.token_request()
+						self.update_token(res)
+		request.headers["Authorization"] = f"Bearer {self.access_token}"
+		yield request
+
+	def sync_auth_flow(self, request):
+		raise RuntimeError("AsyncClientCredentialsAuth can only be used with httpx.AsyncClient")
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+	"""
+	Wraps an httpx transport and retries failed requests according to a RetryPolicy, within a shared RetryBudget.
+	The async counterpart of transport.GapSession
+	"""
+	def __init__(self, transport, retry_policy:RetryPolicy = None, retry_budget:RetryBudget = None):
+		self.transport = transport
+		self.retry_policy = retry_policy
+		self.retry_budget = retry_budget
+
+	async def handle_async_request(self, request):
+		policy = self.retry_policy
+		if self.retry_budget:
+			self.retry_budget.deposit()
+		if not policy or policy.max_attempts <= 1 or not policy.can_retry_method(request.method):
+			return await self.transport.handle_async_request(request)
+		for k, v in policy.idempotency_headers(request.method).items():
+			request.headers[k] = v
+		attempt = 1
+		while True:
+			try:
+				res = await self.transport.handle_async_request(request)
+			except httpx.TransportError as e:
+				if attempt >= policy.max_attempts or (self.retry_budget and not self.retry_budget.withdraw()):
+					raise
+				delay = policy.delay(attempt)
+				reason = str(e) or type(e).__name__
+			else:
+				if not policy.can_retry_status(res.status_code) or attempt >= policy.max_attempts or (self.retry_budget and not self.retry_budget.withdraw()):
+					return res
+				delay = policy.delay(attempt, parse_retry_after(res.headers.get("Retry-After")))
+				reason = f"status {res.status_code}"
+				await res.aclose()
+			logger.warning(f"Retrying {request.method} {request.url} in {delay:.2f}s after attempt {attempt}/{policy.max_attempts} failed with {reason}")
+			await asyncio.sleep(delay)
+			attempt += 1
+
+	async def aclose(self):
+		await self.transport.aclose()
+
+
+#######################################################################
+
+
+class AsyncClient:
+	"""
+	asyncio version of gap_client.Client with the same record methods and the same (result, err) contract.
+	The requests based tooling of Client (tracing, metrics, pool_stats and profile) has no async counterpart.
+	All calls share one httpx connection pool, so one event loop can keep many calls in flight.
+	Use as "async with AsyncClient(...) as client:" or remember to call aclose()
+	"""
+	http = None
+	base_url = None
+	client_id = None
+	client_secret = None
+	account_id = None
+	active_account_id = None
+	auth_url = None
+	api_url = None
+	token_url = None
+	ticket_url = None
+	page_workers = default_page_workers
+	audit_index = None
+	audit_goal_index = None
+	custom_field_registry = None
+	error = None
+
+	def set_status(self, error=None):
+		self.error = error
+
+	def is_ok(self):
+		return not self.error
+
+	def __init__(self, base_url:str, client_id:str, client_secret:str, account_id:str, client_token:str = None, do_debug = False, max_connections:int = 100, max_keepalive_connections:int = 20, keepalive_expiry:float = 5.0, timeout:float = 30.0, page_workers:int = default_page_workers, retry_policy:RetryPolicy = default_retry_policy, retry_budget:RetryBudget = None, token_cache = None, transport = None, title_cache_ttl:float = default_title_cache_ttl):
+		"""
+		Create an instance of the async gap-client. Takes the same parameters as gap_client.Client, plus connection pool limits.
+		Unlike Client, the account is not changed in the constructor but on the first request, since a constructor can not be awaited.
+		The optional transport parameter replaces the httpx transport, for example with httpx.MockTransport in tests
+		"""
+		self.base_url = base_url
+		self.client_id = client_id
+		self.client_secret = client_secret
+		self.account_id = account_id
+		self.auth_url = f"{self.base_url}/auth"
+		self.api_url = f"{self.base_url}/api-v1"
+		self.token_url = f"{self.auth_url}/token"
+		self.ticket_url = f"{self.api_url}/tickets"
+		self.page_workers = page_workers
+		self.audit_index = TitleIndex(ttl = title_cache_ttl)
+		self.audit_goal_index = TitleIndex(ttl = title_cache_ttl)
+		self.custom_field_registry = CustomFieldRegistry(ttl = title_cache_ttl)
+		self.write_counter = WriteCounter()
+		self.error = None
+		self.active_account_id = None
+		self._account_lock = None
+		if not self.base_url:
+			self.set_status("No base_url specified")
+		if not self.account_id:
+			self.set_status("No account_id specified")
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		headers = {"Accept": "application/json"}
+		auth = None
+		if client_token:
+			if do_debug:
+				logger.info(f"Using token '{client_token}'")
+			headers["Authorization"] = f"Bearer {client_token}"
+		else:
+			if do_debug:
+				logger.info("Using oauth")
+			if not self.client_id:
+				self.set_status("No client_id specified")
+			if not self.client_secret:
+				self.set_status("No client_secret specified")
+			auth = AsyncClientCredentialsAuth(token_url=self.token_url, client_id=self.client_id, client_secret=self.client_secret, scope="all", resource=self.base_url, token_cache=make_token_cache(token_cache))
+		limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections, keepalive_expiry=keepalive_expiry)
+		transport = AsyncRetryTransport(transport or httpx.AsyncHTTPTransport(limits=limits), retry_policy=retry_policy, retry_budget=retry_budget or RetryBudget())
+		self.http = httpx.AsyncClient(headers=headers, auth=auth, timeout=timeout, transport=transport)
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *args):
+		await self.aclose()
+
+	async def aclose(self):
+		if self.http:
+			await self.http.aclose()
+
+	async def ensure_account(self):
+		"""
+		Make sure the server session is on our account before the first real request
+		"""
+		if self.active_account_id == self.account_id:
+			return None
+		if self._account_lock is None:
+			self._account_lock = asyncio.Lock()
+		async with self._account_lock:
+			if self.active_account_id == self.account_id:
+				return None
+			ok, err = await self.change_account()
+			return err
+
+	def hello_gap(self):
+		"""
+		Simple check to see that client is installed and runs
+		"""
+		logger.info("Welcome to async gap client! It seems to run! 🎉🎉🎉")
+
+	async def get_memberships(self):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		result = None
+		err = None
+		try:
+			url = f"{self.api_url}/account/get-memberships"
+			logger.debug("Using get memberships URL:%s", url)
+			res = await self.http.get(url)
+			res.raise_for_status()
+			raw_result = response_json(res)
+			result = list()
+			for item in raw_result:
+				clean, err = clean_membership(item)
+				if clean:
+					result.append(clean)
+				else:
+					return None, err
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+		return result, err
+
+	async def change_account(self, account_id = None):
+		"""
+		Switch the server session to account_id (or to the client's account). Switching to the active account is a no-op
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		if (account_id or self.account_id) == self.active_account_id:
+			return True, None
+		if account_id and account_id != self.account_id:
+			# The indexes belong to the previous account
+			self.audit_index.invalidate()
+			self.audit_goal_index.invalidate()
+			self.custom_field_registry.invalidate()
+		self.account_id = account_id or self.account_id
+		err = None
+		try:
+			url = f"{self.api_url}/account/change-account/{self.account_id}"
+			query_body = {
+				"account_id": self.account_id
+			}
+			logger.debug("Using change account url:%s", url)
+			res = await self.http.post(url, params = query_body)
+			res.raise_for_status()
+			self.active_account_id = self.account_id
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+		return True, err
+
+	async def delete_audit(self, id, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audits/{id}"
+			res = await self.http.delete(url)
+			res.raise_for_status()
+			self.audit_index.discard(id)
+			result = True
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+			if do_debug:
+				logger.warning(f"delete_audit: {err}")
+		return result, err
+
+	async def get_audits(self, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result, err = await self.generic_get(url=f"{self.api_url}/{self.account_id}/audits", name="audits", do_debug = do_debug)
+		if not err:
+			self.audit_index.fill(result)
+		return result, err
+
+	async def iter_audits(self, do_debug = False):
+		"""
+		Yield (audit, err) for each audit as its page arrives, while the next page is prefetched
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			yield None, self.error
+			return
+		err = await self.ensure_account()
+		if err:
+			yield None, err
+			return
+		async for item in self.generic_iter(url=f"{self.api_url}/{self.account_id}/audits", name="audits", do_debug = do_debug):
+			yield item
+
+	async def create_audit_goal(self, raw_body, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		raw_result, err = await self.post_audit_goal(raw_body, do_debug = do_debug)
+		if not raw_result:
+			return None, err
+		return timed(clean_audit_goal_in)(raw_result)
+
+	async def post_audit_goal(self, raw_body, do_debug = False):
+		"""
+		Create the audit goal and return the raw record the server sent back, as listings and patches return it
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		audit_goal, err = timed(clean_audit_goal_out)(raw_body, do_debug=do_debug)
+		if not audit_goal:
+			return None, f"No audit goal, {err}"
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audit-goals"
+			if do_debug:
+				logger.info(f"Using create audit goal url:{url}")
+				logger.info(f"Using create audit goal json:{json.dumps(audit_goal)}")
+			res = await self.http.post(url, json = audit_goal)
+			res.raise_for_status()
+			result = response_json(res)
+			self.audit_goal_index.put(result)
+			if do_debug:
+				logger.info("create_audit_goal return raw_result=%s", pretty(result))
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+		return result, err
+
+	async def patch_audit_goal(self, id, raw_audit_goal=dict(), do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		# Accepts custom fields
+		try:
+			url = f"{self.api_url}/{self.account_id}/audit-goals/{id}"
+			if do_debug:
+				logger.info(f"Using patch audit goal url:{url}")
+			res = await self.http.put(url, json = raw_audit_goal)
+			res.raise_for_status()
+			result = response_json(res)
+			self.audit_goal_index.replace(id, result)
+			if do_debug:
+				logger.info("patch_audit_goal response: %s", pretty(result))
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+		return result, err
+
+	async def delete_audit_goal(self, id, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audit-goals/{id}"
+			res = await self.http.delete(url)
+			res.raise_for_status()
+			self.audit_goal_index.discard(id)
+			result = response_json(res)
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+		return result, err
+
+	async def get_audit_goal(self, id, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audit-goals/{id}"
+			if do_debug:
+				logger.info(f"Using get audit goal url:{url}")
+			res = await self.http.get(url)
+			res.raise_for_status()
+			raw_result = response_json(res)
+			result = list()
+			for item in raw_result.get("data"):
+				clean, err = timed(clean_audit_goal_in)(item)
+				if clean:
+					result.append(clean)
+				else:
+					return None, err
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+		return result, err
+
+	async def get_audit_by_title(self, title, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fresh, audit = self.audit_index.get(title)
+		if fresh:
+			return audit, None
+		if self.audit_index.is_enabled():
+			# One listing fills the index for the lookups that follow
+			audits, err = await self.get_audits(do_debug = do_debug)
+			if err:
+				return None, err
+			return self.audit_index.find(title), None
+		# Stop paging as soon as we have a match
+		audits = self.iter_audits(do_debug = do_debug)
+		try:
+			async for audit, err in audits:
+				if err:
+					return None, err
+				if audit.get("title") == title:
+					return audit, None
+		finally:
+			await audits.aclose()
+		return None, None
+
+	async def get_audit_goals(self, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result, err = await self.generic_get(url=f"{self.api_url}/{self.account_id}/audit-goals", name="audit-goals", do_debug = do_debug)
+		if not err:
+			self.audit_goal_index.fill(result)
+		return result, err
+
+	async def iter_audit_goals(self, do_debug = False):
+		"""
+		Yield (audit_goal, err) for each audit goal as its page arrives, while the next page is prefetched
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			yield None, self.error
+			return
+		err = await self.ensure_account()
+		if err:
+			yield None, err
+			return
+		async for item in self.generic_iter(url=f"{self.api_url}/{self.account_id}/audit-goals", name="audit-goals", do_debug = do_debug):
+			yield item
+
+	async def find_audit_goal_by_title(self, title, do_debug = False):
+		"""
+		Look up the raw audit goal record (including its id) by title, from the index when it is fresh
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fresh, goal = self.audit_goal_index.get(title)
+		if fresh:
+			return goal, None
+		if self.audit_goal_index.is_enabled():
+			# One listing fills the index for the lookups that follow
+			goals, err = await self.get_audit_goals(do_debug = do_debug)
+			if err:
+				return None, err
+			return self.audit_goal_index.find(title), None
+		# Stop paging as soon as we have a match
+		goals = self.iter_audit_goals(do_debug = do_debug)
+		try:
+			async for goal, err in goals:
+				if err:
+					return None, err
+				if goal.get("title") == title:
+					return goal, None
+		finally:
+			await goals.aclose()
+		return None, None
+
+	async def get_audit_goal_by_title(self, title, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		goal, err = await self.find_audit_goal_by_title(title, do_debug = do_debug)
+		if not goal:
+			return None, err
+		return timed(clean_audit_goal_in)(goal)
+
+	def write_stats(self):
+		"""
+		How many upserts created, patched or skipped a record because it was unchanged, see helpers.WriteCounter
+		"""
+		return self.write_counter.snapshot()
+
+	async def patch_audit_goal_if_changed(self, audit_goal, raw_body, skip_unchanged = True, do_debug = False):
+		"""
+		Patch an existing audit goal record with raw_body, unless no field would change. Then the record is returned without a call
+		"""
+		out = audit_goal_patch_body(audit_goal, raw_body)
+		if skip_unchanged and not changed_fields(out, audit_goal):
+			self.write_counter.add("unchanged")
+			return audit_goal, None
+		result, err = await self.patch_audit_goal(audit_goal.get("id"), out, do_debug = do_debug)
+		if not err:
+			self.write_counter.add("patched")
+		return result, err
+
+	async def create_counted_audit_goal(self, raw_body, do_debug = False):
+		result, err = await self.post_audit_goal(raw_body, do_debug = do_debug)
+		if not err:
+			self.write_counter.add("created")
+		return result, err
+
+	async def upsert_audit_goal_by_title(self, raw_body, skip_unchanged = True, do_debug = False):
+		"""
+		Create the audit goal, or patch the one with the same title, see Client.upsert_audit_goal_by_title.
+		The result is the raw audit goal record in all three cases
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		if not raw_body:
+			return None, "No body specified"
+		title = raw_body.get("title")
+		if not title:
+			return None, "No title in specified in body"
+		audit_goal, err = await self.find_audit_goal_by_title(title, do_debug = do_debug)
+		if not audit_goal:
+			if do_debug:
+				logger.info("upsert audit goal : no existing, creating")
+			if err:
+				return None, err
+			return await self.create_counted_audit_goal(raw_body, do_debug = do_debug)
+		return await self.patch_audit_goal_if_changed(audit_goal, raw_body, skip_unchanged = skip_unchanged, do_debug = do_debug)
+
+	async def upsert_audit_goals(self, raw_bodies, max_workers = default_write_workers, skip_unchanged = True, do_debug = False):
+		"""
+		Create or patch many audit goals by title based on a single listing, see Client.upsert_audit_goals.
+		Up to max_workers titles are written at the same time, the bodies of one title in order
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		results = [(None, None)] * len(raw_bodies)
+		indices_by_title = dict()
+		for i, raw_body in enumerate(raw_bodies):
+			if not raw_body:
+				results[i] = (None, "No body specified")
+				continue
+			title = raw_body.get("title")
+			if not title:
+				results[i] = (None, "No title in specified in body")
+				continue
+			indices_by_title.setdefault(title, list()).append(i)
+		if not indices_by_title:
+			return results, None
+		if not self.audit_goal_index.is_fresh():
+			goals, err = await self.get_audit_goals(do_debug = do_debug)
+			if err:
+				return None, err
+			existing = dict()
+			for goal in goals:
+				existing.setdefault(goal.get("title"), goal)
+		else:
+			existing = {title: self.audit_goal_index.find(title) for title in indices_by_title}
+		semaphore = asyncio.Semaphore(max(1, max_workers))
+		async def write_title(title):
+			async with semaphore:
+				audit_goal = existing.get(title)
+				for i in indices_by_title[title]:
+					raw_body = raw_bodies[i]
+					if audit_goal:
+						results[i] = await self.patch_audit_goal_if_changed(audit_goal, raw_body, skip_unchanged = skip_unchanged, do_debug = do_debug)
+					else:
+						results[i] = await self.create_counted_audit_goal(raw_body, do_debug = do_debug)
+					result = results[i][0]
+					# Later bodies with this title compare against and patch the latest record
+					if isinstance(result, dict) and result.get("id"):
+						audit_goal = result
+		await asyncio.gather(*[write_title(title) for title in indices_by_title])
+		return results, None
+
+	async def create_audit(self, raw_body, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		audit, err = clean_audit_out(raw_body)
+		if not audit:
+			return None, f"No audit, {err}"
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audits"
+			if do_debug:
+				logger.info(f"create_audit url:{url}")
+			res = await self.http.post(url, json = audit)
+			res.raise_for_status()
+			result = response_json(res)
+			self.audit_index.put(result)
+			if do_debug:
+				logger.info("create_audit result: %s", pretty(result))
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+			if do_debug:
+				logger.warning(f"create_audit error: {err}")
+		return result, err
+
+	async def patch_audit(self, id, raw_body = dict(), do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		audit, clean_err = clean_audit_out(raw_body)
+		if not audit:
+			return None, f"Could not clean audit: {clean_err}"
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		# Accepts custom fields
+		try:
+			url = f"{self.api_url}/{self.account_id}/audits/{id}"
+			if do_debug:
+				logger.info(f"patch_audit url:{url}")
+			res = await self.http.patch(url, json = audit)
+			res.raise_for_status()
+			result = response_json(res)
+			self.audit_index.replace(id, result)
+			if do_debug:
+				logger.info("patch_audit result: %s", pretty(result))
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+			if do_debug:
+				logger.warning(f"patch_audit err: {err}")
+		return result, err
+
+	async def upsert_audit(self, raw_body, skip_unchanged = True, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		if not raw_body:
+			return None, "No body specified"
+		title = raw_body.get("title")
+		if not title:
+			return None, "No title in specified in body"
+		audit, err = await self.get_audit_by_title(title, do_debug = do_debug)
+		if not audit:
+			if err:
+				return None, err
+			if do_debug:
+				logger.info("upsert audit: no existing, creating")
+			result, err = await self.create_audit(raw_body, do_debug = do_debug)
+			if not err:
+				self.write_counter.add("created")
+			return result, err
+		id = audit.get("id")
+		body, clean_err = clean_audit_out(raw_body)
+		if skip_unchanged and body and not changed_fields(body, audit):
+			self.write_counter.add("unchanged")
+			return audit, None
+		if do_debug:
+			logger.info(f"upsert_audit patch: {id}")
+		result, err = await self.patch_audit(id, raw_body, do_debug = do_debug)
+		if not err:
+			self.write_counter.add("patched")
+		return result, err
+
+	async def create_custom_fields(self, field_type, raw_fields, do_debug = False):
+		"""
+		Create custom fields of one type in a single call. Returns the created fields
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		if field_type not in valid_custom_field_types:
+			return None, "Invalid field type"
+		fields = list()
+		for raw_field in raw_fields:
+			field, err = timed(clean_custom_field)(raw_field)
+			if not field:
+				return None, f"No field, {err}"
+			fields.append(field)
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		try:
+			query_body = {
+				  "account_id": self.account_id
+				, "type": field_type
+				, "fields" : fields
+			}
+			url = f"{self.api_url}/{self.account_id}/custom-fields"
+			if do_debug:
+				logger.info(f"create_custom_fields query body:{json.dumps(query_body, indent=3)}")
+			res = await self.http.post(url, json = query_body)
+			res.raise_for_status()
+			raw_result = response_json(res)
+			result = list()
+			for custom_field in raw_result.get("fields"):
+				clean, clean_err = timed(clean_custom_field)(custom_field)
+				if clean:
+					clean["type"] = field_type
+					result.append(clean)
+					self.custom_field_registry.put(clean)
+		except httpx.HTTPError as e:
+			err = http_error_text(e)
+			if do_debug:
+				logger.warning(f"create_custom_fields error: {err}")
+		return result, err
+
+	async def create_custom_field(self, field_type, raw_field, do_debug = False):
+		return await self.create_custom_fields(field_type, [raw_field], do_debug = do_debug)
+
+	async def get_custom_fields(self, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = await self.ensure_account()
+		if err:
+			return None, err
+		result, err = await self.generic_get(url=f"{self.api_url}/{self.account_id}/custom-fields", name="custom-fields", sub="fields", clean_fun=clean_custom_field, inherit=["account_id", "type", "created_at", "updated_at"], do_debug = do_debug)
+		if not err:
+			self.custom_field_registry.fill(result)
+		return result, err
+
+	async def known_custom_fields(self, field_type = None, do_debug = False):
+		"""
+		The custom fields (of field_type) from the client's registry, listing them only when the registry is not fresh
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fresh, fields = self.custom_field_registry.get_fields(field_type)
+		if fresh:
+			return fields, None
+		fields, err = await self.get_custom_fields(do_debug = do_debug)
+		if err:
+			return None, err
+		if not self.custom_field_registry.is_enabled():
+			return [field for field in fields if field_type is None or field.get("type") == field_type], None
+		return self.custom_field_registry.fields(field_type), None
+
+	async def find_custom_field(self, field_type, name = None, slug = None, do_debug = False):
+		"""
+		Look up a custom field of field_type by slug, or by name when no slug is given. Returns (None, None) when there is none
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fresh, field = self.custom_field_registry.get(field_type, name = name, slug = slug)
+		if fresh:
+			return field, None
+		fields, err = await self.known_custom_fields(field_type, do_debug = do_debug)
+		if err:
+			return None, err
+		for field in fields:
+			if (slug and field.get("slug") == slug) or (not slug and field.get("name") == name):
+				return field, None
+		return None, None
+
+	async def custom_field_slugs(self, field_type, names, do_debug = False):
+		"""
+		Resolve column names to the slugs of the existing custom fields of field_type. Names without a field are left out
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fields, err = await self.known_custom_fields(field_type, do_debug = do_debug)
+		if err:
+			return None, err
+		slugs = dict()
+		for field in fields:
+			if field.get("name") in names:
+				slugs.setdefault(field.get("name"), field.get("slug"))
+		return slugs, None
+
+	async def iter_custom_fields(self, do_debug = False):
+		"""
+		Yield (custom_field, err) for each custom field as its page arrives, while the next page is prefetched
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			yield None, self.error
+			return
+		err = await self.ensure_account()
+		if err:
+			yield None, err
+			return
+		async for item in self.generic_iter(url=f"{self.api_url}/{self.account_id}/custom-fields", name="custom-fields", sub="fields", clean_fun=clean_custom_field, inherit=["account_id", "type", "created_at", "updated_at"], do_debug = do_debug):
+			yield item
+
+	async def upsert_custom_fields(self, field_type, raw_fields = list(), do_debug = False):
+		"""
+		Make sure the custom fields exist with one listing and a single create call for all that are missing, see Client.upsert_custom_fields
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		existing, err = await self.known_custom_fields(field_type, do_debug = do_debug)
+		if err:
+			return None, err
+		found, missing, err = custom_field_diff(existing, field_type, raw_fields)
+		if err:
+			return None, err
+		created_by_name = dict()
+		if missing:
+			created, err = await self.create_custom_fields(field_type, missing, do_debug = do_debug)
+			if err:
+				return None, err
+			created_by_name = {field.get("name"): field for field in created}
+		return [field or created_by_name.get(raw_field.get("name")) for raw_field, field in zip(raw_fields, found)], None
+
+	async def fetch_page(self, url):
+		res = await self.http.get(url)
+		res.raise_for_status()
+		return response_json(res)
+
+	async def generic_get(self, url, name, sub=None, clean_fun=None, inherit=None, do_debug = False):
+		"""
+		Async counterpart of helpers.generic_get. Once the first page tells how many pages there are, up to page_workers of the rest are fetched at the same time
+		"""
+		result = None
+		err = None
+		try:
+			if do_debug:
+				logger.info(f"Using get '{name}' url:'{url}'")
+			first = await self.fetch_page(url)
+			pages = [first]
+			last_page = last_page_of(first)
+			current_page = int(first.get("current_page") or 1)
+			next_page_url = first.get("next_page_url")
+			if next_page_url and last_page and last_page > current_page and self.page_workers > 1:
+				semaphore = asyncio.Semaphore(self.page_workers)
+				async def bounded_fetch(page):
+					async with semaphore:
+						return await self.fetch_page(page_url(url, page))
+				pages.extend(await asyncio.gather(*[bounded_fetch(page) for page in range(current_page + 1, last_page + 1)]))
+				# The collection may have grown while we were fetching
+				next_page_url = pages[-1].get("next_page_url")
+			while next_page_url:
+				raw_result = await self.fetch_page(next_page_url)
+				pages.append(raw_result)
+				next_page_url = raw_result.get("next_page_url")
+			result = list()
+			for raw_result in pages:
+				result.extend(page_items(raw_result, name = name, sub = sub, clean_fun = clean_fun, inherit = inherit, do_debug = do_debug))
+		except httpx.HTTPError as e:
+			result = None
+			err = http_error_text(e)
+		return result, err
+
+
+	async def generic_iter(self, url, name, sub=None, clean_fun=None, inherit=None, do_debug = False):
+		"""
+		Async counterpart of helpers.generic_iter. The next page is fetched by a task while the caller works on the current one,
+		and closing the generator cancels it
+		"""
+		pending = None
+		try:
+			if do_debug:
+				logger.info(f"Iterating '{name}' url:'{url}'")
+			raw_result = await self.fetch_page(url)
+			while raw_result is not None:
+				next_page_url = raw_result.get("next_page_url")
+				if next_page_url:
+					pending = asyncio.ensure_future(self.fetch_page(next_page_url))
+				for item in page_items(raw_result, name = name, sub = sub, clean_fun = clean_fun, inherit = inherit, do_debug = do_debug):
+					yield item, None
+				if pending:
+					raw_result = await pending
+					pending = None
+				else:
+					raw_result = None
+		except httpx.HTTPError as e:
+			yield None, http_error_text(e)
+		finally:
+			if pending:
+				pending.cancel()
+
+
+def http_error_text(e):
+	"""
+	Render an httpx error like the sync client renders requests errors, including the response body when there is one
+	"""
+	response = getattr(e, "response", None) if isinstance(e, httpx.HTTPStatusError) else None
+	if response is not None:
+		return f"{e}|{response.text}"
+	return str(e)
+
+
+def response_json(res):
+	"""
+	res.json(), with a body that is not JSON (a proxy or maintenance page) raised as an httpx.DecodingError, so the
+	callers turn it into err like any other httpx error, as the sync client does with requests' JSONDecodeError
+	"""
+	try:
+		return res.json()
+	except ValueError as e:
+		raise httpx.DecodingError(f"Invalid JSON in response: {e}", request = res.request) from e
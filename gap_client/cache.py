@@ -0,0 +1,314 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Default number of seconds a filled index is trusted before the next lookup lists the collection again
+default_title_cache_ttl = 60.0
+
+
+class TitleIndex:
+	"""
+	Title to record index for one collection (audits or audit goals), so lookups by title cost no HTTP call.
+	It is filled by one full listing, kept up to date by the client's create, patch and delete calls and
+	expires ttl seconds after it was filled. A ttl of None or 0 disables it.
+	Records are kept in listing order so that duplicate titles resolve to the same record as a linear scan would
+	"""
+	def __init__(self, ttl = default_title_cache_ttl):
+		self.ttl = ttl
+		self.records = dict()
+		self.ids_by_title = dict()
+		self.filled_at = None
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.RLock()
+
+	def is_enabled(self):
+		return bool(self.ttl)
+
+	def is_fresh(self):
+		return self.is_enabled() and self.filled_at is not None and time.monotonic() - self.filled_at < self.ttl
+
+	def fill(self, records):
+		"""
+		Replace the content of the index with the records of a full listing
+		"""
+		if not self.is_enabled():
+			return
+		with self.lock:
+			self.records = dict()
+			self.ids_by_title = dict()
+			for record in records or list():
+				self._add(record)
+			self.filled_at = time.monotonic()
+
+	def get(self, title):
+		"""
+		Returns (fresh, record). When fresh is False the index can not answer and the caller must list the collection
+		"""
+		with self.lock:
+			if not self.is_fresh():
+				self.misses += 1
+				return False, None
+			self.hits += 1
+			return True, self.find(title)
+
+	def stats(self):
+		"""
+		Lookups answered from the index (hits) and lookups that needed a listing (misses)
+		"""
+		with self.lock:
+			return {"size": len(self.records), "fresh": self.is_fresh(), "hits": self.hits, "misses": self.misses}
+
+	def find(self, title):
+		"""
+		Return the first record with this title, regardless of freshness
+		"""
+		with self.lock:
+			ids = self.ids_by_title.get(title)
+			return self.records.get(ids[0]) if ids else None
+
+	def put(self, record):
+		"""
+		Add a newly created record, or replace the existing record with the same id
+		"""
+		if not record or self.filled_at is None:
+			return
+		with self.lock:
+			self.discard(record.get("id"))
+			self._add(record)
+
+	def replace(self, id, record):
+		"""
+		Update the record with this id from the response to a patch. When the response does not hold the record we can not
+		know what changed, so the whole index is invalidated
+		"""
+		if self.filled_at is None:
+			return
+		with self.lock:
+			if record and record.get("title") is not None:
+				self.discard(id)
+				self._add(dict(record, id=record.get("id", id)))
+			else:
+				self.invalidate()
+
+	def discard(self, id):
+		if id is None:
+			return
+		with self.lock:
+			record = self.records.pop(str(id), None)
+			if record is None:
+				return
+			ids = self.ids_by_title.get(record.get("title"))
+			if ids:
+				ids.remove(str(id))
+				if not ids:
+					del self.ids_by_title[record.get("title")]
+
+	def invalidate(self):
+		with self.lock:
+			self.records = dict()
+			self.ids_by_title = dict()
+			self.filled_at = None
+
+	def _add(self, record):
+		if not record:
+			return
+		title = record.get("title")
+		id = record.get("id")
+		if title is None or id is None:
+			return
+		self.records[str(id)] = record
+		self.ids_by_title.setdefault(title, list()).append(str(id))
+
+
+class CustomFieldRegistry:
+	"""
+	Custom fields indexed by (type, name) and (type, slug), so mapping code can resolve column names to slugs without
+	HTTP calls. It is filled by one full listing, gains the fields the client creates and expires ttl seconds after it
+	was filled. A ttl of None or 0 disables it. The first field listed for a name wins, as in a linear scan
+	"""
+	def __init__(self, ttl = default_title_cache_ttl):
+		self.ttl = ttl
+		self.all = list()
+		self.by_name = dict()
+		self.by_slug = dict()
+		self.filled_at = None
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.RLock()
+
+	def is_enabled(self):
+		return bool(self.ttl)
+
+	def is_fresh(self):
+		return self.is_enabled() and self.filled_at is not None and time.monotonic() - self.filled_at < self.ttl
+
+	def fill(self, fields):
+		"""
+		Replace the content of the registry with the fields of a full listing
+		"""
+		if not self.is_enabled():
+			return
+		with self.lock:
+			self.all = list()
+			self.by_name = dict()
+			self.by_slug = dict()
+			for field in fields or list():
+				self._add(field)
+			self.filled_at = time.monotonic()
+
+	def get(self, field_type, name = None, slug = None):
+		"""
+		Returns (fresh, field) for a lookup by slug, or by name when no slug is given. When fresh is False the registry can
+		not answer and the caller must list the fields
+		"""
+		with self.lock:
+			if not self.is_fresh():
+				self.misses += 1
+				return False, None
+			self.hits += 1
+			return True, self.find(field_type, name = name, slug = slug)
+
+	def stats(self):
+		with self.lock:
+			return {"size": len(self.all), "fresh": self.is_fresh(), "hits": self.hits, "misses": self.misses}
+
+	def find(self, field_type, name = None, slug = None):
+		"""
+		Return the field regardless of freshness
+		"""
+		with self.lock:
+			if slug:
+				return self.by_slug.get((field_type, slug))
+			return self.by_name.get((field_type, name))
+
+	def get_fields(self, field_type = None):
+		"""
+		Returns (fresh, fields of field_type). When fresh is False the caller must list the fields
+		"""
+		with self.lock:
+			if not self.is_fresh():
+				self.misses += 1
+				return False, None
+			self.hits += 1
+			return True, self.fields(field_type)
+
+	def fields(self, field_type = None):
+		"""
+		All known fields, or those of field_type, in listing order
+		"""
+		with self.lock:
+			return [field for field in self.all if field_type is None or field.get("type") == field_type]
+
+	def slugs(self, field_type, names):
+		"""
+		Map names to slugs for the fields that are known, regardless of freshness
+		"""
+		with self.lock:
+			out = dict()
+			for name in names:
+				field = self.by_name.get((field_type, name))
+				if field:
+					out[name] = field.get("slug")
+			return out
+
+	def put(self, field):
+		"""
+		Add a newly created field. Before the first fill there is nothing to add to
+		"""
+		if not field or self.filled_at is None:
+			return
+		with self.lock:
+			self._add(field, replace = True)
+
+	def invalidate(self):
+		with self.lock:
+			self.all = list()
+			self.by_name = dict()
+			self.by_slug = dict()
+			self.filled_at = None
+
+	def _add(self, field, replace = False):
+		self.all.append(field)
+		field_type = field.get("type")
+		name = field.get("name")
+		slug = field.get("slug")
+		if name is not None and (replace or (field_type, name) not in self.by_name):
+			self.by_name[(field_type, name)] = field
+		if slug:
+			self.by_slug[(field_type, slug)] = field
+
+
+# Default number of analyzed HTML cells kept by the helpers
+default_html_cache_size = 4096
+
+
+class LRUCache:
+	"""
+	Thread safe least recently used cache with hit, miss and eviction counters.
+	A maxsize of 0 disables it
+	"""
+	def __init__(self, maxsize = default_html_cache_size):
+		self.maxsize = maxsize
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		"""
+		Returns (found, value)
+		"""
+		with self.lock:
+			try:
+				value = self.entries[key]
+			except KeyError:
+				self.misses += 1
+				return False, None
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return True, value
+
+	def put(self, key, value):
+		if not self.maxsize:
+			return
+		with self.lock:
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last = False)
+				self.evictions += 1
+
+	def resize(self, maxsize):
+		with self.lock:
+			self.maxsize = maxsize
+			while len(self.entries) > max(0, maxsize or 0):
+				self.entries.popitem(last = False)
+				self.evictions += 1
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def reset_stats(self):
+		with self.lock:
+			self.hits = 0
+			self.misses = 0
+			self.evictions = 0
+
+	def stats(self):
+		with self.lock:
+			lookups = self.hits + self.misses
+			return {
+				  "size": len(self.entries)
+				, "maxsize": self.maxsize
+				, "hits": self.hits
+				, "misses": self.misses
+				, "evictions": self.evictions
+				, "hit_ratio": self.hits / lookups if lookups else None
+			}
@@ -0,0 +1,935 @@
+import concurrent.futures
+import contextlib
+import json
+import logging
+import threading
+import requests
+from .helpers import *
+from .log import pretty
+from .cache import *
+from .retry import *
+from .transport import *
+from .tracing import *
+from .token_cache import *
+from .spans import *
+
+logger = logging.getLogger(__name__)
+
+
+#######################################################################
+
+
+class Client:
+	session = None
+	base_url = None
+	client_id = None
+	client_secret = None
+	account_id = None
+	active_account_id = None
+	auth_url = None
+	api_url = None
+	token_url = None
+	ticket_url = None
+	page_workers = default_page_workers
+	audit_index = None
+	audit_goal_index = None
+	custom_field_registry = None
+	metrics = None
+	span_collector = None
+	error = None
+	
+	def set_status(self, error=None):
+		self.error = error
+
+	def is_ok(self):
+		return not self.error
+
+	def __init__(self, base_url:str, client_id:str, client_secret:str, account_id:str, client_token:str = None, do_debug = False, page_workers:int = default_page_workers, title_cache_ttl:float = default_title_cache_ttl, pool_connections:int = default_pool_connections, pool_maxsize:int = default_pool_maxsize, pool_block:bool = False, keep_alive:bool = True, retry_policy:RetryPolicy = default_retry_policy, retry_budget:RetryBudget = None, token_cache = None, metrics = True, span_collector:SpanCollector = None):
+		"""
+		Create an instance of the gap-client. Requirest that you provide essentials such as api URL and credentials
+		The optional do_Debug parameter allows you to swithc on debug logging
+		The optional page_workers parameter sets how many pages of a listing are fetched at the same time (1 fetches them one by one)
+		The optional title_cache_ttl parameter sets how many seconds lookups by title and of custom fields are answered from the client's indexes before listing again (0 disables the indexes)
+		The optional pool_* and keep_alive parameters tune the HTTP connection pool, see transport.make_session. When sharing a client between threads, pool_maxsize should be at least the number of threads
+		The optional retry_policy parameter decides which failed calls are retried (None disables retries) and retry_budget limits how many retries this client may do overall, see retry.RetryPolicy and retry.RetryBudget
+		The optional token_cache parameter shares OAuth2 tokens between clients and processes through a file cache. Pass True for the default location, a directory path or a token_cache.FileTokenCache
+		The optional metrics parameter counts requests, latencies, bytes, retries, pages and cache hits per endpoint, see metrics_snapshot. Pass a metrics.MetricsRegistry to share one between clients or False to turn it off
+		The optional span_collector parameter times every call in nested spans (token, connect, http, json_decode, cleaning), see spans.SpanCollector
+		"""
+		self.base_url = base_url
+		self.client_id = client_id
+		self.client_secret = client_secret
+		self.account_id = account_id
+		self.auth_url = f"{self.base_url}/auth"
+		self.api_url = f"{self.base_url}/api-v1"
+		self.token_url = f"{self.auth_url}/token"
+		self.ticket_url = f"{self.api_url}/tickets"
+		self.page_workers = page_workers
+		self.active_account_id = None
+		self.account_lock = threading.Lock()
+		self.audit_index = TitleIndex(ttl = title_cache_ttl)
+		self.audit_goal_index = TitleIndex(ttl = title_cache_ttl)
+		self.custom_field_registry = CustomFieldRegistry(ttl = title_cache_ttl)
+		self.write_counter = WriteCounter()
+		self.span_collector = span_collector
+		self.metrics = make_metrics(metrics)
+		if self.metrics:
+			self.metrics.add_cache("audit_titles", self.audit_index.stats)
+			self.metrics.add_cache("audit_goal_titles", self.audit_goal_index.stats)
+			self.metrics.add_cache("custom_fields", self.custom_field_registry.stats)
+			self.metrics.add_cache("html", html_cache.stats)
+		self.error = None
+		if not self.base_url:
+			self.set_status("No base_url specified")
+		if not self.account_id:
+			self.set_status("No account_id specified")
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		self.session = make_session(pool_connections = pool_connections, pool_maxsize = pool_maxsize, pool_block = pool_block, keep_alive = keep_alive, retry_policy = retry_policy, retry_budget = retry_budget or RetryBudget(), metrics = self.metrics)
+		if client_token:
+			if do_debug:
+				logger.info(f"Using token '{client_token}'")
+			self.session.headers["Accept"] = "application/json"
+			self.session.headers["Authorization"] = f"Bearer {client_token}"
+		else:
+			if do_debug:
+				logger.info("Using oauth")
+			if not self.client_id:
+				self.set_status("No client_id specified")
+			if not self.client_secret:
+				self.set_status("No client_secret specified")
+			from .oauth import make_oauth_auth
+			self.oauth2client, self.auth = make_oauth_auth(token_url=self.token_url, client_id=self.client_id, client_secret=self.client_secret, resource=self.base_url, scope="all", token_cache=token_cache)
+			self.session.auth = self.auth
+		# The account is changed by the first request that needs it, see ensure_account
+
+	def pool_stats(self):
+		"""
+		Connection pool statistics, see transport.pool_stats
+		"""
+		return pool_stats(self.session)
+
+	def tracing(self, tracer:WireTracer = None, **kwargs):
+		"""
+		Context manager that captures the wire data of the calls this client makes in its block, see tracing.WireTracer.
+		Calls that other threads make on the client meanwhile are not captured.
+		Use as "with client.tracing(path='trace.jsonl') as tracer:" and read tracer.exchanges(). Tracing is off by default
+		"""
+		return tracing(self.session, tracer, **kwargs)
+
+	def profile(self, mode = "cprofile"):
+		"""
+		Context manager that profiles the calls in its block with cProfile or tracemalloc, see spans.capture.
+		Use as "with client.profile() as capture:" around a single call and print capture.report()
+		"""
+		return capture(mode)
+
+	def metrics_snapshot(self):
+		"""
+		Per endpoint request counts, statuses, latency histograms, bytes, retries and pages per listing, and the cache hit
+		counters, as a dict. See metrics.MetricsRegistry
+		"""
+		if not self.metrics:
+			return None
+		return self.metrics.snapshot()
+
+	def metrics_text(self):
+		"""
+		The metrics in the Prometheus text exposition format, for a /metrics handler
+		"""
+		if not self.metrics:
+			return None
+		return self.metrics.prometheus_text()
+
+	def write_stats(self):
+		"""
+		How many upserts created, patched or skipped a record because it was unchanged, see helpers.WriteCounter
+		"""
+		return self.write_counter.snapshot()
+
+	def hello_gap(self):
+		"""
+		Simple check to see that client is installed and runs
+		"""
+		logger.info("Welcome to gap client! It seems to run! 🎉🎉🎉")
+
+	@traced()
+	def get_memberships(self):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		result = None
+		err = None
+		try:
+			url = f"{self.api_url}/account/get-memberships"
+			logger.debug("Using get memberships URL:%s", url)
+			res = self.session.get(url)
+			res.raise_for_status()
+			raw_result = decode_json(res)
+			result = list()
+			for item in raw_result:
+				clean, err = clean_membership(item)
+				if clean:
+					result.append(clean)
+				else:
+					raise Exception(err)
+		except requests.exceptions.RequestException as e: 
+			err = str(e)
+		return result, err
+
+	def ensure_account(self):
+		"""
+		Make sure the server session is on our account before a request that depends on it.
+		Returns the error of the account change, if any
+		"""
+		if self.active_account_id == self.account_id:
+			return None
+		with self.account_lock:
+			if self.active_account_id == self.account_id:
+				return None
+			ok, err = self.change_account()
+			return err
+
+	@traced()
+	def change_account(self, account_id = None):
+		"""
+		Switch the server session to account_id (or to the client's account). Switching to the active account is a no-op
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		if (account_id or self.account_id) == self.active_account_id:
+			return True, None
+		if account_id and account_id != self.account_id:
+			# The indexes belong to the previous account
+			self.audit_index.invalidate()
+			self.audit_goal_index.invalidate()
+			self.custom_field_registry.invalidate()
+		self.account_id = account_id or self.account_id
+		result = None
+		err = None
+		try:
+			url = f"{self.api_url}/account/change-account/{self.account_id}"
+			query_body = {
+				"account_id": self.account_id
+			}
+			logger.debug("Using change account url:%s", url)
+			res = self.session.post(url, params = query_body)
+			res.raise_for_status()
+			self.active_account_id = self.account_id
+		except requests.exceptions.RequestException as e: 
+			err = str(e)
+		return True, err
+
+	@traced()
+	def delete_audit(self, id, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		err = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audits/{id}"
+			res = self.session.delete(url)
+			res.raise_for_status()
+			self.audit_index.discard(id)
+			result = True
+		except requests.exceptions.RequestException as e:
+			err = str(e)
+			if do_debug:
+				logger.warning(f"delete_audit: {err}")
+		return result, err
+
+	@traced()
+	def get_audits(self, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result, err = generic_get(session=self.session, url=f"{self.api_url}/{self.account_id}/audits", name="audits", max_workers=self.page_workers, do_debug = do_debug)
+		if not err:
+			self.audit_index.fill(result)
+		return result, err
+	
+	def iter_audits(self, do_debug = False):
+		"""
+		Yield (audit, err) for each audit as its page arrives, while the next page is prefetched in the background
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			yield None, self.error
+			return
+		err = self.ensure_account()
+		if err:
+			yield None, err
+			return
+		yield from generic_iter(session=self.session, url=f"{self.api_url}/{self.account_id}/audits", name="audits", do_debug = do_debug)
+	
+	def old_get_audits(self, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		result = None
+		err = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audits"
+			# GET parameter that also fetches all audit_goals
+			relation = "audit_goals"
+			if do_debug:
+				logger.info(f"Using get audits  url:{url}")
+			done = False
+			result = list()
+			while not done:
+				if do_debug:
+					logger.info(f" + {url} ({len(result)})")
+				res = self.session.get(url)
+				res.raise_for_status()
+				raw_result = decode_json(res)
+				#logger.info(f"raw_result:{pprint.pformat(raw_result)}")
+				for item in raw_result.get("data"):
+					if item:
+						result.append(item)
+					else:
+						logger.warning("Skipping item")
+				next_page_url = raw_result.get("next_page_url")
+				if not next_page_url:
+					done = True
+				else:
+					url = next_page_url
+			if do_debug:
+				logger.info("result:%s", pretty(result))
+		except requests.exceptions.RequestException as e: 
+			err = f"EXCEPTION: {e}, BODY:{res.text}"
+		return result, err
+
+
+	@traced()
+	def create_audit_goal(self, raw_body, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		raw_result, err = self.post_audit_goal(raw_body, do_debug = do_debug)
+		if not raw_result:
+			return None, err
+		result, err = timed(clean_audit_goal_in)(raw_result)
+		if do_debug:
+			logger.info("create_audit_goal return result=%s", pretty(result))
+		return result, err
+
+
+	def post_audit_goal(self, raw_body, do_debug = False):
+		"""
+		Create the audit goal and return the raw record the server sent back, as listings and patches return it
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		err = None
+		try:
+			audit_goal, err = timed(clean_audit_goal_out)(raw_body, do_debug=do_debug)
+			if not audit_goal:
+				return None, f"No audit goal, {err}"
+			url = f"{self.api_url}/{self.account_id}/audit-goals"
+			if do_debug:
+				logger.info(f"Using create audit goal url:{url}")
+				logger.info("Using create audit goal body:%s", pretty(audit_goal))
+				logger.info(f"Using create audit goal json:{json.dumps(audit_goal)}")
+			res = self.session.post(url, json = audit_goal)
+			res.raise_for_status()
+			result = decode_json(res)
+			self.audit_goal_index.put(result)
+			if do_debug:
+				logger.info("create_audit_goal return raw_result=%s", pretty(result))
+		except requests.exceptions.RequestException as e: 
+			err = request_error_text(e)
+		return result, err
+
+
+	@traced()
+	def patch_audit_goal(self, id, raw_audit_goal=dict(), do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		err = None
+		# Accepts custom fields
+		try:
+			url = f"{self.api_url}/{self.account_id}/audit-goals/{id}"
+			if do_debug:
+				logger.info(f"Using patch audit goal url:{url}")
+			if do_debug:
+				logger.warning("PATCHING AUDIT GOAL WITH BODY:%s", pretty(raw_audit_goal))
+			res = self.session.put(url, json = raw_audit_goal)
+			if do_debug:
+				logger.warning("PATCHING AUDIT GOAL RES:%s", pretty(res))
+			res.raise_for_status()
+			raw_result = decode_json(res)
+			if do_debug:
+				logger.warning("PATCHING AUDIT GOAL RESPONSE:%s", pretty(raw_result))
+			self.audit_goal_index.replace(id, raw_result)
+			result = raw_result
+		except requests.exceptions.RequestException as e: 
+			err = str(e)
+		return result, err
+
+	@traced()
+	def delete_audit_goal(self, id, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		err = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audit-goals/{id}"
+			res = self.session.delete(url)
+			res.raise_for_status()
+			self.audit_goal_index.discard(id)
+			result = decode_json(res)
+		except requests.exceptions.RequestException as e: 
+			err = str(e)
+		return result, err
+
+	@traced()
+	def get_audit_goal(self, id, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		err = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/audit-goals/{id}"
+			###
+			logger.debug("Using get audit goal url:%s", url)
+			result = list()
+			res = self.session.get(url)
+			res.raise_for_status()
+			raw_result = decode_json(res)
+			logger.debug("raw_result:%s", pretty(raw_result))
+			for item in raw_result.get("data"):
+				clean, err = timed(clean_audit_goal_in)(item)
+				if clean:
+					result.append(clean)
+				else:
+					raise Exception(err)
+			logger.debug("result:%s", pretty(result))
+		except requests.exceptions.RequestException as e: 
+			err = str(e)
+		return result, err
+
+
+	@traced()
+	def get_audit_by_title(self, title, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fresh, audit = self.audit_index.get(title)
+		if fresh:
+			return audit, None
+		if self.audit_index.is_enabled():
+			# One listing fills the index for the lookups that follow
+			audits, err = self.get_audits(do_debug = do_debug)
+			if err:
+				return None, err
+			return self.audit_index.find(title), None
+		# Stop paging as soon as we have a match
+		with contextlib.closing(self.iter_audits(do_debug = do_debug)) as audits:
+			for audit, err in audits:
+				if err:
+					return None, err
+				if audit.get("title") == title:
+					return audit, None
+		return None, None
+
+
+	@traced()
+	def get_audit_goals(self, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result, err = generic_get(session=self.session, url=f"{self.api_url}/{self.account_id}/audit-goals", name="audit-goals", max_workers=self.page_workers, do_debug = do_debug)
+		if not err:
+			self.audit_goal_index.fill(result)
+		return result, err
+
+
+	def iter_audit_goals(self, do_debug = False):
+		"""
+		Yield (audit_goal, err) for each audit goal as its page arrives, while the next page is prefetched in the background
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			yield None, self.error
+			return
+		err = self.ensure_account()
+		if err:
+			yield None, err
+			return
+		yield from generic_iter(session=self.session, url=f"{self.api_url}/{self.account_id}/audit-goals", name="audit-goals", do_debug = do_debug)
+
+
+	@traced()
+	def find_audit_goal_by_title(self, title, do_debug = False):
+		"""
+		Look up the raw audit goal record (including its id) by title, from the index when it is fresh
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fresh, goal = self.audit_goal_index.get(title)
+		if fresh:
+			return goal, None
+		if self.audit_goal_index.is_enabled():
+			# One listing fills the index for the lookups that follow
+			goals, err = self.get_audit_goals(do_debug = do_debug)
+			if err:
+				return None, err
+			return self.audit_goal_index.find(title), None
+		# Stop paging as soon as we have a match
+		with contextlib.closing(self.iter_audit_goals(do_debug = do_debug)) as goals:
+			for goal, err in goals:
+				if err:
+					return None, err
+				if goal.get("title") == title:
+					return goal, None
+		return None, None
+
+
+	def get_audit_goal_by_title(self, title, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		goal, err = self.find_audit_goal_by_title(title, do_debug = do_debug)
+		if not goal:
+			return None, err
+		return timed(clean_audit_goal_in)(goal)
+
+
+	def patch_audit_goal_if_changed(self, audit_goal, raw_body, skip_unchanged = True, do_debug = False):
+		"""
+		Patch an existing audit goal record with raw_body, unless no field would change. Then the record is returned without a call
+		"""
+		out = audit_goal_patch_body(audit_goal, raw_body)
+		if skip_unchanged and not changed_fields(out, audit_goal):
+			if do_debug:
+				logger.info(f"upsert audit goal : '{audit_goal.get('title')}' unchanged, not patching")
+			self.write_counter.add("unchanged")
+			return audit_goal, None
+		if do_debug:
+			logger.info("upsert audit goal : existed:\n%s\npatching with:\n%s\n", pretty(audit_goal), pretty(out))
+		result, err = self.patch_audit_goal(audit_goal.get("id"), out, do_debug = do_debug)
+		if not err:
+			self.write_counter.add("patched")
+		return result, err
+
+
+	def create_counted_audit_goal(self, raw_body, do_debug = False):
+		result, err = self.post_audit_goal(raw_body, do_debug = do_debug)
+		if not err:
+			self.write_counter.add("created")
+		return result, err
+
+
+	@traced()
+	def upsert_audit_goal_by_title(self, raw_body, skip_unchanged = True, do_debug = False):
+		"""
+		Create the audit goal, or patch the one with the same title. With skip_unchanged no call is made when the existing goal already has these values.
+		The result is the raw audit goal record in all three cases
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		if not raw_body:
+			return None, "No body specified"
+		title = raw_body.get("title")
+		if not title:
+			return None, "No title in specified in body"
+		audit_goal, err = self.find_audit_goal_by_title(title, do_debug = do_debug)
+		if not audit_goal:
+			if do_debug:
+				logger.info("upsert audit goal : no existing, creating")
+			if err:
+				return None, err
+			return self.create_counted_audit_goal(raw_body, do_debug = do_debug)
+		return self.patch_audit_goal_if_changed(audit_goal, raw_body, skip_unchanged = skip_unchanged, do_debug = do_debug)
+
+
+	@traced()
+	def upsert_audit_goals(self, raw_bodies, max_workers = default_write_workers, skip_unchanged = True, do_debug = False):
+		"""
+		Create or patch many audit goals by title, based on a single listing of the existing goals.
+		The writes run on up to max_workers threads. Bodies that share a title are written in order by the same worker,
+		so the first creates the goal and the rest patch it. With skip_unchanged goals that already have the values are not patched.
+		Returns a list with one (result, err) per body in the order of raw_bodies, or None and the error when the listing fails.
+		Results are raw audit goal records, as from upsert_audit_goal_by_title
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		results = [(None, None)] * len(raw_bodies)
+		indices_by_title = dict()
+		for i, raw_body in enumerate(raw_bodies):
+			if not raw_body:
+				results[i] = (None, "No body specified")
+				continue
+			title = raw_body.get("title")
+			if not title:
+				results[i] = (None, "No title in specified in body")
+				continue
+			indices_by_title.setdefault(title, list()).append(i)
+		if not indices_by_title:
+			return results, None
+		if not self.audit_goal_index.is_fresh():
+			goals, err = self.get_audit_goals(do_debug = do_debug)
+			if err:
+				return None, err
+			existing = dict()
+			for goal in goals:
+				existing.setdefault(goal.get("title"), goal)
+		else:
+			existing = {title: self.audit_goal_index.find(title) for title in indices_by_title}
+		creates = sum(1 for title in indices_by_title if not existing.get(title))
+		logger.info(f"upsert_audit_goals: {len(indices_by_title)} titles, {creates} to create and {len(indices_by_title) - creates} to patch with {max_workers} workers")
+		def write_title(title):
+			audit_goal = existing.get(title)
+			for i in indices_by_title[title]:
+				raw_body = raw_bodies[i]
+				if audit_goal:
+					results[i] = self.patch_audit_goal_if_changed(audit_goal, raw_body, skip_unchanged = skip_unchanged, do_debug = do_debug)
+				else:
+					results[i] = self.create_counted_audit_goal(raw_body, do_debug = do_debug)
+				result = results[i][0]
+				# Later bodies with this title compare against and patch the latest record
+				if isinstance(result, dict) and result.get("id"):
+					audit_goal = result
+		with concurrent.futures.ThreadPoolExecutor(max_workers = max(1, max_workers)) as executor:
+			for future in [executor.submit(run_in_context(write_title), title) for title in indices_by_title]:
+				future.result()
+		return results, None
+
+
+	@traced()
+	def create_audit(self, raw_body, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		err = None
+		try:
+			audit, err = clean_audit_out(raw_body)
+			if not audit:
+				raise Exception(f"No audit goal, {err}")
+			url = f"{self.api_url}/{self.account_id}/audits"
+			logger.debug("create_audit url:%s", url)
+			if do_debug:
+				logger.warning("create_audit body:%s", pretty(audit))
+			res = self.session.post(url, json = audit)
+			if do_debug:
+				logger.warning("create_audit res:%s", pretty(res))
+			res.raise_for_status()
+			raw_result = decode_json(res)
+			if do_debug:
+				logger.warning("create_audit result:%s", pretty(raw_result))
+			self.audit_index.put(raw_result)
+			result = raw_result
+		except requests.exceptions.RequestException as e: 
+			result = None
+			err = str(e) + res.text
+			if do_debug:
+				logger.warning("create_audit error:%s", pretty(err))
+		return result, err
+
+
+	@traced()
+	def patch_audit(self, id, raw_body = dict(), do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		err = None
+		# Accepts custom fields
+		try:
+			url = f"{self.api_url}/{self.account_id}/audits/{id}"
+			if do_debug:
+				logger.info(f"patch_audit url:{url}")
+			if do_debug:
+				logger.warning("patch_audit raw body: %s", pretty(raw_body))
+			audit, clean_err = clean_audit_out(raw_body)
+			if do_debug:
+				logger.warning("patch_audit cleaned body: %s", pretty(audit))
+			if not audit:
+				return None, "Could not clean audit: " + clean_err
+			res = self.session.patch(url, json = audit)
+			if do_debug:
+				logger.warning("patch_audit res: %s", pretty(res))
+			res.raise_for_status()
+			raw_result = decode_json(res)
+			if do_debug:
+				logger.warning("patch_audit result: %s", pretty(raw_result))
+			self.audit_index.replace(id, raw_result)
+
+			result = raw_result
+		except requests.exceptions.RequestException as e: 
+			err = str(e)
+			if do_debug:
+				logger.warning(f"patch_audit err: {err}")
+		return result, err
+
+
+	@traced()
+	def upsert_audit(self, raw_body, skip_unchanged = True, do_debug = False):
+		"""
+		Create the audit, or patch the one with the same title. With skip_unchanged no call is made when the existing audit already has these values
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		if not raw_body:
+			return None, "No body specified"
+		title = raw_body.get("title")
+		if not title:
+			return None, "No title in specified in body"
+		audit, err = self.get_audit_by_title(title)
+		if not audit:
+			if do_debug:
+				logger.info("upsert audit: no existing, creating")
+			if err:
+				return None, err
+			result, err = self.create_audit(raw_body, do_debug = do_debug)
+			if not err:
+				self.write_counter.add("created")
+			return result, err
+		id = audit.get("id")
+		body, clean_err = clean_audit_out(raw_body)
+		if skip_unchanged and body and not changed_fields(body, audit):
+			if do_debug:
+				logger.info(f"upsert_audit: {id} unchanged, not patching")
+			self.write_counter.add("unchanged")
+			return audit, None
+		if do_debug:
+			logger.info(f"upsert_audit patch: {id}")
+		result, err = self.patch_audit(id, raw_body, do_debug = do_debug)
+		if not err:
+			self.write_counter.add("patched")
+		return result, err
+
+
+	@traced()
+	def create_custom_fields(self, field_type, raw_fields, do_debug = False):
+		"""
+		Create custom fields of one type in a single call. Returns the created fields
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result = None
+		err = None
+		try:
+			if field_type not in valid_custom_field_types:
+				raise Exception(f"Invalid field type")
+			fields = list()
+			for raw_field in raw_fields:
+				field, err = timed(clean_custom_field)(raw_field)
+				if not field:
+					raise Exception(f"No field, {err}")
+				fields.append(field)
+			query_body = {
+				  "account_id": self.account_id
+				, "type": field_type
+				, "fields" : fields
+			}
+			url = f"{self.api_url}/{self.account_id}/custom-fields"
+			if do_debug:
+				logger.info(f"create_custom_fields query body:{json.dumps(query_body, indent=3)}")
+				logger.info(f"create_custom_fields url:{url}")
+			res = self.session.post(url, json = query_body)
+			res.raise_for_status()
+			raw_result = decode_json(res)
+			if do_debug:
+				logger.info("create_custom_fields result: %s", pretty(raw_result))
+			result = list()
+			for custom_field in raw_result.get("fields"):
+				clean, clean_err = timed(clean_custom_field)(custom_field)
+				if clean:
+					clean["type"] = field_type
+					result.append(clean)
+					self.custom_field_registry.put(clean)
+		except requests.exceptions.RequestException as e:
+			err = request_error_text(e)
+			if do_debug:
+				logger.warning(f"create_custom_fields RequestException: {err}")
+		except Exception as e: 
+			err = str(e)
+			if do_debug:
+				logger.warning(f"create_custom_fields Exception: {err}")
+		return result, err
+
+
+	def create_custom_field(self, field_type, raw_field, do_debug = False):
+		return self.create_custom_fields(field_type, [raw_field], do_debug = do_debug)
+
+
+	# This is really complex because output from server is in a contorted format that needs to be normalized to be useful
+	@traced()
+	def get_custom_fields(self, do_debug = False):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		err = self.ensure_account()
+		if err:
+			return None, err
+		result, err = generic_get(session=self.session, url=f"{self.api_url}/{self.account_id}/custom-fields", name="custom-fields", sub="fields", clean_fun=clean_custom_field, inherit=["account_id", "type", "created_at", "updated_at"], max_workers=self.page_workers, do_debug = do_debug)
+		if not err:
+			self.custom_field_registry.fill(result)
+		return result, err
+
+
+	@traced()
+	def known_custom_fields(self, field_type = None, do_debug = False):
+		"""
+		The custom fields (of field_type) from the client's registry, listing them only when the registry is not fresh
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fresh, fields = self.custom_field_registry.get_fields(field_type)
+		if fresh:
+			return fields, None
+		fields, err = self.get_custom_fields(do_debug = do_debug)
+		if err:
+			return None, err
+		if not self.custom_field_registry.is_enabled():
+			return [field for field in fields if field_type is None or field.get("type") == field_type], None
+		return self.custom_field_registry.fields(field_type), None
+
+
+	@traced()
+	def find_custom_field(self, field_type, name = None, slug = None, do_debug = False):
+		"""
+		Look up a custom field of field_type by slug, or by name when no slug is given. Returns (None, None) when there is none
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fresh, field = self.custom_field_registry.get(field_type, name = name, slug = slug)
+		if fresh:
+			return field, None
+		fields, err = self.known_custom_fields(field_type, do_debug = do_debug)
+		if err:
+			return None, err
+		for field in fields:
+			if (slug and field.get("slug") == slug) or (not slug and field.get("name") == name):
+				return field, None
+		return None, None
+
+
+	@traced()
+	def custom_field_slugs(self, field_type, names, do_debug = False):
+		"""
+		Resolve column names to the slugs of the existing custom fields of field_type. Names without a field are left out
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		fields, err = self.known_custom_fields(field_type, do_debug = do_debug)
+		if err:
+			return None, err
+		slugs = dict()
+		for field in fields:
+			if field.get("name") in names:
+				slugs.setdefault(field.get("name"), field.get("slug"))
+		return slugs, None
+
+
+	def iter_custom_fields(self, do_debug = False):
+		"""
+		Yield (custom_field, err) for each custom field as its page arrives, while the next page is prefetched in the background
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			yield None, self.error
+			return
+		err = self.ensure_account()
+		if err:
+			yield None, err
+			return
+		yield from generic_iter(session=self.session, url=f"{self.api_url}/{self.account_id}/custom-fields", name="custom-fields", sub="fields", clean_fun=clean_custom_field, inherit=["account_id", "type", "created_at", "updated_at"], do_debug = do_debug)
+
+
+	def old_get_custom_fields(self, do_debug = True):
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		result = None
+		err = None
+		try:
+			url = f"{self.api_url}/{self.account_id}/custom-fields"
+			res = self.session.get(url)
+			if do_debug:
+				logger.info("get_custom_fields res: %s", pretty(res))
+			res.raise_for_status()
+		except requests.exceptions.RequestException as re: 
+			err = str(re) + res.text
+		except Exception as e: 
+			err = str(e)
+		return result, err
+
+
+	@traced()
+	def upsert_custom_fields(self, field_type, raw_fields = list(), do_debug = False):
+		"""
+		Make sure the custom fields exist: one listing of the existing fields (none while the registry is fresh), then a
+		single call that creates all that are missing (matched by slug when given, else by name). Returns the existing or
+		created field for each raw field
+		"""
+		if self.error:
+			logger.error(f"Error: {self.error}")
+			return
+		existing, err = self.known_custom_fields(field_type, do_debug = do_debug)
+		if err:
+			return None, err
+		found, missing, err = custom_field_diff(existing, field_type, raw_fields)
+		if err:
+			return None, err
+		created_by_name = dict()
+		if missing:
+			logger.info(f"upsert_custom_fields: creating {len(missing)} of {len(raw_fields)} '{field_type}' fields")
+			created, err = self.create_custom_fields(field_type, missing, do_debug = do_debug)
+			if err:
+				return None, err
+			created_by_name = {field.get("name"): field for field in created}
+		result = list()
+		for raw_field, field in zip(raw_fields, found):
+			result.append(field or created_by_name.get(raw_field.get("name")))
+		return result, None
+
@@ -1,14 +1,78 @@
+from enum import Enum, EnumMeta
+import concurrent.futures
+import functools
+import hashlib
 import random
 import logging
-import bs4
+import math
+import re
+import threading
+import urllib.parse
+
+from .cache import LRUCache, default_html_cache_size
+from .log import pretty
+from .metrics import endpoint_name
+from .spans import current_collector, run_in_context, span, timed
 
 logger = logging.getLogger(__name__)
 
 
+#######################################################################
+
+
+class MetaEnum(EnumMeta):
+	def __contains__(cls, item):
+		try:
+			cls(item)
+		except ValueError:
+			return False
+		return True    
+
+class BaseEnum(Enum, metaclass=MetaEnum):
+	def __str__(self):
+		return str(self.value)
+
+
+class Status(str, BaseEnum):
+	not_started = "not_started"
+	in_progress = "in_progress"
+	completed = "completed"
+
+
+class Icon(str, BaseEnum):
+	people = "people"
+	book = "book"
+	bank = "bank"
+	warning = "warning"
+	hashtag = "hashtag"
+	
+	
+# Ugly hardcoded stuff
+default_status_options = '[{"name":"not_started","color":"secondary"},{"name":"in_progress","color":"warning"},{"name":"completed","color":"success"}]'
+
+valid_custom_field_types = [
+	  "data_recepients"
+	, "data_responsible"
+	, "event_logs"
+	, "it_system"
+	, "project_audit_goals"
+	, "work_processes"
+]
+
+
+#######################################################################
+
+
 
 
 # Wrapper for HTML parser "beautiful soup" to alert if parsing engine is missing
-def parse_soup(html, bs_parser = 'html5lib'):
+# BeautifulSoup parser used for cell contents. 'html.parser' is built in and much faster, 'lxml' is faster still when installed
+default_bs_parser = 'html5lib'
+
+
+def parse_soup(html, bs_parser = default_bs_parser):
+	# bs4 is only imported when the first cell with markup is parsed
+	import bs4
 	try:
 		soup = bs4.BeautifulSoup(html, bs_parser)
 		return soup, None
@@ -18,36 +82,69 @@ def parse_soup(html, bs_parser = 'html5lib'):
 		return None, err
 
 
-# Check
-def has_visible_content(html):
+def is_plain_text(text):
+	"""
+	True when the text holds neither markup nor character references, so parsing it would not change it
+	"""
+	return "<" not in text and "&" not in text
+
+
+# Results of analyze_html by content hash, as spreadsheets repeat the same cells a lot.
+# Resize with html_cache.resize(n), 0 turns it off, and see html_cache.stats() for hits and misses
+html_cache = LRUCache(maxsize = default_html_cache_size)
+
+
+def html_cache_key(html, bs_parser):
+	return hashlib.blake2b(html.encode("utf-8"), digest_size = 16).digest(), bs_parser
+
+
+def analyze_html(html, bs_parser = default_bs_parser, use_cache = True):
+	"""
+	Find the links and whether there is visible text in a cell, parsing it at most once.
+	Returns (links, visible) where links maps link text to href. Plain text is not parsed at all,
+	and markup that was analyzed before is taken from html_cache
+	"""
 	if not html:
-		return False
-	soup, soup_err = parse_soup(html)
-	if soup:
-		# Remove script and style elements
-		for script_or_style in soup(["script", "style"]):
-			script_or_style.extract()
-		# Get text and remove any whitespace characters
-		text = soup.get_text()
-		text = re.sub(r'\s+', ' ', text).strip()
-		# Return True if there is visible text
-		return bool(text)
-	else:
-		return False
-
-def extract_links(data):
-	if not data:
-		return dict()
-	out = dict()
-	soup, soup_err = parse_soup(data)
-	if soup:
-		links = soup.find_all('a')
-		for link in links:
-			h = link.get('href')
-			t = link.text
-			if h and t:
-				out[t] = h
-	return out
+		return dict(), False
+	if is_plain_text(html):
+		return dict(), bool(html.strip())
+	key = None
+	if use_cache and html_cache.maxsize:
+		key = html_cache_key(html, bs_parser)
+		found, cached = html_cache.get(key)
+		if found:
+			links, visible = cached
+			return dict(links), visible
+	soup, soup_err = parse_soup(html, bs_parser = bs_parser)
+	if not soup:
+		return dict(), False
+	links = dict()
+	for link in soup.find_all('a'):
+		h = link.get('href')
+		t = link.text
+		if h and t:
+			links[t] = h
+	# Remove script and style elements
+	for script_or_style in soup(["script", "style"]):
+		script_or_style.extract()
+	# Get text and remove any whitespace characters
+	text = soup.get_text()
+	text = re.sub(r'\s+', ' ', text).strip()
+	# Visible if there is any text left
+	visible = bool(text)
+	if key:
+		html_cache.put(key, (dict(links), visible))
+	return links, visible
+
+
+# Check
+def has_visible_content(html, bs_parser = default_bs_parser):
+	links, visible = analyze_html(html, bs_parser = bs_parser)
+	return visible
+
+def extract_links(data, bs_parser = default_bs_parser):
+	links, visible = analyze_html(data, bs_parser = bs_parser)
+	return links
 
 def clean_mapped(indata, do_debug = False):
 	out = dict()
@@ -57,89 +154,12 @@ def clean_mapped(indata, do_debug = False):
 			continue
 		ks = k and k.strip().strip(fmt)
 		if "" == ks:
-			logger.info(f"Skipping empty key")
+			logger.debug("Skipping empty key")
 		vs = v and v.strip().strip(fmt)
 		if do_debug:
 			logger.info(f"Stripping '{k}:{v}' => '{ks}:{vs}'")
 		out[ks] = vs
 	return out
-	
-def map_audit_goal(indata, do_debug = False):
-	map = {
-		  "Comments": "description"
-		, "Title": "title"
-		, "Clause": "clause"
-		, "Explanation": "guide"
-		, "Implemented": {
-			  "_name": "status"
-			, "_default": str(Status.not_started)
-			, "Completely": str(Status.completed)
-			, "Partially": str(Status.in_progress)
-			, "": str(Status.not_started)
-		}
-		, "Control Objectives": "documentation"
-		#, "Control Description": "control_description"
-		#, "Control Owner": "control_owner"
-		#, "Applicable": "applicable"
-	}
-	# What can be directly mapped?
-	outdata = dict()
-	custom_fields = dict(indata)
-	not_found = "sdgfsdfsdfsdfdfgcfgjhfghkhjsdlfkgjsldkfjglksdjfglksdjfghlksdjgfhklsdgjmhlksdjfh"
-	indata = clean_mapped(indata, do_debug=True)
-	
-	
-	for inkey, out in indata.items():
-		inval = indata.get(inkey, not_found)
-		out = map.get(inkey, not_found)
-		if out != not_found:
-			if isinstance(out, str):
-				if inval != not_found:
-					if do_debug:
-						logger.info(f"Mapped string match for key: '{inkey}' => '{out}'")
-						
-						
-						
-					links = extract_links(inval)
-					if links:
-						for name, link in links.items():
-							inval = f'<a href="{link}">{name}</a>'
-					else:
-						if not has_visible_content(inval):
-							inval=""
-
-					outdata[out] = inval
-					del custom_fields[inkey]
-					continue
-				else:
-					if do_debug:
-						logger.info(f"Matched string key failed: '{inkey}' => '{out}'")
-					continue
-			elif isinstance(out, dict):
-				outkey = out.get("_name", not_found)
-				outdef = out.get("_default", not_found)
-				outval = out.get(inval, not_found)
-				if outval != not_found:
-					#logger.info(f"Mapped dict match for key: '{inkey}' => '{outkey}' outval='{outval}'")
-					if do_debug:
-						logger.info(f"Mapped dict match: inval='{inval}' inkey='{inkey}' outval='{outval}' outkey='{outkey}'")
-					outdata[outkey] = outdef == not_found and "" or outdef
-					del custom_fields[inkey]
-					continue
-				else:
-					if do_debug:
-						logger.info(f"Matched dict key failed: inval='{inval}' inkey='{inkey}' outval='{outval}' outkey='{outkey}'")
-					outdata[inkey] = ""
-					del custom_fields[inkey]
-					continue
-			else:
-				if do_debug:
-					logger.info(f"Map is not string {pprint.pformat(outkey)} ({inkey})")
-				continue
-		if do_debug:
-			logger.info(f"No match for {inkey}")
-	logger.info(f"map_audit_goal outdata: {pprint.pformat(outdata)}")
-	return outdata, custom_fields.keys()
 
 
 def clean_membership(data):
@@ -151,7 +171,7 @@ def clean_audit_out(raw_audit, do_debug = False):
 	if not raw_audit:
 		return None, "No raw_audit"
 	if do_debug:
-		logger.info("RAW:"+pprint.pformat(raw_audit))
+		logger.info("RAW:%s", pretty(raw_audit))
 	title = raw_audit.get("title")
 	if not title:
 		return None, "No title for raw_audit"
@@ -167,7 +187,7 @@ def clean_audit_out(raw_audit, do_debug = False):
 		  , "note": raw_audit.get("note")
 		}
 	if do_debug:
-		logger.info(f"Clean audit goal: {pprint.pformat(audit)}")
+		logger.info("Clean audit goal: %s", pretty(audit))
 	return audit, None
 
 
@@ -177,7 +197,7 @@ def clean_audit_in(raw_audit, do_debug = False):
 	if not raw_audit:
 		return None, "No raw_audit"
 	if do_debug:
-		logger.info("RAW:"+pprint.pformat(raw_audit))
+		logger.info("RAW:%s", pretty(raw_audit))
 	title = raw_audit.get("title")
 	if not title:
 		return None, "No title for raw_audit"
@@ -192,7 +212,7 @@ def clean_audit_in(raw_audit, do_debug = False):
 		  , "note": raw_audit.get("note")
 		}
 	if do_debug:
-		logger.info(f"Clean audit goal: {pprint.pformat(audit)}")
+		logger.info("Clean audit goal: %s", pretty(audit))
 	return audit, None
 
 
@@ -200,7 +220,7 @@ def clean_audit_goal_out(raw_audit_goal, do_debug = False):
 	if not raw_audit_goal:
 		return None, "No raw_audit_goal"
 	if do_debug:
-		logger.info(f"clean_audit_goal_out raw: {pprint.pformat(raw_audit_goal)}")
+		logger.info("clean_audit_goal_out raw: %s", pretty(raw_audit_goal))
 	title = raw_audit_goal.get("title")
 	if not title:
 		return None, "No title for raw_audit_goal"
@@ -216,22 +236,22 @@ def clean_audit_goal_out(raw_audit_goal, do_debug = False):
 		"title": "Title",
 		"parent_id": 0,
 		"status": "not_started",
-		"description": null,
+		"description": None,
 		"settings": {
-			"titleBold": false,
-			"included_in_dashboard": true,
-			"descriptionEnabled": true,
-			"guideEnabled": true,
-			"documentationEnabled": true,
-			"general_report": false,
-			"attachments": true,
-			"elementsEnabled": true,
-			"statusEnabled": true,
-			"tasksEnabled": true,
-			"customFieldsEnabled": true
+			"titleBold": False,
+			"included_in_dashboard": True,
+			"descriptionEnabled": True,
+			"guideEnabled": True,
+			"documentationEnabled": True,
+			"general_report": False,
+			"attachments": True,
+			"elementsEnabled": True,
+			"statusEnabled": True,
+			"tasksEnabled": True,
+			"customFieldsEnabled": True
 		},
-		"guide": null,
-		"documentation": null,
+		"guide": None,
+		"documentation": None,
 		"custom_field": [],
 		"created_at": "2024-01-24T11:07:12.000000Z",
 		"updated_at": "2024-01-24T11:07:21.000000Z",
@@ -260,25 +280,25 @@ def clean_audit_goal_out(raw_audit_goal, do_debug = False):
 		, "documentation": raw_audit_goal.get("documentation", "")
 		, "note": raw_audit_goal.get("note", "")
 		, "settings": {
-			  "titleBold": false
-			, "included_in_dashboard": true
-			, "descriptionEnabled": true
-			, "guideEnabled": true
-			, "documentationEnabled": true
-			, "general_report": false
-			, "attachments": true
-			, "elementsEnabled": true
-			, "statusEnabled": true
-			, "tasksEnabled": true
-			, "customFieldsEnabled": true
+			  "titleBold": False
+			, "included_in_dashboard": True
+			, "descriptionEnabled": True
+			, "guideEnabled": True
+			, "documentationEnabled": True
+			, "general_report": False
+			, "attachments": True
+			, "elementsEnabled": True
+			, "statusEnabled": True
+			, "tasksEnabled": True
+			, "customFieldsEnabled": True
 		},
 		# NOTE: Goal should not have icon
-#		, "icon": raw_audit_goal.get("icon", '{"value": null , "color": null }')
+#		, "icon": raw_audit_goal.get("icon", '{"value": None , "color": None }')
 #		, "custom_field": list()
 #		, "archived": False
 	}
 	if do_debug:
-		logger.info(f"Clean audit goal: {pprint.pformat(audit_goal)}")
+		logger.info("Clean audit goal: %s", pretty(audit_goal))
 	return audit_goal, None
 
 
@@ -287,7 +307,7 @@ def clean_audit_goal_in(raw_audit_goal, do_debug = False):
 	if not raw_audit_goal:
 		return None, "No raw_audit_goal"
 	if do_debug:
-		logger.info(f"clean_audit_goal_in raw: {pprint.pformat(raw_audit_goal)}")
+		logger.info("clean_audit_goal_in raw: %s", pretty(raw_audit_goal))
 	title = raw_audit_goal.get("title")
 	if not title:
 		return None, "No title for raw_audit_goal"
@@ -300,8 +320,8 @@ def clean_audit_goal_in(raw_audit_goal, do_debug = False):
 	#if icon and (icon not in Icon and not isinstance(icon, dict)):
 	#	return None, f"Invalid icon '{icon}' for raw_audit_goal"
 	audit_goal = {
-#		  "id": 0
-		  "title": title
+		  "id": raw_audit_goal.get("id")
+		, "title": title
 		, "description": raw_audit_goal.get("description") # "<p>The best audit goal in years</p>"
 		, "parent_id": raw_audit_goal.get("parent_id", "")
 #		, "status": str(status)
@@ -314,16 +334,85 @@ def clean_audit_goal_in(raw_audit_goal, do_debug = False):
 #		, "archived": False
 	}
 	if do_debug:
-		logger.info(f"Clean audit goal: {pprint.pformat(audit_goal)}")
+		logger.info("Clean audit goal: %s", pretty(audit_goal))
 	return audit_goal, None
 
 
+# Fields of an existing audit goal that an upsert patches
+audit_goal_patch_fields = [ "title"
+		, "description"
+		, "parent_id"
+		, "status"
+		, "guide"
+		, "documentation"
+		, "note"
+		, "icon" ]
+
+
+def audit_goal_patch_body(audit_goal, raw_body):
+	"""
+	Build the body for patching an existing audit goal, taking values from raw_body and falling back to the existing record
+	"""
+	out = dict()
+	for field in audit_goal_patch_fields:
+		out[field] = raw_body.get(field, audit_goal.get(field))
+	return out
+
+
+def normalize_field(value):
+	"""
+	Normalize a field value for comparison: None and "" are the same, strings are stripped and numbers compare as text,
+	so an id of 3 equals "3"
+	"""
+	if value is None:
+		return ""
+	if isinstance(value, bool):
+		return value
+	if isinstance(value, str):
+		return str.strip(value)
+	if isinstance(value, (int, float)):
+		return str(value)
+	if isinstance(value, dict):
+		return {k: normalize_field(v) for k, v in value.items()}
+	if isinstance(value, (list, tuple)):
+		return [normalize_field(v) for v in value]
+	return str(value)
+
+
+def changed_fields(body, record):
+	"""
+	Names of the fields of an outbound body whose normalized value differs from the record fetched from the server
+	"""
+	return [field for field, value in body.items() if normalize_field(value) != normalize_field(record.get(field))]
+
+
+class WriteCounter:
+	"""
+	Counts what upserts did: created, patched, or unchanged when the record already matched and no call was made
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counts = {
+			  "created": 0
+			, "patched": 0
+			, "unchanged": 0
+		}
+
+	def add(self, name, n = 1):
+		with self.lock:
+			self.counts[name] = self.counts.get(name, 0) + n
+
+	def snapshot(self):
+		with self.lock:
+			return dict(self.counts)
+
+
 def clean_custom_field(raw_field, do_debug = False):
 	if not raw_field:
 		return None, "No raw_field"
 	name = raw_field.get("name")
 	if not name:
-		logger.info(f"clean_custom_field: missing name for '{pprint.pformat(raw_field)}'")
+		logger.info("clean_custom_field: missing name for '%s'", pretty(raw_field))
 		return None, "Skipping custom field missing required name"
 	field_type = raw_field.get("type", "text")
 	valid_field_types = [
@@ -347,9 +436,37 @@ def clean_custom_field(raw_field, do_debug = False):
 		, "multiSelectDefault": raw_field.get("multiSelectDefault", list())
 	}
 	if do_debug:
-		logger.info(f"Clean custom field: {pprint.pformat(field)}")
+		logger.info("Clean custom field: %s", pretty(field))
 	return field, None
 
+def custom_field_diff(existing_fields, field_type, raw_fields):
+	"""
+	Match raw_fields against the existing fields of field_type, by slug when the raw field has one and by name otherwise.
+	Returns (found, missing, err): found has the existing field or None for each raw field, missing the clean fields that
+	need to be created, once per name
+	"""
+	by_slug = dict()
+	by_name = dict()
+	for field in existing_fields or list():
+		if field.get("type") != field_type:
+			continue
+		if field.get("slug"):
+			by_slug.setdefault(field.get("slug"), field)
+		by_name.setdefault(field.get("name"), field)
+	found = list()
+	missing = dict()
+	clean_fun = timed(clean_custom_field)
+	for raw_field in raw_fields:
+		field, err = clean_fun(raw_field)
+		if not field:
+			return None, None, err
+		existing = by_slug.get(field.get("slug")) if field.get("slug") else by_name.get(field.get("name"))
+		found.append(existing)
+		if not existing:
+			missing.setdefault(field.get("name"), field)
+	return found, list(missing.values()), None
+
+
 """
 def clean_custom_fields(raw_fields, do_debug = False):
 	valid_field_types = [
@@ -373,52 +490,184 @@ def clean_custom_fields(raw_fields, do_debug = False):
 
 ###########################################################################################
 	
-def generic_get(session, url, name, sub=None, clean_fun=None, do_debug = False):
+# Default number of pages fetched at the same time once the page count is known
+default_page_workers = 4
+
+# Default number of writes in flight for the bulk calls
+default_write_workers = 4
+
+
+def page_url(url, page):
+	"""
+	Return url with its "page" query parameter set to page, keeping any other query parameters
+	"""
+	parts = urllib.parse.urlsplit(url)
+	query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True) if k != "page"]
+	query.append(("page", str(page)))
+	return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def last_page_of(raw_result):
+	"""
+	Find the number of pages from the first page of a Laravel style paginated response.
+	Returns None when the response does not tell
+	"""
+	last_page = raw_result.get("last_page")
+	if last_page:
+		return int(last_page)
+	total = raw_result.get("total")
+	per_page = raw_result.get("per_page")
+	if total is not None and per_page:
+		return max(1, math.ceil(int(total) / int(per_page)))
+	return None
+
+
+def page_items(raw_result, name, sub=None, clean_fun=None, inherit=None, do_debug = False):
+	"""
+	Pick the items out of one page of a paginated response.
+	When sub is given, each item holds a list of sub items under that key, which are returned flattened with the inherit keys copied from the parent.
+	clean_fun follows the (result, err) contract, items that fail cleaning are skipped
+	"""
+	out = list()
+	if clean_fun:
+		clean_fun = timed(clean_fun)
+	for raw_item in raw_result.get("data") or list():
+		if not raw_item:
+			logger.warning("Skipping item")
+			continue
+		raw_items2 = (raw_item.get(sub) or list()) if sub else [raw_item]
+		for raw_item2 in raw_items2:
+			if clean_fun:
+				item, clean_err = clean_fun(raw_item2)
+				if not item:
+					logger.warning(f"Error cleaning {name} item: {clean_err}")
+					continue
+				if do_debug:
+					logger.info("cleaned_item:%s", pretty(item))
+			else:
+				item = raw_item2
+			for k in inherit or list():
+				v = raw_item.get(k)
+				if v:
+					item[k] = v
+			out.append(item)
+	return out
+
+
+def request_error_text(e):
+	"""
+	Render a requests exception together with the response body, when there is one
+	"""
+	res = getattr(e, "response", None)
+	if res is not None:
+		return f"EXCEPTION: {e}, BODY:{res.text}"
+	return f"EXCEPTION: {e}"
+
+
+def observe_listing(session, url, pages):
+	"""
+	Count a listing of pages in the metrics of the session, when it has any
+	"""
+	metrics = getattr(session, "metrics", None)
+	if metrics is not None:
+		metrics.observe_listing(endpoint_name("GET", url), pages)
+
+
+def decode_json(res):
+	"""
+	res.json(), timed as a span when spans are collected
+	"""
+	if current_collector.get() is None:
+		return res.json()
+	with span("json_decode", bytes = len(res.content or b"")):
+		return res.json()
+
+
+def fetch_page(session, url):
+	res = session.get(url)
+	res.raise_for_status()
+	return decode_json(res)
+
+
+def generic_get(session, url, name, sub=None, clean_fun=None, inherit=None, max_workers = default_page_workers, do_debug = False):
+	"""
+	Fetch all items of a paginated collection.
+	Once the first page tells how many pages there are, the rest are fetched concurrently by up to max_workers threads.
+	Otherwise, or when max_workers is 1, next_page_url is followed one page at a time. Items are always returned in page order
+	"""
+	import requests
 	result = None
 	err = None
 	try:
 		if do_debug:
 			logger.info(f"Using get '{name}' url:'{url}'")
-		done = False
-		result = list()
-		while not done:
-			if do_debug and False:
-				logger.info(f" + {url} ({len(result)})")
-			res = session.get(url)
-			res.raise_for_status()
-			raw_result = res.json()
+		first = fetch_page(session, url)
+		pages = [first]
+		last_page = last_page_of(first)
+		current_page = int(first.get("current_page") or 1)
+		next_page_url = first.get("next_page_url")
+		if next_page_url and last_page and last_page > current_page and max_workers > 1:
+			urls = [page_url(url, page) for page in range(current_page + 1, last_page + 1)]
 			if do_debug:
-				logger.info(f"raw_result:{pprint.pformat(raw_result)}")
-			for raw_item in raw_result.get("data"):
-				if raw_item:
-					if sub:
-						raw_items2 =raw_item.get(sub)
-						for raw_item2 in raw_items2:
-							if clean_fun:
-								item = clean_fun(raw_item2, do_debug = do_debug)
-								if do_debug:
-									logger.info(f"cleaned_item:{pprint.pformat(item)}")
-							else:
-								item = raw_item
-							result.append(item)
-					else:
-						if clean_fun:
-							item = clean_fun(raw_item)
-							if do_debug:
-								logger.info(f"cleaned_item:{pprint.pformat(item)}")
-						else:
-							item = raw_item
-						result.append(item)
-				else:
-					logger.warning("Skipping item")
+				logger.info(f"Fetching {len(urls)} more '{name}' pages with {max_workers} workers")
+			fetches = [run_in_context(functools.partial(fetch_page, session, page_url)) for page_url in urls]
+			with concurrent.futures.ThreadPoolExecutor(max_workers = min(max_workers, len(urls))) as executor:
+				pages.extend(executor.map(lambda fetch: fetch(), fetches))
+			# The collection may have grown while we were fetching
+			next_page_url = pages[-1].get("next_page_url")
+		while next_page_url:
+			if do_debug:
+				logger.info(f" + {next_page_url} ({len(pages)})")
+			raw_result = fetch_page(session, next_page_url)
+			pages.append(raw_result)
 			next_page_url = raw_result.get("next_page_url")
-			if not next_page_url:
-				done = True
-			else:
-				url = next_page_url
+		observe_listing(session, url, len(pages))
+		result = list()
+		for raw_result in pages:
+			result.extend(page_items(raw_result, name = name, sub = sub, clean_fun = clean_fun, inherit = inherit, do_debug = do_debug))
 		if do_debug:
-			logger.info(f"result:{pprint.pformat(result)}")
+			logger.info("result:%s", pretty(result))
 	except requests.exceptions.RequestException as e: 
-		err = f"EXCEPTION: {e}, BODY:{res.text}"
+		result = None
+		err = request_error_text(e)
 	return result, err
 
+
+def generic_iter(session, url, name, sub=None, clean_fun=None, inherit=None, prefetch = True, do_debug = False):
+	"""
+	Yield (item, err) for each item of a paginated collection as soon as its page arrives.
+	With prefetch, the next page is fetched on a background thread while the caller works on the current one.
+	Closing the generator early, for example by breaking out of the loop, cancels the remaining fetches.
+	On errors a single (None, err) is yielded and iteration stops
+	"""
+	import requests
+	executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = f"gap-{name}") if prefetch else None
+	pending = None
+	pages = 0
+	try:
+		if do_debug:
+			logger.info(f"Iterating '{name}' url:'{url}'")
+		raw_result = fetch_page(session, url)
+		while raw_result is not None:
+			pages += 1
+			next_page_url = raw_result.get("next_page_url")
+			if executor and next_page_url:
+				pending = executor.submit(run_in_context(fetch_page), session, next_page_url)
+			for item in page_items(raw_result, name = name, sub = sub, clean_fun = clean_fun, inherit = inherit, do_debug = do_debug):
+				yield item, None
+			if pending:
+				raw_result = pending.result()
+				pending = None
+			elif next_page_url:
+				raw_result = fetch_page(session, next_page_url)
+			else:
+				raw_result = None
+	except requests.exceptions.RequestException as e:
+		yield None, request_error_text(e)
+	finally:
+		if pages:
+			observe_listing(session, url, pages)
+		if pending:
+			pending.cancel()
+		if executor:
+			executor.shutdown(wait = False, cancel_futures = True)
@@ -0,0 +1,364 @@
+import concurrent.futures
+import csv
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+from .helpers import *
+from .journal import *
+from .mapping import *
+
+logger = logging.getLogger(__name__)
+
+
+# Default sizes for the import pipeline
+default_import_chunk_size = 32
+default_import_queue_size = 8
+default_progress_interval = 2.0
+
+# Custom field type that audit goal columns are created as
+audit_goal_custom_field_type = "project_audit_goals"
+
+
+def read_csv_rows(source, fieldnames = None, delimiter = ',', quotechar = '"', encoding = 'utf-8-sig'):
+	"""
+	Stream the rows of a CSV file (a path or an open text file) as (row number, row dict), starting at 1.
+	Pass fieldnames when the header of an open file was already read
+	"""
+	if isinstance(source, (str, os.PathLike)):
+		with open(source, "r", encoding = encoding, newline = '') as csvfile:
+			yield from read_csv_rows(csvfile, fieldnames = fieldnames, delimiter = delimiter, quotechar = quotechar)
+		return
+	reader = csv.DictReader(source, fieldnames = fieldnames, delimiter = delimiter, quotechar = quotechar)
+	for number, row in enumerate(reader, start = 1):
+		yield number, row
+
+
+def csv_header(source, delimiter = ',', quotechar = '"', encoding = 'utf-8-sig'):
+	"""
+	Read just the column names of a CSV file
+	"""
+	if isinstance(source, (str, os.PathLike)):
+		with open(source, "r", encoding = encoding, newline = '') as csvfile:
+			return csv_header(csvfile, delimiter = delimiter, quotechar = quotechar)
+	return next(csv.reader(source, delimiter = delimiter, quotechar = quotechar), list())
+
+
+# Mapping stage, run in worker processes
+#######################################################################
+
+
+worker_mapper = None
+
+
+def init_map_worker(header, spec, bs_parser):
+	"""
+	Compile the mapper once per worker process
+	"""
+	global worker_mapper
+	worker_mapper = AuditGoalMapper(header, spec = spec, bs_parser = bs_parser)
+
+
+def map_chunk(chunk, parent_id = None, mapper = None):
+	"""
+	Map and clean a chunk of (row number, row). Returns a list of (row number, audit goal body, custom field values, err)
+	"""
+	mapper = mapper or worker_mapper
+	out = list()
+	for number, row in chunk:
+		try:
+			goal, custom_values = mapper.map(row)
+			if parent_id is not None:
+				goal["parent_id"] = parent_id
+			body, err = clean_audit_goal_out(goal)
+			out.append((number, body, custom_values, err))
+		except Exception as e:
+			out.append((number, None, None, f"Mapping failed: {e}"))
+	return out
+
+
+#######################################################################
+
+
+class ImportProgress:
+	"""
+	Counters of the import stages, shared between the stage threads
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.started_at = time.monotonic()
+		self.counts = {
+			  "read": 0
+			, "mapped": 0
+			, "map_errors": 0
+			, "uploaded": 0
+			, "skipped": 0
+			, "upload_errors": 0
+		}
+
+	def add(self, name, n = 1):
+		with self.lock:
+			self.counts[name] = self.counts.get(name, 0) + n
+
+	def snapshot(self):
+		with self.lock:
+			counts = dict(self.counts)
+		elapsed = time.monotonic() - self.started_at
+		counts["elapsed_s"] = elapsed
+		for name in ("read", "mapped", "uploaded"):
+			counts[f"{name}_per_s"] = counts[name] / elapsed if elapsed else None
+		return counts
+
+
+class AuditGoalImporter:
+	"""
+	Streaming import of a spreadsheet into audit goals.
+
+	A reader thread streams the CSV in chunks, a mapping stage maps and cleans the chunks on a process pool (the HTML work
+	is CPU bound), and upload threads upsert the goals by title. The stages are connected by bounded queues so a slow
+	stage holds back the ones before it instead of piling up rows in memory. Rows with the same title always go to the
+	same upload thread, in file order.
+	Custom field columns (those the mapping spec does not know) that do not exist yet are created before the upload starts.
+	With a journal (an ImportJournal or the path of its database) every row is journaled before and after its write, and
+	rows that were applied before with the same content are skipped, so a rerun of a failed import resumes where it
+	stopped. journal_scope defaults to the server, account and parent of the import.
+	on_progress, when given, is called with ImportProgress.snapshot() every progress_interval seconds and at the end
+	"""
+	def __init__(self, client, parent_id = None, spec = None, map_workers:int = None, upload_workers:int = default_write_workers, use_processes:bool = True, chunk_size:int = default_import_chunk_size, queue_size:int = default_import_queue_size, custom_field_type:str = audit_goal_custom_field_type, bs_parser = default_bs_parser, on_progress = None, progress_interval:float = default_progress_interval, journal = None, journal_scope:str = None, do_debug = False):
+		self.client = client
+		self.parent_id = parent_id
+		self.spec = spec
+		self.map_workers = map_workers or os.cpu_count() or 1
+		self.upload_workers = max(1, upload_workers)
+		self.use_processes = use_processes
+		self.chunk_size = max(1, chunk_size)
+		self.queue_size = max(1, queue_size)
+		self.custom_field_type = custom_field_type
+		self.bs_parser = bs_parser
+		self.on_progress = on_progress
+		self.progress_interval = progress_interval
+		self.journal = make_journal(journal)
+		self.owns_journal = self.journal is not None and not isinstance(journal, ImportJournal)
+		self.journal_scope = journal_scope
+		self.do_debug = do_debug
+
+	def put(self, q, item, stop):
+		"""
+		Put on a bounded queue, giving up when the pipeline is stopping
+		"""
+		while not stop.is_set():
+			try:
+				q.put(item, timeout = 0.1)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def get(self, q, stop):
+		while True:
+			try:
+				return q.get(timeout = 0.1)
+			except queue.Empty:
+				if stop.is_set():
+					return None
+
+	def ensure_custom_fields(self, names):
+		"""
+		Create the custom fields among names that do not exist yet, in one call. Returns (created names, err)
+		"""
+		if not names:
+			return list(), None
+		existing, err = self.client.known_custom_fields(self.custom_field_type, do_debug = self.do_debug)
+		if err:
+			return None, err
+		raw_fields = [{"name": name, "type": "text"} for name in names]
+		found, missing, err = custom_field_diff(existing, self.custom_field_type, raw_fields)
+		if err:
+			return None, err
+		if not missing:
+			return list(), None
+		created, err = self.client.create_custom_fields(self.custom_field_type, missing, do_debug = self.do_debug)
+		if err:
+			return None, f"Could not create custom fields: {err}"
+		return [field.get("name") for field in missing], None
+
+	def run(self, source):
+		"""
+		Import the CSV file source (a path or an open text file). Returns (report, err) where the report has the progress
+		counters, the custom fields created and the row errors as (row number, title, err)
+		"""
+		try:
+			return self.run_pipeline(source)
+		finally:
+			if self.owns_journal:
+				self.journal.close()
+
+	def run_pipeline(self, source):
+		if self.client.error:
+			logger.error(f"Error: {self.client.error}")
+			return None, self.client.error
+		header = csv_header(source)
+		# An open file is now past its header, a path is opened again
+		rows = read_csv_rows(source, fieldnames = None if isinstance(source, (str, os.PathLike)) else header)
+		if not header:
+			return None, "No header in CSV"
+		mapper = AuditGoalMapper(header, spec = self.spec, bs_parser = self.bs_parser)
+		created, err = self.ensure_custom_fields(mapper.custom_fields)
+		if err:
+			return None, err
+		scope = self.journal_scope or f"{self.client.base_url}|{self.client.account_id}|{self.parent_id}"
+		listing = list()
+		listing_lock = threading.Lock()
+		progress = ImportProgress()
+		unchanged_before = self.client.write_stats().get("unchanged", 0)
+		errors = list()
+		errors_lock = threading.Lock()
+		failures = list()
+		stop = threading.Event()
+		chunks = queue.Queue(maxsize = self.queue_size)
+		uploads = [queue.Queue(maxsize = self.queue_size * self.chunk_size) for i in range(self.upload_workers)]
+		done = object()
+
+		def add_error(number, title, err):
+			with errors_lock:
+				errors.append((number, title, err))
+
+		def read_stage():
+			chunk = list()
+			for number, row in rows:
+				chunk.append((number, row))
+				progress.add("read")
+				if len(chunk) >= self.chunk_size:
+					if not self.put(chunks, chunk, stop):
+						return
+					chunk = list()
+			if chunk:
+				self.put(chunks, chunk, stop)
+
+		def route(mapped):
+			for number, body, custom_values, err in mapped:
+				if err or not body:
+					progress.add("map_errors")
+					add_error(number, None, err)
+					continue
+				progress.add("mapped")
+				worker = zlib.crc32(body.get("title", "").encode("utf-8")) % self.upload_workers
+				if not self.put(uploads[worker], (number, body, custom_values), stop):
+					return
+
+		def map_stage():
+			if not self.use_processes or self.map_workers <= 1:
+				while True:
+					chunk = self.get(chunks, stop)
+					if chunk is None or chunk is done:
+						return
+					route(map_chunk(chunk, self.parent_id, mapper))
+			# Spawned rather than forked, forking while the other stages hold locks is not safe
+			import multiprocessing
+			context = multiprocessing.get_context("spawn")
+			with concurrent.futures.ProcessPoolExecutor(max_workers = self.map_workers, mp_context = context, initializer = init_map_worker, initargs = (header, self.spec, self.bs_parser)) as executor:
+				pending = list()
+				while True:
+					chunk = self.get(chunks, stop)
+					if chunk is None:
+						return
+					if chunk is not done:
+						pending.append(executor.submit(map_chunk, chunk, self.parent_id))
+					# Keep a few chunks in flight per process, and hand results on in file order
+					while pending and (chunk is done or len(pending) >= 2 * self.map_workers or pending[0].done()):
+						route(pending.pop(0).result())
+					if chunk is done:
+						return
+
+		def list_goals():
+			"""
+			One listing before the first write, so the upload threads find existing goals in the index.
+			A resumed import whose rows are all journaled never lists
+			"""
+			with listing_lock:
+				if not listing:
+					goals, err = self.client.get_audit_goals(do_debug = self.do_debug)
+					if err:
+						return err
+					listing.append(True)
+			return None
+
+		def upload_stage(q):
+			while True:
+				item = self.get(q, stop)
+				if item is None or item is done:
+					return
+				number, body, custom_values = item
+				title = body.get("title")
+				hash = content_hash(body) if self.journal else None
+				if self.journal and self.journal.is_applied(scope, number, hash):
+					progress.add("skipped")
+					continue
+				err = list_goals()
+				if not err:
+					if self.journal:
+						self.journal.pending(scope, number, title, hash)
+					result, err = self.client.upsert_audit_goal_by_title(body, do_debug = self.do_debug)
+				if err:
+					progress.add("upload_errors")
+					add_error(number, title, err)
+					if self.journal:
+						self.journal.failed(scope, number, title, hash, str(err))
+				else:
+					progress.add("uploaded")
+					if self.journal:
+						self.journal.applied(scope, number, title, hash, result.get("id") if isinstance(result, dict) else None)
+
+		def stage(name, fun, *args):
+			try:
+				fun(*args)
+			except Exception as e:
+				logger.exception(f"Import stage {name} failed")
+				failures.append(f"{name}: {e}")
+				stop.set()
+
+		reader = threading.Thread(target = stage, args = ("read", read_stage), name = "import-read")
+		mapper_thread = threading.Thread(target = stage, args = ("map", map_stage), name = "import-map")
+		uploaders = [threading.Thread(target = stage, args = (f"upload-{i}", upload_stage, q), name = f"import-upload-{i}") for i, q in enumerate(uploads)]
+		for thread in [reader, mapper_thread] + uploaders:
+			thread.start()
+		last_report = time.monotonic()
+		def report_progress(force = False):
+			nonlocal last_report
+			if not force and time.monotonic() - last_report < self.progress_interval:
+				return
+			last_report = time.monotonic()
+			snapshot = progress.snapshot()
+			logger.info(f"Import: read {snapshot['read']}, mapped {snapshot['mapped']}, uploaded {snapshot['uploaded']}, skipped {snapshot['skipped']}, errors {snapshot['map_errors'] + snapshot['upload_errors']}, {snapshot['uploaded_per_s'] or 0:.1f} goals/s")
+			if self.on_progress:
+				self.on_progress(snapshot)
+		# Each stage is told it is done once the one before it has finished
+		for thread, next_queues in [(reader, [chunks]), (mapper_thread, uploads)]:
+			while thread.is_alive():
+				thread.join(timeout = 0.1)
+				report_progress()
+			for q in next_queues:
+				self.put(q, done, stop)
+		for thread in uploaders:
+			while thread.is_alive():
+				thread.join(timeout = 0.1)
+				report_progress()
+		report_progress(force = True)
+		report = progress.snapshot()
+		# Uploaded rows whose goal already had the same values, so no call was made
+		report["unchanged"] = self.client.write_stats().get("unchanged", 0) - unchanged_before
+		report["custom_fields_created"] = created
+		report["errors"] = sorted(errors, key = lambda error: error[0])
+		if failures:
+			return report, f"Import failed: {'; '.join(failures)}"
+		return report, None
+
+
+def import_audit_goals(client, source, parent_id = None, **kwargs):
+	"""
+	Import a CSV file of audit goals, see AuditGoalImporter
+	"""
+	return AuditGoalImporter(client, parent_id = parent_id, **kwargs).run(source)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+journal_schema = """
+CREATE TABLE IF NOT EXISTS import_rows (
+	  scope TEXT NOT NULL
+	, row_number INTEGER NOT NULL
+	, title TEXT
+	, content_hash TEXT NOT NULL
+	, server_id TEXT
+	, state TEXT NOT NULL
+	, error TEXT
+	, updated_at REAL NOT NULL
+	, PRIMARY KEY (scope, row_number)
+)
+"""
+
+# Row states
+journal_pending = "pending"
+journal_applied = "applied"
+journal_failed = "failed"
+
+
+def content_hash(body):
+	"""
+	Stable hash of a JSON body, independent of key order
+	"""
+	raw = json.dumps(body, sort_keys = True, separators = (",", ":"), default = str)
+	return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ImportJournal:
+	"""
+	Write-ahead journal of an import in a local SQLite database.
+	Every row is recorded as pending with the hash of its body before it is written to the server, and as applied with
+	the server id once that succeeded. A rerun skips the rows that are applied with the same hash, so an import that died
+	halfway resumes where it stopped. scope keeps imports into different accounts or audits apart
+	"""
+	def __init__(self, path:str):
+		self.path = path
+		directory = os.path.dirname(os.path.abspath(path))
+		os.makedirs(directory, exist_ok = True)
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.execute(journal_schema)
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def get(self, scope, row_number):
+		"""
+		The journal entry of a row as a dict, or None
+		"""
+		with self.lock:
+			cursor = self.connection.execute("SELECT title, content_hash, server_id, state, error, updated_at FROM import_rows WHERE scope = ? AND row_number = ?", (scope, row_number))
+			row = cursor.fetchone()
+		if not row:
+			return None
+		title, hash, server_id, state, error, updated_at = row
+		return {"title": title, "content_hash": hash, "server_id": server_id, "state": state, "error": error, "updated_at": updated_at}
+
+	def is_applied(self, scope, row_number, hash):
+		entry = self.get(scope, row_number)
+		return bool(entry) and entry["state"] == journal_applied and entry["content_hash"] == hash
+
+	def record(self, scope, row_number, title, hash, state, server_id = None, error = None):
+		with self.lock:
+			self.connection.execute("INSERT OR REPLACE INTO import_rows (scope, row_number, title, content_hash, server_id, state, error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (scope, row_number, title, hash, None if server_id is None else str(server_id), state, error, time.time()))
+
+	def pending(self, scope, row_number, title, hash):
+		self.record(scope, row_number, title, hash, journal_pending)
+
+	def applied(self, scope, row_number, title, hash, server_id):
+		self.record(scope, row_number, title, hash, journal_applied, server_id = server_id)
+
+	def failed(self, scope, row_number, title, hash, error):
+		self.record(scope, row_number, title, hash, journal_failed, error = error)
+
+	def counts(self, scope):
+		"""
+		Number of rows per state in scope
+		"""
+		with self.lock:
+			cursor = self.connection.execute("SELECT state, COUNT(*) FROM import_rows WHERE scope = ? GROUP BY state", (scope,))
+			return dict(cursor.fetchall())
+
+	def clear(self, scope = None):
+		with self.lock:
+			if scope is None:
+				self.connection.execute("DELETE FROM import_rows")
+			else:
+				self.connection.execute("DELETE FROM import_rows WHERE scope = ?", (scope,))
+
+
+def make_journal(journal):
+	"""
+	Turn the journal parameter into an ImportJournal: a path to the database file, or a ready made journal
+	"""
+	if not journal:
+		return None
+	if isinstance(journal, ImportJournal):
+		return journal
+	return ImportJournal(str(journal))
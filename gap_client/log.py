@@ -0,0 +1,68 @@
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+# Name of the logger all gap_client modules log under
+library_logger_name = "gap_client"
+
+default_log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class LazyFormat:
+	"""
+	Defers an expensive rendering until a handler actually emits the record. Pass it as a %-style argument:
+	logger.debug("result: %s", LazyFormat(pformat, result)) costs one object when debug logging is off
+	"""
+	__slots__ = ("fun", "args")
+
+	def __init__(self, fun, *args):
+		self.fun = fun
+		self.args = args
+
+	def __str__(self):
+		return self.fun(*self.args)
+
+	__repr__ = __str__
+
+
+def pformat(value):
+	# pprint pulls in dataclasses and inspect, so it is only imported when something is rendered
+	import pprint
+	return pprint.pformat(value)
+
+
+def pretty(value):
+	"""
+	Lazy pprint.pformat of value, for use as a logging argument
+	"""
+	return LazyFormat(pformat, value)
+
+
+def enable_logging(level = logging.DEBUG, stream = None, fmt = default_log_format):
+	"""
+	Send the log records of gap_client, and only of gap_client, at level and above to stream (stdout by default).
+	This replaces the root logger setup that importing the package used to do. Returns the handler, for disable_logging
+	"""
+	library_logger = logging.getLogger(library_logger_name)
+	handler = logging.StreamHandler(stream or sys.stdout)
+	handler.setLevel(level)
+	handler.setFormatter(logging.Formatter(fmt))
+	library_logger.addHandler(handler)
+	library_logger.setLevel(level)
+	return handler
+
+
+def disable_logging(handler):
+	"""
+	Remove a handler added by enable_logging
+	"""
+	library_logger = logging.getLogger(library_logger_name)
+	library_logger.removeHandler(handler)
+	if not any(not isinstance(h, logging.NullHandler) for h in library_logger.handlers):
+		library_logger.setLevel(logging.NOTSET)
+
+
+# A library leaves handlers and levels to the application, this only keeps "No handlers could be found" away
+logging.getLogger(library_logger_name).addHandler(logging.NullHandler())
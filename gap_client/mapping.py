@@ -0,0 +1,137 @@
+import functools
+import logging
+
+from .helpers import *
+from .log import pretty
+
+logger = logging.getLogger(__name__)
+
+
+# How the columns of a Statement of Applicability spreadsheet map to audit goal fields.
+# A string maps the column to that field, taking the links or visible text of the cell.
+# A dict translates the cell value: "_name" is the field, "_default" the value for anything not listed.
+# None drops the column. Columns that are not in the spec are left over as custom fields
+soa_audit_goal_spec = {
+	  "Comments": "description"
+	, "Title": "title"
+	, "Clause": "clause"
+	, "Explanation": "guide"
+	, "Implemented": {
+		  "_name": "status"
+		, "_default": str(Status.not_started)
+		, "Completely": str(Status.completed)
+		, "Partially": str(Status.in_progress)
+		, "": str(Status.not_started)
+	}
+	, "Control Objectives": "documentation"
+	#, "Control Description": "control_description"
+	#, "Control Owner": "control_owner"
+	#, "Applicable": "applicable"
+}
+
+
+def clean_key(key):
+	return key and key.strip().strip('"\'')
+
+
+def clean_value(value):
+	return value and value.strip().strip('"\'')
+
+
+class ColumnRule:
+	"""
+	What to do with one column: field is the target field, or None for a custom field column.
+	translations and default are set for columns whose values are translated
+	"""
+	__slots__ = ("raw_key", "key", "field", "translations", "default")
+
+	def __init__(self, raw_key, key, field = None, translations = None, default = ""):
+		self.raw_key = raw_key
+		self.key = key
+		self.field = field
+		self.translations = translations
+		self.default = default
+
+
+class AuditGoalMapper:
+	"""
+	Maps spreadsheet rows to audit goal bodies.
+	The spec (see soa_audit_goal_spec) is compiled once against the column header into a list of column rules, so each row
+	is mapped with plain table lookups. map() returns the audit goal fields and the remaining columns, which are meant to
+	become custom fields
+	"""
+	def __init__(self, header, spec = None, bs_parser = default_bs_parser):
+		self.spec = soa_audit_goal_spec if spec is None else spec
+		self.bs_parser = bs_parser
+		self.header = list(header)
+		self.rules = list()
+		self.custom_fields = list()
+		spec_by_key = {clean_key(k): v for k, v in self.spec.items()}
+		for raw_key in self.header:
+			key = clean_key(raw_key)
+			if not key:
+				logger.info(f"Skipping empty column name")
+				continue
+			if key not in spec_by_key:
+				self.rules.append(ColumnRule(raw_key, key))
+				self.custom_fields.append(key)
+				continue
+			target = spec_by_key[key]
+			if target is None:
+				continue
+			if isinstance(target, str):
+				self.rules.append(ColumnRule(raw_key, key, field = target))
+			elif isinstance(target, dict):
+				translations = {clean_value(k): v for k, v in target.items() if not k.startswith("_")}
+				self.rules.append(ColumnRule(raw_key, key, field = target.get("_name", key), translations = translations, default = target.get("_default", "")))
+			else:
+				raise ValueError(f"Invalid mapping for column '{key}': {pretty(target)}")
+
+	def map_text(self, value):
+		"""
+		Reduce a cell to its link, its text or nothing when it has no visible content
+		"""
+		links, visible = analyze_html(value, bs_parser = self.bs_parser)
+		if links:
+			for name, link in links.items():
+				value = f'<a href="{link}">{name}</a>'
+			return value
+		return value if visible else ""
+
+	def map(self, row, do_debug = False):
+		"""
+		Map one row, a dict keyed by the header columns. Returns (audit goal fields, custom field values by column)
+		"""
+		out = dict()
+		custom_fields = dict()
+		for rule in self.rules:
+			value = clean_value(row.get(rule.raw_key))
+			if not rule.field:
+				custom_fields[rule.key] = value
+			elif rule.translations is None:
+				out[rule.field] = self.map_text(value)
+			else:
+				out[rule.field] = rule.translations.get(value, rule.default)
+		if do_debug:
+			logger.info("map: %s custom fields: %s", pretty(out), pretty(custom_fields))
+		return out, custom_fields
+
+	def map_rows(self, rows, do_debug = False):
+		for row in rows:
+			yield self.map(row, do_debug = do_debug)
+
+
+@functools.lru_cache(maxsize = 32)
+def soa_mapper(header, bs_parser = default_bs_parser):
+	"""
+	The SoA mapper for a header (a tuple of column names), compiled once per header
+	"""
+	return AuditGoalMapper(header, bs_parser = bs_parser)
+
+
+def map_audit_goal(indata, do_debug = False, bs_parser = default_bs_parser):
+	"""
+	Map one SoA row to an audit goal. Returns (audit goal fields, names of the columns left for custom fields)
+	"""
+	out, custom_fields = soa_mapper(tuple(indata.keys()), bs_parser = bs_parser).map(indata, do_debug = do_debug)
+	return out, custom_fields.keys()
@@ -0,0 +1,241 @@
+import bisect
+import functools
+import logging
+import re
+import threading
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds in seconds of the request latency histogram buckets, as in the Prometheus client defaults
+default_latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefix of the metric names in the Prometheus text format
+default_metrics_prefix = "gap_client"
+
+# How a method acts on a single record
+operation_by_method = {
+	  "GET": "get"
+	, "POST": "create"
+	, "PUT": "patch"
+	, "PATCH": "patch"
+	, "DELETE": "delete"
+}
+
+
+@functools.lru_cache(maxsize = 1024)
+def endpoint_path_name(method, path):
+	parts = [part for part in path.split("/") if part]
+	if parts[-2:] == ["auth", "token"]:
+		return "token"
+	if "api-v1" in parts:
+		rest = parts[parts.index("api-v1") + 1:]
+		if rest[:1] == ["account"] and len(rest) >= 2:
+			return rest[1]
+		if len(rest) == 2:
+			return f"{rest[1]} {'list' if method == 'GET' else operation_by_method.get(method, method.lower())}"
+		if len(rest) == 3:
+			return f"{rest[1]} {operation_by_method.get(method, method.lower())}"
+	return f"{method} {re.sub(r'/[0-9]+(?=/|$)', '/{id}', path)}"
+
+
+def endpoint_name(method, url):
+	"""
+	Logical name of the endpoint a call goes to, like "audits list", "audit-goals create" or "custom-fields list".
+	Account and record ids and the query string do not matter, so all calls to one endpoint share a name
+	"""
+	return endpoint_path_name(method.upper(), urllib.parse.urlsplit(url).path)
+
+
+def body_size(body):
+	if body is None:
+		return 0
+	if isinstance(body, str):
+		return len(body.encode("utf-8"))
+	if isinstance(body, (bytes, bytearray)):
+		return len(body)
+	return 0
+
+
+class Histogram:
+	"""
+	Counts of observations by bucket, with their sum. counts[i] counts the observations up to buckets[i], the last
+	count those above all buckets
+	"""
+	def __init__(self, buckets = default_latency_buckets):
+		self.buckets = tuple(buckets)
+		self.counts = [0] * (len(self.buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def cumulative(self):
+		"""
+		(upper bound, count of observations up to it) pairs, ending with ("+Inf", count) as Prometheus expects
+		"""
+		out = list()
+		total = 0
+		for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+			total += count
+			out.append((bound, total))
+		return out
+
+	def snapshot(self):
+		return {
+			  "buckets": {str(bound): count for bound, count in self.cumulative()}
+			, "sum": self.sum
+			, "count": self.count
+		}
+
+
+class EndpointMetrics:
+	def __init__(self, buckets = default_latency_buckets):
+		self.requests = 0
+		self.errors = 0
+		self.statuses = dict()
+		self.latency = Histogram(buckets)
+		self.bytes_sent = 0
+		self.bytes_received = 0
+		self.retries = 0
+		self.listings = 0
+		self.pages = 0
+
+	def snapshot(self):
+		return {
+			  "requests": self.requests
+			, "errors": self.errors
+			, "statuses": dict(self.statuses)
+			, "latency": self.latency.snapshot()
+			, "bytes_sent": self.bytes_sent
+			, "bytes_received": self.bytes_received
+			, "retries": self.retries
+			, "listings": self.listings
+			, "pages": self.pages
+			, "pages_per_listing": self.pages / self.listings if self.listings else None
+		}
+
+
+class MetricsRegistry:
+	"""
+	Per endpoint request counts, status codes, latency histograms, bytes sent and received, retries and pages per
+	listing, plus the hit counters of the caches registered with add_cache.
+	Recording is a few additions under a lock, all formatting happens in snapshot() and prometheus_text()
+	"""
+	def __init__(self, buckets = default_latency_buckets):
+		self.buckets = tuple(buckets)
+		self.endpoints = dict()
+		self.caches = dict()
+		self.lock = threading.Lock()
+
+	def endpoint(self, name):
+		# Callers hold the lock
+		metrics = self.endpoints.get(name)
+		if metrics is None:
+			metrics = self.endpoints[name] = EndpointMetrics(self.buckets)
+		return metrics
+
+	def observe_request(self, endpoint, status, seconds, bytes_sent = 0, bytes_received = 0, error = None):
+		"""
+		Record one HTTP exchange. status is None when the call failed without a response, error is then the exception
+		"""
+		with self.lock:
+			metrics = self.endpoint(endpoint)
+			metrics.requests += 1
+			if error is not None:
+				metrics.errors += 1
+			key = str(status) if status is not None else "error"
+			metrics.statuses[key] = metrics.statuses.get(key, 0) + 1
+			metrics.latency.observe(seconds)
+			metrics.bytes_sent += bytes_sent
+			metrics.bytes_received += bytes_received
+
+	def observe_retry(self, endpoint):
+		with self.lock:
+			self.endpoint(endpoint).retries += 1
+
+	def observe_listing(self, endpoint, pages):
+		with self.lock:
+			metrics = self.endpoint(endpoint)
+			metrics.listings += 1
+			metrics.pages += pages
+
+	def add_cache(self, name, stats_fun):
+		"""
+		Report the cache called name, stats_fun returns a dict with at least hits and misses. It is only called by snapshots
+		"""
+		with self.lock:
+			self.caches[name] = stats_fun
+
+	def reset(self):
+		with self.lock:
+			self.endpoints = dict()
+
+	def snapshot(self):
+		"""
+		All metrics as a dict: {"endpoints": {name: {...}}, "caches": {name: {...}}}
+		"""
+		with self.lock:
+			endpoints = {name: metrics.snapshot() for name, metrics in sorted(self.endpoints.items())}
+			caches = dict(self.caches)
+		return {
+			  "endpoints": endpoints
+			, "caches": {name: stats_fun() for name, stats_fun in sorted(caches.items())}
+		}
+
+	def prometheus_text(self, prefix = default_metrics_prefix):
+		"""
+		All metrics in the Prometheus text exposition format
+		"""
+		snapshot = self.snapshot()
+		endpoints = snapshot["endpoints"]
+		lines = list()
+
+		def family(name, kind, help, samples):
+			lines.append(f"# HELP {prefix}_{name} {help}")
+			lines.append(f"# TYPE {prefix}_{name} {kind}")
+			for suffix, labels, value in samples:
+				label_text = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels)
+				lines.append(f"{prefix}_{name}{suffix}{{{label_text}}} {format_value(value)}")
+
+		family("requests_total", "counter", "HTTP requests by endpoint and status", [("", (("endpoint", endpoint), ("status", status)), count) for endpoint, metrics in endpoints.items() for status, count in sorted(metrics["statuses"].items())])
+		latency = list()
+		for endpoint, metrics in endpoints.items():
+			for bound, count in metrics["latency"]["buckets"].items():
+				latency.append(("_bucket", (("endpoint", endpoint), ("le", bound)), count))
+			latency.append(("_sum", (("endpoint", endpoint),), metrics["latency"]["sum"]))
+			latency.append(("_count", (("endpoint", endpoint),), metrics["latency"]["count"]))
+		family("request_duration_seconds", "histogram", "HTTP request latency by endpoint, body download included", latency)
+		family("request_bytes_total", "counter", "HTTP body bytes by endpoint and direction", [("", (("endpoint", endpoint), ("direction", direction)), metrics[f"bytes_{direction}"]) for endpoint, metrics in endpoints.items() for direction in ("sent", "received")])
+		family("retries_total", "counter", "Retried HTTP requests by endpoint", [("", (("endpoint", endpoint),), metrics["retries"]) for endpoint, metrics in endpoints.items() if metrics["retries"]])
+		family("listings_total", "counter", "Paginated listings by endpoint", [("", (("endpoint", endpoint),), metrics["listings"]) for endpoint, metrics in endpoints.items() if metrics["listings"]])
+		family("listing_pages_total", "counter", "Pages fetched by paginated listings by endpoint", [("", (("endpoint", endpoint),), metrics["pages"]) for endpoint, metrics in endpoints.items() if metrics["listings"]])
+		caches = snapshot["caches"]
+		family("cache_hits_total", "counter", "Lookups answered by a client cache", [("", (("cache", name),), stats.get("hits", 0)) for name, stats in caches.items()])
+		family("cache_misses_total", "counter", "Lookups a client cache could not answer", [("", (("cache", name),), stats.get("misses", 0)) for name, stats in caches.items()])
+		return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+	if isinstance(value, float):
+		return repr(value)
+	return str(value)
+
+
+def make_metrics(metrics):
+	"""
+	Turn the metrics client parameter into a MetricsRegistry: True for a new one, a ready made one to share it, or None
+	"""
+	if not metrics:
+		return None
+	if isinstance(metrics, MetricsRegistry):
+		return metrics
+	return MetricsRegistry()
@@ -0,0 +1,61 @@
+import datetime
+import logging
+from requests_oauth2client import BearerToken, OAuth2Client, OAuth2ClientCredentialsAuth
+
+from .spans import span
+from .token_cache import FileTokenCache, make_token_cache
+
+logger = logging.getLogger(__name__)
+
+
+# requests_oauth2client pulls in jwskate and cryptography, so this module is only imported when a client uses OAuth2
+
+
+class ClientCredentialsAuth(OAuth2ClientCredentialsAuth):
+	"""
+	OAuth2ClientCredentialsAuth whose token requests are timed as "token" spans
+	"""
+	def renew_token(self):
+		with span("token", source = "endpoint"):
+			super().renew_token()
+
+
+class CachedClientCredentialsAuth(OAuth2ClientCredentialsAuth):
+	"""
+	OAuth2ClientCredentialsAuth that looks in a FileTokenCache before asking the token endpoint for a new token,
+	and stores the tokens it fetches there for other clients and processes
+	"""
+	def __init__(self, client, token_cache:FileTokenCache, token_url:str, client_id:str, **token_kwargs):
+		super().__init__(client, **token_kwargs)
+		self.token_cache = token_cache
+		self.cache_key = token_cache.key(token_url, client_id, token_kwargs.get("scope"), token_kwargs.get("resource"))
+
+	def renew_token(self):
+		with span("token") as token_span, self.token_cache.locked(self.cache_key):
+			entry = self.token_cache.load(self.cache_key)
+			if entry:
+				expires_at = datetime.datetime.fromtimestamp(entry["expires_at"], tz=datetime.timezone.utc)
+				self.token = BearerToken(entry["access_token"], expires_at=expires_at, scope=entry.get("scope"))
+				if token_span is not None:
+					token_span.set("source", "cache")
+				return
+			if token_span is not None:
+				token_span.set("source", "endpoint")
+			super().renew_token()
+			expires_at = self.token.expires_at if self.token else None
+			if expires_at:
+				self.token_cache.save(self.cache_key, self.token.access_token, expires_at.timestamp(), token_type=self.token.token_type, scope=self.token.scope)
+
+
+def make_oauth_auth(token_url:str, client_id:str, client_secret:str, resource:str, scope:str = "all", token_cache = None):
+	"""
+	Create the OAuth2 client credentials auth for a requests session, sharing tokens through token_cache when given.
+	Returns (oauth2client, auth)
+	"""
+	oauth2client = OAuth2Client(token_endpoint=token_url, client_id=client_id, client_secret=client_secret)
+	cache = make_token_cache(token_cache)
+	if cache:
+		auth = CachedClientCredentialsAuth(oauth2client, token_cache=cache, token_url=token_url, client_id=client_id, scope=scope, resource=resource)
+	else:
+		auth = ClientCredentialsAuth(oauth2client, scope=scope, resource=resource)
+	return oauth2client, auth
@@ -0,0 +1,111 @@
+import datetime
+import logging
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Methods that can be repeated without changing the outcome
+idempotent_methods = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# Throttling and gateway errors that are worth another try
+default_retry_statuses = (429, 502, 503, 504)
+
+
+def parse_retry_after(value):
+	"""
+	Parse a Retry-After header, which is either a number of seconds or an HTTP date. Returns seconds or None
+	"""
+	if not value:
+		return None
+	value = value.strip()
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	import email.utils
+	try:
+		when = email.utils.parsedate_to_datetime(value)
+	except (TypeError, ValueError):
+		return None
+	if when.tzinfo is None:
+		when = when.replace(tzinfo=datetime.timezone.utc)
+	return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+	"""
+	Decides which failed requests are retried and how long to wait in between.
+	max_attempts is the per-call budget (1 means no retries). Waits use exponential backoff from backoff_base up to backoff_max
+	with full jitter, unless the response has a Retry-After header, which is honored up to max_retry_after seconds.
+	Only idempotent methods are retried, unless idempotency_header is set: then POST and PATCH are retried too, carrying a
+	key in that header that stays the same across the attempts so the server can drop duplicates
+	"""
+	def __init__(self, max_attempts:int = 4, backoff_base:float = 0.5, backoff_max:float = 30.0, jitter:bool = True, retry_statuses = default_retry_statuses, idempotency_header:str = None, max_retry_after:float = 120.0):
+		self.max_attempts = max_attempts
+		self.backoff_base = backoff_base
+		self.backoff_max = backoff_max
+		self.jitter = jitter
+		self.retry_statuses = set(retry_statuses)
+		self.idempotency_header = idempotency_header
+		self.max_retry_after = max_retry_after
+
+	def can_retry_method(self, method):
+		method = method.upper()
+		if method in idempotent_methods:
+			return True
+		return bool(self.idempotency_header) and method in ("POST", "PATCH")
+
+	def idempotency_headers(self, method):
+		"""
+		Extra headers to send with every attempt of one call
+		"""
+		if self.idempotency_header and method.upper() not in idempotent_methods:
+			import uuid
+			return {self.idempotency_header: str(uuid.uuid4())}
+		return dict()
+
+	def can_retry_status(self, status_code):
+		return status_code in self.retry_statuses
+
+	def delay(self, attempt, retry_after = None):
+		"""
+		Seconds to wait after the given failed attempt (counting from 1)
+		"""
+		if retry_after is not None:
+			return min(retry_after, self.max_retry_after)
+		backoff = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+		return random.uniform(0, backoff) if self.jitter else backoff
+
+
+class RetryBudget:
+	"""
+	Per-client limit on retries, so a struggling server does not get hit by a retry storm.
+	Every call adds ratio to the budget (up to max_tokens) and every retry spends one, so in the long run retries are
+	limited to ratio of the calls. The budget starts with initial retries to spend
+	"""
+	def __init__(self, ratio:float = 0.2, initial:float = 10.0, max_tokens:float = 100.0):
+		self.ratio = ratio
+		self.max_tokens = max_tokens
+		self.tokens = min(initial, max_tokens)
+		self.retries = 0
+		self.denied = 0
+		self.lock = threading.Lock()
+
+	def deposit(self):
+		with self.lock:
+			self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+	def withdraw(self):
+		with self.lock:
+			if self.tokens >= 1:
+				self.tokens -= 1
+				self.retries += 1
+				return True
+			self.denied += 1
+			return False
+
+
+# Policy used by clients that are not given one
+default_retry_policy = RetryPolicy()
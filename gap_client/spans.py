@@ -0,0 +1,320 @@
+import collections
+import contextlib
+import contextvars
+import functools
+import io
+import itertools
+import logging
+import os
+import threading
+import time
+from .tracing import current_tracers
+
+logger = logging.getLogger(__name__)
+
+
+# Default number of finished traces a SpanCollector keeps for inspection
+default_span_traces = 20
+
+# Default number of flushed trace ids a SpanCollector remembers, to recognise spans that end after their root span
+default_flushed_traces = 1024
+
+# The span that is open in this thread or task, and the collector it reports to. Both are None unless spans are collected
+current_span = contextvars.ContextVar("gap_client_current_span", default = None)
+current_collector = contextvars.ContextVar("gap_client_current_collector", default = None)
+
+# Returned by span() when nothing is collected, so an instrumented block costs one context variable lookup
+null_span = contextlib.nullcontext()
+
+span_ids = itertools.count(1)
+
+
+class Span:
+	"""
+	One timed phase of a call, such as "get_custom_fields", "http", "token", "connect", "json_decode" or
+	"clean_custom_field". Spans of one call form a tree through parent_id and share its trace_id.
+	start_ns and end_ns are wall clock nanoseconds, duration is measured with the performance counter
+	"""
+	__slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "start_perf", "duration", "error", "thread")
+
+	def __init__(self, name, parent = None, attributes = None):
+		self.name = name
+		self.span_id = f"{os.getpid():x}-{next(span_ids):x}"
+		self.parent_id = parent.span_id if parent else None
+		self.trace_id = parent.trace_id if parent else self.span_id
+		self.attributes = dict(attributes or dict())
+		self.start_ns = time.time_ns()
+		self.start_perf = time.perf_counter()
+		self.end_ns = None
+		self.duration = None
+		self.error = None
+		self.thread = threading.current_thread().name
+
+	def set(self, key, value):
+		self.attributes[key] = value
+
+	def finish(self):
+		self.duration = time.perf_counter() - self.start_perf
+		self.end_ns = self.start_ns + int(self.duration * 1e9)
+
+	def to_dict(self):
+		return {
+			  "name": self.name
+			, "trace_id": self.trace_id
+			, "span_id": self.span_id
+			, "parent_id": self.parent_id
+			, "start_ns": self.start_ns
+			, "end_ns": self.end_ns
+			, "duration": self.duration
+			, "attributes": dict(self.attributes)
+			, "error": self.error
+			, "thread": self.thread
+		}
+
+
+class SpanCollector:
+	"""
+	Collects nested timing spans while it is active. Hooks added with add_hook are called with each span when it starts
+	(before) and ends (after). When the root span of a call ends, every exporter is called with the list of all spans of
+	that call, for example a plain callback or an OpenTelemetryExporter. The last max_traces traces are kept in traces.
+	A span that ends after its root span, like one of a task the call did not wait for, is exported on its own
+	"""
+	def __init__(self, exporters = None, max_traces:int = default_span_traces, max_flushed:int = default_flushed_traces):
+		self.before_hooks = list()
+		self.after_hooks = list()
+		self.exporters = list(exporters or list())
+		self.pending = dict()
+		self.traces = collections.deque(maxlen = max_traces)
+		# Ids of the traces whose root span ended, oldest first
+		self.flushed = collections.OrderedDict()
+		self.max_flushed = max_flushed
+		self.lock = threading.Lock()
+
+	def add_hook(self, before = None, after = None):
+		if before:
+			self.before_hooks.append(before)
+		if after:
+			self.after_hooks.append(after)
+
+	def add_exporter(self, exporter):
+		self.exporters.append(exporter)
+
+	@contextlib.contextmanager
+	def span(self, name, **attributes):
+		"""
+		Time the block as a span, nested under the span that is open in this thread or task
+		"""
+		span = Span(name, current_span.get(), attributes)
+		for hook in self.before_hooks:
+			hook(span)
+		span_token = current_span.set(span)
+		collector_token = current_collector.set(self)
+		try:
+			yield span
+		except BaseException as e:
+			span.error = f"{type(e).__name__}: {e}"
+			raise
+		finally:
+			span.finish()
+			current_span.reset(span_token)
+			current_collector.reset(collector_token)
+			self.finish(span)
+
+	@contextlib.contextmanager
+	def activate(self):
+		"""
+		Collect the spans of all instrumented code that runs in the block
+		"""
+		token = current_collector.set(self)
+		try:
+			yield self
+		finally:
+			current_collector.reset(token)
+
+	def finish(self, span):
+		for hook in self.after_hooks:
+			hook(span)
+		with self.lock:
+			if span.trace_id in self.flushed:
+				spans = [span]
+			else:
+				self.pending.setdefault(span.trace_id, list()).append(span)
+				if span.parent_id is not None:
+					return
+				spans = self.pending.pop(span.trace_id)
+				self.traces.append(spans)
+				self.flushed[span.trace_id] = True
+				if len(self.flushed) > self.max_flushed:
+					self.flushed.popitem(last = False)
+		for exporter in self.exporters:
+			try:
+				exporter(spans)
+			except Exception as e:
+				logger.warning(f"Span exporter {exporter!r} failed: {e}")
+
+	def last_trace(self):
+		with self.lock:
+			return list(self.traces[-1]) if self.traces else None
+
+
+def span(name, **attributes):
+	"""
+	Time the block as a span of the active SpanCollector, or do nothing when spans are not being collected
+	"""
+	collector = current_collector.get()
+	if collector is None:
+		return null_span
+	return collector.span(name, **attributes)
+
+
+def traced(name = None):
+	"""
+	Decorator that times every call of a function as a span named name (the function name by default) while spans are
+	collected. The collector is the active one, or the span_collector attribute of the first argument for methods
+	"""
+	def decorate(fun):
+		span_name = name or fun.__name__
+
+		@functools.wraps(fun)
+		def wrapper(*args, **kwargs):
+			collector = current_collector.get()
+			if collector is None and args:
+				collector = getattr(args[0], "span_collector", None)
+			if collector is None:
+				return fun(*args, **kwargs)
+			with collector.span(span_name):
+				return fun(*args, **kwargs)
+		return wrapper
+	return decorate
+
+
+def timed(fun):
+	"""
+	fun itself while spans are not collected, otherwise a wrapper that times each call as a span named after fun.
+	For hot helpers like clean_custom_field, which stay undecorated so they cost nothing extra outside a collector.
+	Resolve it once before a hot loop
+	"""
+	collector = current_collector.get()
+	if collector is None:
+		return fun
+
+	@functools.wraps(fun)
+	def wrapper(*args, **kwargs):
+		with collector.span(fun.__name__):
+			return fun(*args, **kwargs)
+	return wrapper
+
+
+def run_in_context(fun):
+	"""
+	Wrap fun so it runs in a copy of the calling context, so spans opened on a worker thread nest under the caller's span
+	and its calls reach the caller's tracers
+	"""
+	if current_collector.get() is None and not current_tracers.get():
+		return fun
+	return functools.partial(contextvars.copy_context().run, fun)
+
+
+def format_trace(spans):
+	"""
+	Render the spans of one trace as an indented tree with durations in milliseconds
+	"""
+	children = dict()
+	for span in sorted(spans, key = lambda span: span.start_ns):
+		children.setdefault(span.parent_id, list()).append(span)
+	lines = list()
+
+	def walk(parent_id, depth):
+		for span in children.get(parent_id, list()):
+			attributes = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+			lines.append(f"{'  ' * depth}{span.name} {1000 * (span.duration or 0):.3f} ms {attributes}".rstrip())
+			walk(span.span_id, depth + 1)
+	ids = set(span.span_id for span in spans)
+	for root in [span for span in spans if span.parent_id not in ids]:
+		lines.append(f"{root.name} {1000 * (root.duration or 0):.3f} ms")
+		walk(root.span_id, 1)
+	return "\n".join(lines)
+
+
+class OpenTelemetryExporter:
+	"""
+	Span exporter that replays each finished trace into an OpenTelemetry tracer, keeping the nesting and the timestamps,
+	so the spans reach whatever SpanProcessor and exporter the application configured. Needs opentelemetry-api
+	"""
+	def __init__(self, tracer = None):
+		from opentelemetry import trace
+		self.trace = trace
+		self.tracer = tracer or trace.get_tracer("gap_client")
+
+	def __call__(self, spans):
+		started = dict()
+		for span in sorted(spans, key = lambda span: span.start_ns):
+			parent = started.get(span.parent_id)
+			context = self.trace.set_span_in_context(parent) if parent is not None else None
+			attributes = {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in span.attributes.items()}
+			started[span.span_id] = self.tracer.start_span(span.name, context = context, attributes = attributes, start_time = span.start_ns)
+			if span.error:
+				started[span.span_id].set_status(self.trace.Status(self.trace.StatusCode.ERROR, span.error))
+		for span in spans:
+			started[span.span_id].end(end_time = span.end_ns)
+
+
+class Capture:
+	"""
+	Result of a profiling capture, see capture()
+	"""
+	def __init__(self, mode):
+		self.mode = mode
+		self.profile = None
+		self.snapshot = None
+		self.peak_bytes = None
+		self.duration = None
+
+	def report(self, limit:int = 20):
+		"""
+		The top limit entries: functions by cumulative time for cprofile, allocation sites by size for tracemalloc
+		"""
+		if self.mode == "cprofile":
+			import pstats
+			out = io.StringIO()
+			pstats.Stats(self.profile, stream = out).sort_stats("cumulative").print_stats(limit)
+			return out.getvalue()
+		lines = [f"peak {self.peak_bytes} bytes"]
+		for stat in self.snapshot.statistics("lineno")[:limit]:
+			lines.append(str(stat))
+		return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def capture(mode = "cprofile"):
+	"""
+	Profile the block with cProfile (mode "cprofile") or record its allocations with tracemalloc (mode "tracemalloc").
+	Meant for a single call, both slow the code down. Yields a Capture that is filled in when the block ends
+	"""
+	if mode not in ("cprofile", "tracemalloc"):
+		raise ValueError(f"Unknown capture mode '{mode}'")
+	result = Capture(mode)
+	start = time.perf_counter()
+	if mode == "cprofile":
+		import cProfile
+		result.profile = cProfile.Profile()
+		result.profile.enable()
+		try:
+			yield result
+		finally:
+			result.profile.disable()
+			result.duration = time.perf_counter() - start
+		return
+	import tracemalloc
+	was_tracing = tracemalloc.is_tracing()
+	if not was_tracing:
+		tracemalloc.start()
+	tracemalloc.reset_peak()
+	try:
+		yield result
+	finally:
+		result.snapshot = tracemalloc.take_snapshot()
+		result.peak_bytes = tracemalloc.get_traced_memory()[1]
+		result.duration = time.perf_counter() - start
+		if not was_tracing:
+			tracemalloc.stop()
@@ -0,0 +1,137 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+try:
+	import fcntl
+except ImportError:
+	# Not available on Windows, the cache then works without locking
+	fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+default_token_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "gap_client", "tokens")
+
+
+class FileTokenCache:
+	"""
+	On-disk OAuth2 access token cache that is shared by all processes of the user.
+	Tokens are stored one file per (token_url, client_id, scope, resource) and are reused until they are
+	within leeway seconds of expiring. Every key has a lock file, held while a process reads the cache and, on a miss,
+	fetches a new token, so many workers starting at once result in a single token request
+	"""
+	def __init__(self, path:str = None, leeway:float = 60.0):
+		self.path = path or default_token_cache_dir
+		self.leeway = leeway
+
+	def key(self, token_url, client_id, scope, resource):
+		raw = json.dumps([token_url, client_id, scope, resource])
+		return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+	def token_file(self, key):
+		return os.path.join(self.path, f"{key}.json")
+
+	@contextlib.contextmanager
+	def locked(self, key):
+		"""
+		Hold the cross-process lock for this key
+		"""
+		os.makedirs(self.path, mode=0o700, exist_ok=True)
+		with open(os.path.join(self.path, f"{key}.lock"), "a") as lock_file:
+			if fcntl:
+				fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				if fcntl:
+					fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+	def try_lock(self, key):
+		"""
+		Take the cross-process lock for this key without waiting. Returns a handle for unlock, or None when another
+		holder has it. For event loops, which must not block in locked()
+		"""
+		os.makedirs(self.path, mode=0o700, exist_ok=True)
+		lock_file = open(os.path.join(self.path, f"{key}.lock"), "a")
+		if fcntl:
+			try:
+				fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except BlockingIOError:
+				lock_file.close()
+				return None
+		return lock_file
+
+	def unlock(self, handle):
+		try:
+			if fcntl:
+				fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+		finally:
+			handle.close()
+
+	def load(self, key):
+		"""
+		Return the cached token entry for this key, or None when it is missing, unreadable or about to expire
+		"""
+		try:
+			with open(self.token_file(key), "r") as f:
+				entry = json.load(f)
+		except FileNotFoundError:
+			return None
+		except (OSError, ValueError) as e:
+			logger.warning(f"Ignoring unreadable token cache entry {key}: {e}")
+			return None
+		expires_at = entry.get("expires_at")
+		if not entry.get("access_token") or not expires_at or expires_at - self.leeway <= time.time():
+			return None
+		return entry
+
+	def save(self, key, access_token, expires_at, token_type = "Bearer", scope = None):
+		"""
+		Store a token, replacing the file atomically so readers never see half an entry
+		"""
+		entry = {
+			  "access_token": access_token
+			, "expires_at": expires_at
+			, "token_type": token_type
+			, "scope": scope
+		}
+		os.makedirs(self.path, mode=0o700, exist_ok=True)
+		fd, tmp_name = tempfile.mkstemp(dir=self.path, prefix=f".{key}.", suffix=".tmp")
+		try:
+			with os.fdopen(fd, "w") as f:
+				json.dump(entry, f)
+			os.replace(tmp_name, self.token_file(key))
+		except OSError as e:
+			logger.warning(f"Could not write token cache entry {key}: {e}")
+			with contextlib.suppress(OSError):
+				os.remove(tmp_name)
+
+	def clear(self, key):
+		with contextlib.suppress(FileNotFoundError):
+			os.remove(self.token_file(key))
+
+
+def make_token_cache(token_cache):
+	"""
+	Turn the token_cache client parameter into a FileTokenCache: True for the default location, a path, or a ready made cache
+	"""
+	if not token_cache:
+		return None
+	if isinstance(token_cache, FileTokenCache):
+		return token_cache
+	if token_cache is True:
+		return FileTokenCache()
+	return FileTokenCache(path=str(token_cache))
+
+
+def __getattr__(name):
+	# CachedClientCredentialsAuth moved to oauth, which is only imported when it is used
+	if name == "CachedClientCredentialsAuth":
+		from .oauth import CachedClientCredentialsAuth
+		return CachedClientCredentialsAuth
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,137 @@
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Default number of exchanges a WireTracer keeps in memory
+default_trace_size = 100
+
+# Default number of bytes kept of each request and response body
+default_trace_body_bytes = 4096
+
+# Headers whose values are never written to a trace
+default_redacted_headers = ("authorization", "cookie", "set-cookie", "proxy-authorization")
+
+# (session, tracer) pairs of the tracing() blocks open in this thread or task, so a tracer only sees the calls made
+# in its block and on the worker threads the block hands its context to (spans.run_in_context)
+current_tracers = contextvars.ContextVar("gap_client_current_tracers", default = tuple())
+
+
+def body_text(body, max_bytes = default_trace_body_bytes):
+	"""
+	Render a request or response body for a trace, cut to max_bytes
+	"""
+	if body is None:
+		return None
+	if isinstance(body, str):
+		body = body.encode("utf-8", errors = "replace")
+	if not isinstance(body, (bytes, bytearray)):
+		return f"<{type(body).__name__}>"
+	text = bytes(body[:max_bytes]).decode("utf-8", errors = "replace")
+	if len(body) > max_bytes:
+		text += f"... ({len(body)} bytes)"
+	return text
+
+
+class WireTracer:
+	"""
+	Captures the wire data of HTTP exchanges (method, url, headers, bodies, status and timing) into a ring buffer of the
+	last maxlen exchanges, and with path also appends them to that file as JSON lines. Values of the redacted headers are
+	replaced by "<redacted>". Attach it to calls with Client.tracing()
+	"""
+	def __init__(self, maxlen:int = default_trace_size, path:str = None, max_body_bytes:int = default_trace_body_bytes, redacted_headers = default_redacted_headers):
+		self.entries = collections.deque(maxlen = maxlen)
+		self.path = path
+		self.max_body_bytes = max_body_bytes
+		self.redacted_headers = set(header.lower() for header in redacted_headers or list())
+		self.lock = threading.Lock()
+		self.file = open(path, "a", encoding = "utf-8") if path else None
+
+	def close(self):
+		with self.lock:
+			if self.file:
+				self.file.close()
+				self.file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def headers(self, headers):
+		return {k: "<redacted>" if k.lower() in self.redacted_headers else v for k, v in (headers or dict()).items()}
+
+	def record(self, request, response = None, error = None, elapsed = None, streamed = False):
+		"""
+		Record one exchange of a requests.PreparedRequest and its requests.Response, or the error that replaced the response
+		"""
+		entry = {
+			  "time": time.time()
+			, "method": request.method
+			, "url": request.url
+			, "request_headers": self.headers(request.headers)
+			, "request_body": body_text(request.body, self.max_body_bytes)
+			, "status": None
+			, "response_headers": None
+			, "response_body": None
+			, "elapsed": elapsed
+			, "error": None if error is None else str(error)
+		}
+		if response is not None:
+			entry["status"] = response.status_code
+			entry["response_headers"] = self.headers(response.headers)
+			# Reading a streamed body here would consume it before the caller gets to it
+			entry["response_body"] = "<streamed>" if streamed else body_text(response.content, self.max_body_bytes)
+		with self.lock:
+			self.entries.append(entry)
+			if self.file:
+				self.file.write(json.dumps(entry, default = str) + "\n")
+				self.file.flush()
+		return entry
+
+	def exchanges(self):
+		"""
+		The exchanges in the ring buffer, oldest first
+		"""
+		with self.lock:
+			return list(self.entries)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+
+@contextlib.contextmanager
+def tracing(session, tracer:WireTracer = None, **kwargs):
+	"""
+	Trace the calls made through session (a transport.GapSession) in the block, including those of the worker threads
+	it starts. Calls that other threads make on the same session are not recorded.
+	Without a tracer a new WireTracer is made from kwargs and closed afterwards. Yields the tracer
+	"""
+	own = tracer is None
+	if own:
+		tracer = WireTracer(**kwargs)
+	token = current_tracers.set(current_tracers.get() + ((session, tracer),))
+	try:
+		yield tracer
+	finally:
+		current_tracers.reset(token)
+		if own:
+			tracer.close()
+
+
+def session_tracers(session):
+	"""
+	The tracers of the tracing() blocks open for session in this context
+	"""
+	pairs = current_tracers.get()
+	if not pairs:
+		return pairs
+	return tuple(tracer for traced_session, tracer in pairs if traced_session is session)
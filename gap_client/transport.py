@@ -0,0 +1,207 @@
+import logging
+import threading
+import time
+import requests
+import requests.adapters
+import urllib3
+import urllib3.connection
+
+from .metrics import *
+from .spans import current_collector, span
+from .tracing import session_tracers
+from .retry import *
+
+logger = logging.getLogger(__name__)
+
+
+# Defaults match what requests uses for a bare Session
+default_pool_connections = 10
+default_pool_maxsize = 10
+
+
+class CountingConnectionMixin:
+	"""
+	Counts every socket connect (and so every TCP/TLS handshake) on the pool that owns the connection.
+	urllib3 silently reconnects a pooled connection that the server closed, which its own num_connections does not see
+	"""
+	def connect(self):
+		with span("connect", host = self.host):
+			super().connect()
+		pool = getattr(self, "gap_pool", None)
+		if pool is not None:
+			pool.count_connect()
+
+
+class CountingPoolMixin:
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.num_connects = 0
+		self.connects_lock = threading.Lock()
+
+	def _new_conn(self):
+		conn = super()._new_conn()
+		conn.gap_pool = self
+		return conn
+
+	def count_connect(self):
+		with self.connects_lock:
+			self.num_connects += 1
+
+
+class CountingHTTPConnection(CountingConnectionMixin, urllib3.connection.HTTPConnection):
+	pass
+
+
+class CountingHTTPSConnection(CountingConnectionMixin, urllib3.connection.HTTPSConnection):
+	pass
+
+
+class CountingHTTPConnectionPool(CountingPoolMixin, urllib3.HTTPConnectionPool):
+	ConnectionCls = CountingHTTPConnection
+
+
+class CountingHTTPSConnectionPool(CountingPoolMixin, urllib3.HTTPSConnectionPool):
+	ConnectionCls = CountingHTTPSConnection
+
+
+class PooledAdapter(requests.adapters.HTTPAdapter):
+	"""
+	HTTPAdapter whose pools count socket connects, see pool_stats
+	"""
+	def init_poolmanager(self, *args, **kwargs):
+		super().init_poolmanager(*args, **kwargs)
+		self.poolmanager.pool_classes_by_scheme = {
+			  "http": CountingHTTPConnectionPool
+			, "https": CountingHTTPSConnectionPool
+		}
+
+
+class GapSession(requests.Session):
+	"""
+	requests session that retries failed calls according to retry_policy, within the shared retry_budget.
+	Every call accepts an extra retry parameter to override the policy for that call, where retry=False disables retries.
+	Inside a tracing.tracing() block for this session, every exchange on the wire (each retry and redirect included) is
+	recorded by its tracer, and with a metrics registry it is counted under its endpoint
+	"""
+	retry_policy = None
+	retry_budget = None
+	metrics = None
+
+	def send(self, request, **kwargs):
+		tracers = session_tracers(self)
+		metrics = self.metrics
+		collector = current_collector.get()
+		if not tracers and metrics is None and collector is None:
+			return super().send(request, **kwargs)
+		if collector is not None:
+			with collector.span("http", method = request.method, endpoint = endpoint_name(request.method, request.url)) as http_span:
+				res = self.observed_send(request, tracers, metrics, **kwargs)
+				http_span.set("status", res.status_code)
+				# Time until the response headers were parsed, connecting and sending included
+				http_span.set("server_time", res.elapsed.total_seconds())
+				return res
+		return self.observed_send(request, tracers, metrics, **kwargs)
+
+	def observed_send(self, request, tracers, metrics, **kwargs):
+		start = time.perf_counter()
+		try:
+			res = super().send(request, **kwargs)
+		except Exception as e:
+			elapsed = time.perf_counter() - start
+			for tracer in tracers:
+				tracer.record(request, error = e, elapsed = elapsed)
+			if metrics is not None:
+				metrics.observe_request(endpoint_name(request.method, request.url), None, elapsed, body_size(request.body), error = e)
+			raise
+		elapsed = time.perf_counter() - start
+		streamed = kwargs.get("stream", False)
+		for tracer in tracers:
+			tracer.record(request, res, elapsed = elapsed, streamed = streamed)
+		if metrics is not None:
+			# A streamed body has not been read yet, its size is only known from the header
+			received = int(res.headers.get("Content-Length") or 0) if streamed else len(res.content or b"")
+			metrics.observe_request(endpoint_name(request.method, request.url), res.status_code, elapsed, body_size(request.body), received)
+		return res
+
+	def request(self, method, url, *args, retry = None, **kwargs):
+		policy = self.retry_policy if retry is None else retry
+		if self.retry_budget:
+			self.retry_budget.deposit()
+		if not policy or policy.max_attempts <= 1 or not policy.can_retry_method(method):
+			return super().request(method, url, *args, **kwargs)
+		extra_headers = policy.idempotency_headers(method)
+		if extra_headers:
+			kwargs["headers"] = dict(kwargs.get("headers") or dict(), **extra_headers)
+		attempt = 1
+		while True:
+			try:
+				res = super().request(method, url, *args, **kwargs)
+			except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+				if attempt >= policy.max_attempts or (self.retry_budget and not self.retry_budget.withdraw()):
+					raise
+				delay = policy.delay(attempt)
+				reason = str(e)
+			else:
+				if not policy.can_retry_status(res.status_code) or attempt >= policy.max_attempts or (self.retry_budget and not self.retry_budget.withdraw()):
+					return res
+				delay = policy.delay(attempt, parse_retry_after(res.headers.get("Retry-After")))
+				reason = f"status {res.status_code}"
+				res.close()
+			logger.warning(f"Retrying {method} {url} in {delay:.2f}s after attempt {attempt}/{policy.max_attempts} failed with {reason}")
+			if self.metrics is not None:
+				self.metrics.observe_retry(endpoint_name(method, url))
+			time.sleep(delay)
+			attempt += 1
+
+
+def make_session(pool_connections:int = default_pool_connections, pool_maxsize:int = default_pool_maxsize, pool_block:bool = False, keep_alive:bool = True, retry_policy:RetryPolicy = None, retry_budget:RetryBudget = None, metrics:MetricsRegistry = None):
+	"""
+	Create the requests session used by the client, with one pooled adapter for both http and https.
+	pool_connections is how many hosts get their own pool, pool_maxsize how many connections are kept per host and
+	pool_block whether a request waits for a free connection instead of opening a throwaway one when the pool is exhausted.
+	With keep_alive off the server is asked to close each connection after the response.
+	retry_policy and retry_budget configure retries, see GapSession. Calls are counted in metrics when given
+	"""
+	session = GapSession()
+	session.retry_policy = retry_policy
+	session.retry_budget = retry_budget
+	session.metrics = metrics
+	adapter = PooledAdapter(pool_connections = pool_connections, pool_maxsize = pool_maxsize, pool_block = pool_block)
+	session.mount("https://", adapter)
+	session.mount("http://", adapter)
+	if not keep_alive:
+		session.headers["Connection"] = "close"
+	return session
+
+
+def pool_stats(session):
+	"""
+	Sum up the connection statistics of all urllib3 pools behind the session.
+	connections_created counts new connections (each a TCP and possibly TLS handshake), connections_reused the
+	requests that went out on a connection that was already open
+	"""
+	stats = {
+		  "pools": 0
+		, "requests": 0
+		, "connections_created": 0
+		, "connections_reused": 0
+		, "connections_idle": 0
+	}
+	if not session:
+		return stats
+	seen = set()
+	for adapter in session.adapters.values():
+		manager = getattr(adapter, "poolmanager", None)
+		if manager is None or id(adapter) in seen:
+			continue
+		seen.add(id(adapter))
+		for key in list(manager.pools.keys()):
+			pool = manager.pools.get(key)
+			if pool is None:
+				continue
+			stats["pools"] += 1
+			stats["requests"] += pool.num_requests
+			stats["connections_created"] += getattr(pool, "num_connects", pool.num_connections)
+			stats["connections_idle"] += pool.pool.qsize() if pool.pool else 0
+	stats["connections_reused"] = max(0, stats["requests"] - stats["connections_created"])
+	return stats
@@ -0,0 +1,243 @@
+#!/bin/env python
+"""
+Micro-benchmarks for the CPU heavy helpers in gap_client.helpers.
+
+Every case runs one helper over all rows of a data set: the checked-in tests/data/SoA.csv and synthetic versions of it
+that are scaled up in rows and cell size. For each case the best time per input over a few repeats, the peak traced
+allocation of one pass and the number of allocated blocks it leaks are recorded.
+
+Timings are divided by the time of a fixed pure Python calibration loop, so a baseline saved on one machine can be
+checked on another. baseline.json holds the numbers of the current code; refresh it with
+	python -m tests.bench.bench --save
+after a change that is meant to alter them.
+"""
+import argparse
+import csv
+import gc
+import json
+import logging
+import math
+import os
+import random
+import timeit
+import tracemalloc
+import gap_client as gap
+
+logger = logging.getLogger(__name__)
+
+
+here = os.path.dirname(__file__)
+soa_csv = os.path.join(here, "..", "data", "SoA.csv")
+baseline_file = os.path.join(here, "baseline.json")
+
+# How much slower or bigger than the baseline a case may get before it counts as a regression
+# Noisy shared machines can loosen them with GAP_BENCH_TIME_THRESHOLD and GAP_BENCH_MEMORY_THRESHOLD
+default_time_threshold = float(os.environ.get("GAP_BENCH_TIME_THRESHOLD") or 2.0)
+default_memory_threshold = float(os.environ.get("GAP_BENCH_MEMORY_THRESHOLD") or 1.25)
+
+# Below these values differences are noise and never count as a regression
+noise_floor = {
+	  "us_per_input": 1.0
+	, "peak_bytes": 16384
+	, "leaked_blocks": 64
+}
+
+default_repeat = 3
+default_min_seconds = 0.05
+
+
+def load_soa_rows(path = soa_csv):
+	with open(path, "r", encoding='utf-8-sig') as csvfile:
+		return list(csv.DictReader(csvfile, delimiter=',', quotechar='"'))
+
+
+def scale_rows(rows, factor, cell_factor = 1, seed = 1):
+	"""
+	Make a bigger synthetic SoA: factor times the rows, with every text cell repeated cell_factor times and some links added
+	"""
+	rng = random.Random(seed)
+	out = list()
+	for n in range(factor):
+		for row in rows:
+			row = dict(row)
+			row["Title"] = f"{row.get('Title')} ({n})" if n else row.get("Title")
+			for key in ("Explanation", "Control Description", "Comments"):
+				value = row.get(key) or ""
+				if value and cell_factor > 1:
+					value = " ".join([value] * cell_factor)
+				if rng.random() < 0.2:
+					value += f' <a href="https://example.com/doc/{rng.randrange(10000)}">Document {n}</a>'
+				row[key] = value
+			out.append(row)
+	return out
+
+
+def data_sets():
+	rows = load_soa_rows()
+	return {
+		  "soa": rows
+		, "soa_x4": scale_rows(rows, 4)
+		, "soa_wide": scale_rows(rows, 1, cell_factor = 8)
+	}
+
+
+def html_cells(rows):
+	return [value for row in rows for key, value in row.items() if key in ("Explanation", "Control Objectives", "Comments") and value]
+
+
+def goal_bodies(rows):
+	return [{"title": row.get("Title"), "description": row.get("Comments"), "guide": row.get("Explanation"), "documentation": row.get("Control Objectives"), "parent_id": 1} for row in rows if row.get("Title")]
+
+
+def goal_records(rows):
+	return [dict(body, id=i, status="not_started", note=None, settings=dict()) for i, body in enumerate(goal_bodies(rows))]
+
+
+def custom_field_records(rows):
+	return [{"name": key, "type": "text", "slug": f"{key.lower()}_{i}"} for i, row in enumerate(rows) for key in row if key]
+
+
+# Each case is (helper, function turning the rows into the helper's inputs)
+cases = {
+	  "map_audit_goal": (gap.map_audit_goal, lambda rows: rows)
+	, "clean_mapped": (gap.clean_mapped, lambda rows: rows)
+	, "extract_links": (gap.extract_links, html_cells)
+	, "has_visible_content": (gap.has_visible_content, html_cells)
+	, "clean_audit_goal_out": (gap.clean_audit_goal_out, goal_bodies)
+	, "clean_audit_goal_in": (gap.clean_audit_goal_in, goal_records)
+	, "clean_custom_field": (gap.clean_custom_field, custom_field_records)
+}
+
+
+def calibrate(repeat = 15):
+	"""
+	Seconds taken by a fixed pure Python loop, the yardstick that makes timings comparable between machines
+	"""
+	def work():
+		d = dict()
+		for i in range(20000):
+			d[str(i)] = i * 2
+		return sum(len(k) for k in d)
+	return min(timeit.repeat(work, number = 5, repeat = repeat))
+
+
+def measure(fun, inputs, repeat = default_repeat, min_seconds = default_min_seconds):
+	"""
+	Best seconds per input over repeat passes, and the peak traced bytes and the allocated blocks a pass leaves behind once garbage is collected
+	"""
+	def one_pass():
+		# Every pass starts cold, so only repeats within the data set are served from the cache
+		gap.html_cache.clear()
+		for item in inputs:
+			fun(item)
+	timer = timeit.Timer(one_pass)
+	# Run each repeat for at least min_seconds so that fast helpers are not dominated by timer noise
+	first = timer.timeit(number = 1)
+	number = max(1, math.ceil(min_seconds / max(first, 1e-9)))
+	seconds = min(timer.repeat(number = number, repeat = repeat)) / number
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	one_pass()
+	peak = tracemalloc.get_traced_memory()[1]
+	# What the cache holds on to is kept on purpose, not leaked
+	gap.html_cache.clear()
+	gc.collect()
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+	blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+	n = max(1, len(inputs))
+	return {
+		  "inputs": len(inputs)
+		, "us_per_input": 1e6 * seconds / n
+		, "peak_bytes": peak
+		, "leaked_blocks": blocks
+	}
+
+
+def run_benchmarks(names = None, sets = None, repeat = default_repeat):
+	"""
+	Run the selected cases over the selected data sets. Returns {"calibration_s":..., "results": {"case/set": {...}}}
+	"""
+	gap_logger = logging.getLogger("gap_client")
+	level = gap_logger.level
+	# Keep log output out of the timings
+	gap_logger.setLevel(logging.WARNING)
+	try:
+		calibration = calibrate()
+		all_sets = data_sets()
+		results = dict()
+		for name in names or cases:
+			fun, make_inputs = cases[name]
+			for set_name in sets or all_sets:
+				inputs = make_inputs(all_sets[set_name])
+				results[f"{name}/{set_name}"] = measure(fun, inputs, repeat = repeat)
+		# The best of a calibration before and after the cases, in case the machine was busy during one of them
+		return {"calibration_s": min(calibration, calibrate()), "results": results}
+	finally:
+		gap_logger.setLevel(level)
+
+
+def load_baseline(path = baseline_file):
+	try:
+		with open(path, "r") as f:
+			return json.load(f)
+	except FileNotFoundError:
+		return None
+
+
+def save_baseline(report, path = baseline_file):
+	with open(path, "w") as f:
+		json.dump(report, f, indent=2, sort_keys=True)
+		f.write("\n")
+
+
+def compare(report, baseline, time_threshold = default_time_threshold, memory_threshold = default_memory_threshold):
+	"""
+	List the regressions of report against baseline as (key, metric, baseline value, new value, ratio)
+	"""
+	regressions = list()
+	speed = baseline["calibration_s"] / report["calibration_s"]
+	for key, new in report["results"].items():
+		old = baseline["results"].get(key)
+		if not old:
+			continue
+		checks = [
+			  ("us_per_input", old["us_per_input"], new["us_per_input"] * speed, time_threshold)
+			, ("peak_bytes", old["peak_bytes"], new["peak_bytes"], memory_threshold)
+			, ("leaked_blocks", old["leaked_blocks"], new["leaked_blocks"], memory_threshold)
+		]
+		for metric, old_value, new_value, threshold in checks:
+			if old_value and new_value > noise_floor[metric] and new_value / old_value > threshold:
+				regressions.append((key, metric, old_value, new_value, new_value / old_value))
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Micro-benchmarks for gap_client.helpers")
+	parser.add_argument("--case", action="append", choices=sorted(cases), help="Only run this case, may be repeated")
+	parser.add_argument("--repeat", type=int, default=default_repeat)
+	parser.add_argument("--save", action="store_true", help="Store the results as the new baseline")
+	parser.add_argument("--time-threshold", type=float, default=default_time_threshold)
+	parser.add_argument("--memory-threshold", type=float, default=default_memory_threshold)
+	args = parser.parse_args()
+	report = run_benchmarks(names=args.case, repeat=args.repeat)
+	for key, result in sorted(report["results"].items()):
+		print(f"{key:40} {result['us_per_input']:10.1f} us/input {result['peak_bytes']:10d} peak bytes {result['leaked_blocks']:8d} leaked blocks")
+	if args.save:
+		save_baseline(report)
+		print(f"Saved baseline to {baseline_file}")
+		return
+	baseline = load_baseline()
+	if not baseline:
+		print("No baseline yet, run with --save to store one")
+		return
+	regressions = compare(report, baseline, time_threshold=args.time_threshold, memory_threshold=args.memory_threshold)
+	for key, metric, old_value, new_value, ratio in regressions:
+		print(f"REGRESSION {key} {metric}: {old_value:.1f} -> {new_value:.1f} ({ratio:.2f}x)")
+	if regressions:
+		raise SystemExit(1)
+
+
+if __name__ == "__main__":
+	main()
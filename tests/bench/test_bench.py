@@ -0,0 +1,41 @@
+import copy
+import logging
+import pytest
+from .bench import cases, compare, load_baseline, run_benchmarks
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+@pytest.fixture(scope='module')
+def baseline():
+	baseline = load_baseline()
+	if not baseline:
+		pytest.skip("No benchmark baseline, run python -m tests.bench.bench --save")
+	return baseline
+
+
+# Test cases
+#######################################################################
+
+
+def test_compare_flags_regressions(baseline):
+	report = copy.deepcopy(baseline)
+	assert compare(report, baseline) == list()
+	key = "map_audit_goal/soa"
+	report["results"][key]["us_per_input"] *= 3
+	report["results"][key]["peak_bytes"] *= 2
+	regressions = compare(report, baseline)
+	assert {(k, metric) for k, metric, old, new, ratio in regressions} == {(key, "us_per_input"), (key, "peak_bytes")}
+
+
+@pytest.mark.parametrize("name", sorted(cases))
+def test_no_regression(baseline, name):
+	report = run_benchmarks(names=[name], sets=["soa"], repeat=2)
+	regressions = compare(report, baseline)
+	for key, metric, old, new, ratio in regressions:
+		logger.warning(f"{key} {metric}: {old:.1f} -> {new:.1f} ({ratio:.2f}x)")
+	assert not regressions, regressions
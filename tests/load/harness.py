@@ -0,0 +1,311 @@
+#!/bin/env python
+"""
+Load harness for gap_client.Client.
+
+Runs a scenario with N concurrent workers sharing one client against the offline mock GAP API (or any server given
+with --base-url) and reports throughput, p50/p95/p99 latency per operation and per endpoint, error counts and the
+client side CPU and memory use. The report is JSON so runs of different client versions can be compared.
+
+Run it from the repository root, for example:
+	python -m tests.load.harness --scenario mixed --workers 8 --duration 10 --latency 0.02 --output load.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import gap_client as gap
+from ..mock_server import MockGapConfig, MockGapServer, mock_account_id, mock_token
+
+try:
+	import resource
+except ImportError:
+	# Not available on Windows, the report then has no peak RSS
+	resource = None
+
+logger = logging.getLogger(__name__)
+
+
+percentiles = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+	"""
+	Nearest-rank percentile of an already sorted list
+	"""
+	if not sorted_values:
+		return None
+	rank = max(1, -(-len(sorted_values) * p // 100))
+	return sorted_values[int(rank) - 1]
+
+
+def endpoint_of(method, url):
+	"""
+	Name an endpoint by method and path, with account and record ids replaced so calls group together
+	"""
+	path = re.sub(r"^[a-z]+://[^/]+", "", url).split("?")[0]
+	path = re.sub(r"/api-v1/[^/]+/", "/api-v1/{account}/", path)
+	path = re.sub(r"/\d+(?=/|$)", "/{id}", path)
+	return f"{method} {path}"
+
+
+class LatencyRecorder:
+	"""
+	Collects latencies and errors by name from many threads
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.latencies = dict()
+		self.errors = dict()
+		self.statuses = dict()
+
+	def record(self, name, seconds, error = None, status = None):
+		with self.lock:
+			self.latencies.setdefault(name, list()).append(seconds)
+			if error:
+				self.errors[name] = self.errors.get(name, 0) + 1
+			if status is not None:
+				statuses = self.statuses.setdefault(name, dict())
+				statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+	def summary(self, elapsed):
+		with self.lock:
+			names = sorted(self.latencies)
+			out = dict()
+			for name in names:
+				values = sorted(self.latencies[name])
+				entry = {
+					  "count": len(values)
+					, "errors": self.errors.get(name, 0)
+					, "throughput": len(values) / elapsed if elapsed else None
+					, "mean_ms": 1000 * sum(values) / len(values)
+					, "max_ms": 1000 * values[-1]
+				}
+				for p in percentiles:
+					entry[f"p{p}_ms"] = 1000 * percentile(values, p)
+				if name in self.statuses:
+					entry["statuses"] = dict(self.statuses[name])
+				out[name] = entry
+			return out
+
+
+def record_endpoints(session, recorder):
+	"""
+	Hook the session so every HTTP attempt, retries included, is recorded under its endpoint
+	"""
+	def on_response(res, *args, **kwargs):
+		recorder.record(endpoint_of(res.request.method, res.request.url), res.elapsed.total_seconds(), error = res.status_code >= 400, status = res.status_code)
+	session.hooks["response"].append(on_response)
+
+
+# Scenarios
+#######################################################################
+
+
+class ScenarioContext:
+	"""
+	What a scenario step gets to work with: the shared client, a per-worker random generator and the known titles
+	"""
+	def __init__(self, client, rng, titles, worker):
+		self.client = client
+		self.rng = rng
+		self.titles = titles
+		self.worker = worker
+		self.counter = 0
+
+	def new_title(self):
+		self.counter += 1
+		return f"Load goal w{self.worker}-{self.counter}"
+
+
+def step_list(ctx):
+	return "get_audit_goals", ctx.client.get_audit_goals()
+
+
+def step_lookup(ctx):
+	return "find_audit_goal_by_title", ctx.client.find_audit_goal_by_title(ctx.rng.choice(ctx.titles))
+
+
+def step_bulk_upsert(ctx, size = 10):
+	bodies = list()
+	for i in range(size):
+		# Roughly half patch existing goals and half create new ones
+		title = ctx.rng.choice(ctx.titles) if ctx.rng.random() < 0.5 else ctx.new_title()
+		bodies.append({"title": title, "description": f"Load test {ctx.rng.random()}"})
+	results, err = ctx.client.upsert_audit_goals(bodies, max_workers = 2)
+	if not err:
+		errs = [result_err for result, result_err in results if result_err]
+		err = errs[0] if errs else None
+	return "upsert_audit_goals", (results, err)
+
+
+def step_create(ctx):
+	return "create_audit_goal", ctx.client.create_audit_goal({"title": ctx.new_title(), "description": "Load test"})
+
+
+def step_patch(ctx):
+	goal, err = ctx.client.find_audit_goal_by_title(ctx.rng.choice(ctx.titles))
+	if not goal:
+		return "patch_audit_goal", (None, err or "No goal to patch")
+	return "patch_audit_goal", ctx.client.patch_audit_goal(goal.get("id"), {"description": f"Load test {ctx.rng.random()}"})
+
+
+# Each scenario is a list of (weight, step)
+scenarios = {
+	  "list": [(1, step_list)]
+	, "lookup": [(1, step_lookup)]
+	, "bulk_upsert": [(1, step_bulk_upsert)]
+	, "mixed": [(2, step_list), (10, step_lookup), (1, step_bulk_upsert), (2, step_create), (5, step_patch)]
+}
+
+
+def pick_step(rng, scenario):
+	steps = scenarios[scenario]
+	return rng.choices([step for weight, step in steps], weights=[weight for weight, step in steps])[0]
+
+
+# Runner
+#######################################################################
+
+
+def cpu_seconds():
+	times = os.times()
+	return times.user + times.system
+
+
+def peak_rss_kb():
+	if not resource:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# ru_maxrss is in bytes on macOS and kilobytes elsewhere
+	return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_load(client, scenario = "mixed", workers = 4, duration = None, iterations = 100, seed = None, trace_memory = False):
+	"""
+	Run scenario on workers threads that share client, either for duration seconds or until iterations steps are done
+	in total. Returns the report as a dict
+	"""
+	if scenario not in scenarios:
+		raise ValueError(f"Unknown scenario {scenario}, choose from {', '.join(scenarios)}")
+	goals, err = client.get_audit_goals()
+	if err:
+		raise RuntimeError(f"Could not list audit goals before the run: {err}")
+	titles = [goal.get("title") for goal in goals if goal.get("title")] or ["No such title"]
+	operations = LatencyRecorder()
+	endpoints = LatencyRecorder()
+	record_endpoints(client.session, endpoints)
+	remaining = [iterations]
+	remaining_lock = threading.Lock()
+	deadline = None
+	def take():
+		if deadline is not None:
+			return time.monotonic() < deadline
+		with remaining_lock:
+			if remaining[0] <= 0:
+				return False
+			remaining[0] -= 1
+			return True
+	def work(worker):
+		rng = random.Random(None if seed is None else seed + worker)
+		ctx = ScenarioContext(client, rng, titles, worker)
+		while take():
+			step = pick_step(rng, scenario)
+			start = time.perf_counter()
+			try:
+				name, (result, err) = step(ctx)
+			except Exception as e:
+				name, err = step.__name__, f"{type(e).__name__}: {e}"
+				logger.warning(f"Worker {worker} step {name} raised {err}")
+			operations.record(name, time.perf_counter() - start, error = err)
+	if trace_memory:
+		tracemalloc.start()
+	cpu_start = cpu_seconds()
+	start = time.perf_counter()
+	if duration:
+		deadline = time.monotonic() + duration
+	threads = [threading.Thread(target=work, args=(worker,), name=f"load-{worker}") for worker in range(workers)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = time.perf_counter() - start
+	cpu = cpu_seconds() - cpu_start
+	traced_peak = None
+	if trace_memory:
+		traced_peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	operation_summary = operations.summary(elapsed)
+	total = sum(entry["count"] for entry in operation_summary.values())
+	return {
+		  "scenario": scenario
+		, "workers": workers
+		, "elapsed_s": elapsed
+		, "operations_total": total
+		, "errors_total": sum(entry["errors"] for entry in operation_summary.values())
+		, "throughput": total / elapsed if elapsed else None
+		, "operations": operation_summary
+		, "endpoints": endpoints.summary(elapsed)
+		, "resources": {
+			  "cpu_s": cpu
+			, "cpu_percent": 100 * cpu / elapsed if elapsed else None
+			, "peak_rss_kb": peak_rss_kb()
+			, "traced_peak_bytes": traced_peak
+		}
+		, "pool": client.pool_stats()
+		, "environment": {
+			  "python": platform.python_version()
+			, "platform": platform.platform()
+			, "gap_client": getattr(gap, "__version__", None)
+		}
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Load test gap_client.Client")
+	parser.add_argument("--scenario", choices=sorted(scenarios), default="mixed")
+	parser.add_argument("--workers", type=int, default=4)
+	parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead of a number of iterations")
+	parser.add_argument("--iterations", type=int, default=200, help="Steps to run in total over all workers")
+	parser.add_argument("--seed", type=int, default=None)
+	parser.add_argument("--trace-memory", action="store_true", help="Also report the peak traced Python allocation, which slows the run down")
+	parser.add_argument("--base-url", default=None, help="Run against this server instead of a local mock server")
+	parser.add_argument("--account-id", default=mock_account_id)
+	parser.add_argument("--token", default=mock_token)
+	parser.add_argument("--per-page", type=int, default=15, help="Mock server page size")
+	parser.add_argument("--latency", type=float, default=0.0, help="Mock server latency in seconds")
+	parser.add_argument("--jitter", type=float, default=0.0, help="Mock server latency jitter in seconds")
+	parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock server calls answered with 500")
+	parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of mock server calls answered with 429")
+	parser.add_argument("--seed-scale", type=int, default=1, help="Repeat the SoA rows this many times on the mock server")
+	parser.add_argument("--output", default=None, help="Write the JSON report here instead of to stdout")
+	args = parser.parse_args()
+	logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+	server = None
+	base_url = args.base_url
+	if not base_url:
+		config = MockGapConfig(per_page=args.per_page, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, throttle_rate=args.throttle_rate, retry_after=0, random_seed=args.seed)
+		server = MockGapServer(config=config, seed_scale=args.seed_scale).start()
+		base_url = server.url
+	try:
+		client = gap.Client(base_url=base_url, client_id=None, client_secret=None, account_id=args.account_id, client_token=args.token, pool_maxsize=max(10, args.workers))
+		report = run_load(client, scenario=args.scenario, workers=args.workers, duration=args.duration, iterations=args.iterations, seed=args.seed, trace_memory=args.trace_memory)
+	finally:
+		if server:
+			server.stop()
+	text = json.dumps(report, indent=2)
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(text)
+	else:
+		print(text)
+
+
+if __name__ == "__main__":
+	main()
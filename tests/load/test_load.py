@@ -0,0 +1,44 @@
+import gap_client as gap
+import json
+import logging
+import pytest
+from ..mock_server import MockGapConfig, MockGapServer, mock_account_id, mock_token
+from .harness import endpoint_of, percentile, run_load, scenarios
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+@pytest.fixture(scope='function')
+def load_client(request):
+	server = MockGapServer(config=MockGapConfig(per_page=25, latency=0.002, random_seed=1)).start()
+	request.addfinalizer(server.stop)
+	return gap.Client(base_url=server.url, client_id="id", client_secret="secret", account_id=mock_account_id, client_token=mock_token)
+
+
+# Test cases
+#######################################################################
+
+
+def test_percentile_and_endpoint_names():
+	values = sorted(range(1, 101))
+	assert [percentile(values, p) for p in (50, 95, 99)] == [50, 95, 99]
+	assert percentile([], 50) is None
+	assert endpoint_of("PUT", "http://x:1/api-v1/7/audit-goals/123?a=b") == "PUT /api-v1/{account}/audit-goals/{id}"
+
+
+@pytest.mark.parametrize("scenario", sorted(scenarios))
+def test_scenario_report(load_client, scenario):
+	report = run_load(load_client, scenario=scenario, workers=4, iterations=12, seed=3)
+	assert report["operations_total"] == 12
+	assert report["errors_total"] == 0, report["operations"]
+	for entry in report["operations"].values():
+		assert entry["p50_ms"] <= entry["p95_ms"] <= entry["p99_ms"]
+	# Lookups are answered from the title index filled before the run, so only the other scenarios reach the server
+	assert bool(report["endpoints"]) == (scenario != "lookup")
+	assert all(name.split(" ")[0] in ("GET", "POST", "PUT") for name in report["endpoints"])
+	assert report["resources"]["cpu_s"] >= 0
+	json.dumps(report)
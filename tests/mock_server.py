@@ -0,0 +1,519 @@
+#!/bin/env python
+"""
+Offline stand-in for the GAP API, for tests and benchmarks on machines without access to the real service.
+
+It implements the endpoints gap_client uses (auth/token, account, audits, audit-goals and custom-fields) on top of
+in-memory data seeded from tests/data/SoA.csv, with Laravel style pagination. Latency, jitter, server errors and 429
+throttling can be injected to see how the client behaves under load.
+
+Run it stand-alone with: python tests/mock_server.py --port 8000 --latency 0.05
+"""
+import argparse
+import csv
+import datetime
+import http.server
+import json
+import logging
+import math
+import os
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+
+here = os.path.dirname(__file__)
+default_soa_csv = os.path.join(here, "data", "SoA.csv")
+
+mock_account_id = "1"
+mock_token = "mock-token"
+
+# Custom fields that the seed puts on the audit goals, the rest of the SoA columns are left for the client to create
+seeded_custom_field_columns = ["Applicable", "Control Owner"]
+
+soa_status = {
+	  "Completely": "completed"
+	, "Partially": "in_progress"
+}
+
+audit_goal_settings = {
+	  "titleBold": False
+	, "included_in_dashboard": True
+	, "descriptionEnabled": True
+	, "guideEnabled": True
+	, "documentationEnabled": True
+	, "general_report": False
+	, "attachments": True
+	, "elementsEnabled": True
+	, "statusEnabled": True
+	, "tasksEnabled": True
+	, "customFieldsEnabled": True
+}
+
+
+def now_text():
+	return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+
+
+def slugify(name):
+	return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+#######################################################################
+
+
+class MockGapConfig:
+	"""
+	Behaviour of the mock server.
+	latency and jitter add latency + uniform(0, jitter) seconds to every response. error_rate is the share of calls that
+	fail with 500 and throttle_rate the share that get 429. rate_limit (calls per second, with a burst of as many calls)
+	throttles like the real API does. Throttled calls carry Retry-After: retry_after
+	"""
+	def __init__(self, per_page:int = 15, latency:float = 0.0, jitter:float = 0.0, error_rate:float = 0.0, throttle_rate:float = 0.0, rate_limit:float = None, retry_after:int = 1, client_id:str = None, client_secret:str = None, token_ttl:int = 3600, random_seed:int = None):
+		self.per_page = per_page
+		self.latency = latency
+		self.jitter = jitter
+		self.error_rate = error_rate
+		self.throttle_rate = throttle_rate
+		self.rate_limit = rate_limit
+		self.retry_after = retry_after
+		self.client_id = client_id
+		self.client_secret = client_secret
+		self.token_ttl = token_ttl
+		self.random_seed = random_seed
+
+
+class MockGapState:
+	"""
+	In-memory data of the mock server. Every collection is keyed by id and kept in creation order
+	"""
+	def __init__(self, account_id = mock_account_id):
+		self.account_id = str(account_id)
+		self.lock = threading.Lock()
+		self.next_id = 1
+		self.audits = dict()
+		self.audit_goals = dict()
+		self.custom_field_groups = dict()
+		self.tokens = {mock_token}
+		self.active_account_id = None
+		self.request_counts = dict()
+
+	def new_id(self):
+		id = self.next_id
+		self.next_id += 1
+		return id
+
+	def count(self, route):
+		with self.lock:
+			self.request_counts[route] = self.request_counts.get(route, 0) + 1
+
+	def add_audit(self, body):
+		with self.lock:
+			audit = dict(body)
+			audit["id"] = self.new_id()
+			audit["account_id"] = self.account_id
+			audit["created_at"] = audit["updated_at"] = now_text()
+			audit.setdefault("overall_status", "not_started")
+			self.audits[audit["id"]] = audit
+			return audit
+
+	def add_audit_goal(self, body):
+		with self.lock:
+			goal = {
+				  "id": self.new_id()
+				, "title": body.get("title")
+				, "parent_id": body.get("parent_id")
+				, "status": body.get("status") or "not_started"
+				, "description": body.get("description")
+				, "settings": body.get("settings") or dict(audit_goal_settings)
+				, "guide": body.get("guide")
+				, "documentation": body.get("documentation")
+				, "note": body.get("note")
+				, "custom_field": body.get("custom_field") or list()
+				, "created_at": now_text()
+				, "updated_at": now_text()
+			}
+			self.audit_goals[goal["id"]] = goal
+			return goal
+
+	def add_custom_fields(self, field_type, fields):
+		with self.lock:
+			group = self.custom_field_groups.get(field_type)
+			if not group:
+				group = {
+					  "id": self.new_id()
+					, "account_id": self.account_id
+					, "type": field_type
+					, "fields": list()
+					, "created_at": now_text()
+					, "updated_at": now_text()
+				}
+				self.custom_field_groups[field_type] = group
+			created = list()
+			for field in fields:
+				field = dict(field)
+				field["slug"] = field.get("slug") or f"{slugify(field.get('name') or 'field')}_{self.new_id()}"
+				group["fields"].append(field)
+				created.append(field)
+			group["updated_at"] = now_text()
+			return created
+
+	def seed_from_csv(self, path = default_soa_csv, scale:int = 1, seed_custom_fields:bool = True):
+		"""
+		Create one audit holding an audit goal per row of an SoA spreadsheet. With scale above 1 the rows are repeated
+		with numbered titles to get a bigger catalogue
+		"""
+		with open(path, "r", encoding='utf-8-sig') as csvfile:
+			rows = list(csv.DictReader(csvfile, delimiter=',', quotechar='"'))
+		audit = self.add_audit({"title": "Statement of Applicability", "description": "Seeded from SoA.csv", "overall_status": "in_progress"})
+		for n in range(scale):
+			for row in rows:
+				title = row.get("Title")
+				if not title:
+					continue
+				self.add_audit_goal({
+					  "title": title if n == 0 else f"{title} ({n})"
+					, "parent_id": audit["id"]
+					, "status": soa_status.get(row.get("Implemented"), "not_started")
+					, "description": row.get("Comments")
+					, "guide": row.get("Explanation")
+					, "documentation": row.get("Control Objectives")
+				})
+		if seed_custom_fields:
+			self.add_custom_fields("project_audit_goals", [{"name": name, "type": "text"} for name in seeded_custom_field_columns])
+		return audit
+
+
+#######################################################################
+
+
+class MockGapHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	server_version = "MockGap/1.0"
+
+	routes = [
+		  ("POST", r"/auth/token", "token")
+		, ("GET", r"/api-v1/account/get-memberships", "memberships")
+		, ("POST", r"/api-v1/account/change-account/(?P<account>[^/]+)", "change_account")
+		, ("GET", r"/api-v1/(?P<account>[^/]+)/audits", "list_audits")
+		, ("POST", r"/api-v1/(?P<account>[^/]+)/audits", "create_audit")
+		, ("GET", r"/api-v1/(?P<account>[^/]+)/audits/(?P<id>\d+)", "get_audit")
+		, ("PUT", r"/api-v1/(?P<account>[^/]+)/audits/(?P<id>\d+)", "patch_audit")
+		, ("PATCH", r"/api-v1/(?P<account>[^/]+)/audits/(?P<id>\d+)", "patch_audit")
+		, ("DELETE", r"/api-v1/(?P<account>[^/]+)/audits/(?P<id>\d+)", "delete_audit")
+		, ("GET", r"/api-v1/(?P<account>[^/]+)/audit-goals", "list_audit_goals")
+		, ("POST", r"/api-v1/(?P<account>[^/]+)/audit-goals", "create_audit_goal")
+		, ("GET", r"/api-v1/(?P<account>[^/]+)/audit-goals/(?P<id>\d+)", "get_audit_goal")
+		, ("PUT", r"/api-v1/(?P<account>[^/]+)/audit-goals/(?P<id>\d+)", "patch_audit_goal")
+		, ("PATCH", r"/api-v1/(?P<account>[^/]+)/audit-goals/(?P<id>\d+)", "patch_audit_goal")
+		, ("DELETE", r"/api-v1/(?P<account>[^/]+)/audit-goals/(?P<id>\d+)", "delete_audit_goal")
+		, ("GET", r"/api-v1/(?P<account>[^/]+)/custom-fields", "list_custom_fields")
+		, ("POST", r"/api-v1/(?P<account>[^/]+)/custom-fields", "create_custom_fields")
+	]
+
+	def log_message(self, format, *args):
+		logger.debug(format % args)
+
+	def do_GET(self):
+		self.dispatch()
+
+	def do_POST(self):
+		self.dispatch()
+
+	def do_PUT(self):
+		self.dispatch()
+
+	def do_PATCH(self):
+		self.dispatch()
+
+	def do_DELETE(self):
+		self.dispatch()
+
+	@property
+	def state(self):
+		return self.server.state
+
+	@property
+	def config(self):
+		return self.server.config
+
+	def respond(self, status, data = None, headers = dict()):
+		body = json.dumps(data).encode("utf-8") if data is not None else b""
+		self.send_response(status)
+		for k, v in headers.items():
+			self.send_header(k, v)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def read_body(self):
+		length = int(self.headers.get("Content-Length") or 0)
+		raw = self.rfile.read(length) if length else b""
+		if not raw:
+			return dict()
+		if "application/x-www-form-urlencoded" in (self.headers.get("Content-Type") or ""):
+			return dict(urllib.parse.parse_qsl(raw.decode("utf-8")))
+		try:
+			return json.loads(raw)
+		except ValueError:
+			return None
+
+	def dispatch(self):
+		parts = urllib.parse.urlsplit(self.path)
+		self.query = dict(urllib.parse.parse_qsl(parts.query))
+		self.body = self.read_body()
+		for method, pattern, name in self.routes:
+			if method != self.command:
+				continue
+			match = re.fullmatch(pattern, parts.path)
+			if match:
+				break
+		else:
+			return self.respond(404, {"message": f"No route for {self.command} {parts.path}"})
+		self.state.count(name)
+		fault = self.server.inject_faults()
+		if fault:
+			return self.respond(*fault)
+		if name != "token" and not self.is_authorized():
+			return self.respond(401, {"message": "Unauthenticated."})
+		if self.body is None:
+			return self.respond(400, {"message": "Invalid JSON body"})
+		account = match.groupdict().get("account")
+		if account and name != "change_account" and account != self.state.account_id:
+			return self.respond(403, {"message": "This action is unauthorized."})
+		params = {k: v for k, v in match.groupdict().items() if k != "account"}
+		return getattr(self, f"route_{name}")(**params)
+
+	def is_authorized(self):
+		auth = self.headers.get("Authorization") or ""
+		return auth.startswith("Bearer ") and auth[len("Bearer "):] in self.state.tokens
+
+	def page(self, items, path):
+		"""
+		Respond with one page of items the way Laravel's paginator does
+		"""
+		per_page = int(self.query.get("per_page") or self.config.per_page)
+		page = max(1, int(self.query.get("page") or 1))
+		total = len(items)
+		last_page = max(1, math.ceil(total / per_page))
+		start = (page - 1) * per_page
+		data = items[start:start + per_page]
+		base = f"http://{self.headers.get('Host')}{path}"
+		def url(n):
+			query = dict(self.query, page=n)
+			return f"{base}?{urllib.parse.urlencode(query)}"
+		return self.respond(200, {
+			  "current_page": page
+			, "data": data
+			, "first_page_url": url(1)
+			, "from": start + 1 if data else None
+			, "last_page": last_page
+			, "last_page_url": url(last_page)
+			, "next_page_url": url(page + 1) if page < last_page else None
+			, "path": base
+			, "per_page": per_page
+			, "prev_page_url": url(page - 1) if page > 1 else None
+			, "to": start + len(data) if data else None
+			, "total": total
+		})
+
+	def route_token(self):
+		body = self.body or dict()
+		if body.get("grant_type") != "client_credentials":
+			return self.respond(400, {"error": "unsupported_grant_type"})
+		if self.config.client_id and (body.get("client_id"), body.get("client_secret")) != (self.config.client_id, self.config.client_secret):
+			return self.respond(401, {"error": "invalid_client"})
+		token = secrets.token_urlsafe(24)
+		with self.state.lock:
+			self.state.tokens.add(token)
+		return self.respond(200, {"access_token": token, "token_type": "Bearer", "expires_in": self.config.token_ttl, "scope": body.get("scope")})
+
+	def route_memberships(self):
+		return self.respond(200, [{"account_id": self.state.account_id, "name": "Mock account", "role": "admin"}])
+
+	def route_change_account(self, **params):
+		account = urllib.parse.unquote(self.path.split("?")[0].rsplit("/", 1)[-1])
+		if account != self.state.account_id:
+			return self.respond(403, {"message": "This action is unauthorized."})
+		self.state.active_account_id = account
+		return self.respond(200, {"account_id": account})
+
+	def route_list_audits(self):
+		with self.state.lock:
+			items = list(self.state.audits.values())
+		return self.page(items, urllib.parse.urlsplit(self.path).path)
+
+	def route_create_audit(self):
+		if not self.body.get("title"):
+			return self.respond(422, {"message": "The title field is required."})
+		return self.respond(201, self.state.add_audit(self.body))
+
+	def route_get_audit(self, id):
+		audit = self.state.audits.get(int(id))
+		if not audit:
+			return self.respond(404, {"message": "Not found"})
+		return self.respond(200, audit)
+
+	def route_patch_audit(self, id):
+		with self.state.lock:
+			audit = self.state.audits.get(int(id))
+			if not audit:
+				return self.respond(404, {"message": "Not found"})
+			audit.update({k: v for k, v in self.body.items() if k not in ("id", "account_id")})
+			audit["updated_at"] = now_text()
+			audit = dict(audit)
+		return self.respond(200, audit)
+
+	def route_delete_audit(self, id):
+		with self.state.lock:
+			audit = self.state.audits.pop(int(id), None)
+		if not audit:
+			return self.respond(404, {"message": "Not found"})
+		return self.respond(200, {"message": "Deleted"})
+
+	def route_list_audit_goals(self):
+		with self.state.lock:
+			items = list(self.state.audit_goals.values())
+		return self.page(items, urllib.parse.urlsplit(self.path).path)
+
+	def route_create_audit_goal(self):
+		if not self.body.get("title"):
+			return self.respond(422, {"message": "The title field is required."})
+		return self.respond(201, self.state.add_audit_goal(self.body))
+
+	def route_get_audit_goal(self, id):
+		goal = self.state.audit_goals.get(int(id))
+		if not goal:
+			return self.respond(404, {"message": "Not found"})
+		return self.respond(200, {"data": [goal]})
+
+	def route_patch_audit_goal(self, id):
+		with self.state.lock:
+			goal = self.state.audit_goals.get(int(id))
+			if not goal:
+				return self.respond(404, {"message": "Not found"})
+			goal.update({k: v for k, v in self.body.items() if k != "id"})
+			goal["updated_at"] = now_text()
+			goal = dict(goal)
+		return self.respond(200, goal)
+
+	def route_delete_audit_goal(self, id):
+		with self.state.lock:
+			goal = self.state.audit_goals.pop(int(id), None)
+		if not goal:
+			return self.respond(404, {"message": "Not found"})
+		return self.respond(200, {"message": "Deleted"})
+
+	def route_list_custom_fields(self):
+		with self.state.lock:
+			items = [dict(group, fields=list(group["fields"])) for group in self.state.custom_field_groups.values()]
+		return self.page(items, urllib.parse.urlsplit(self.path).path)
+
+	def route_create_custom_fields(self):
+		field_type = self.body.get("type")
+		fields = self.body.get("fields")
+		if not field_type or not isinstance(fields, list):
+			return self.respond(422, {"message": "The type and fields fields are required."})
+		created = self.state.add_custom_fields(field_type, fields)
+		return self.respond(201, {"type": field_type, "fields": created})
+
+
+class MockGapServer(http.server.ThreadingHTTPServer):
+	"""
+	Threaded mock GAP API server. Use start()/stop() or a with block to run it in a background thread
+	"""
+	daemon_threads = True
+
+	def __init__(self, host = "127.0.0.1", port = 0, config:MockGapConfig = None, state:MockGapState = None, seed:bool = True, seed_scale:int = 1):
+		super().__init__((host, port), MockGapHandler)
+		self.config = config or MockGapConfig()
+		self.state = state or MockGapState()
+		self.random = random.Random(self.config.random_seed)
+		self.random_lock = threading.Lock()
+		self.bucket_tokens = self.config.rate_limit or 0
+		self.bucket_time = time.monotonic()
+		self.thread = None
+		if seed and not state:
+			self.state.seed_from_csv(scale = seed_scale)
+
+	@property
+	def url(self):
+		host, port = self.server_address[:2]
+		return f"http://{host}:{port}"
+
+	def inject_faults(self):
+		"""
+		Sleep for the configured latency, then decide whether this call fails. Returns (status, body, headers) or None
+		"""
+		config = self.config
+		with self.random_lock:
+			delay = config.latency + (self.random.uniform(0, config.jitter) if config.jitter else 0)
+			roll = self.random.random()
+		if delay:
+			time.sleep(delay)
+		throttle_headers = {"Retry-After": str(config.retry_after)}
+		if config.rate_limit:
+			with self.random_lock:
+				now = time.monotonic()
+				self.bucket_tokens = min(config.rate_limit, self.bucket_tokens + (now - self.bucket_time) * config.rate_limit)
+				self.bucket_time = now
+				if self.bucket_tokens < 1:
+					return 429, {"message": "Too Many Attempts."}, throttle_headers
+				self.bucket_tokens -= 1
+		if roll < config.throttle_rate:
+			return 429, {"message": "Too Many Attempts."}, throttle_headers
+		if roll < config.throttle_rate + config.error_rate:
+			return 500, {"message": "Server Error"}, dict()
+		return None
+
+	def start(self):
+		self.thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, name="mock-gap", daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+		if self.thread:
+			self.thread.join()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *args):
+		self.stop()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Offline mock of the GAP API")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8000)
+	parser.add_argument("--per-page", type=int, default=15)
+	parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+	parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds, at random")
+	parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 500")
+	parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of calls answered with 429")
+	parser.add_argument("--rate-limit", type=float, default=None, help="Calls per second before answering 429")
+	parser.add_argument("--retry-after", type=int, default=1)
+	parser.add_argument("--seed-scale", type=int, default=1, help="Repeat the SoA rows this many times")
+	parser.add_argument("--random-seed", type=int, default=None)
+	args = parser.parse_args()
+	logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+	config = MockGapConfig(per_page=args.per_page, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, throttle_rate=args.throttle_rate, rate_limit=args.rate_limit, retry_after=args.retry_after, random_seed=args.random_seed)
+	server = MockGapServer(host=args.host, port=args.port, config=config, seed_scale=args.seed_scale)
+	logger.info(f"Mock GAP API on {server.url} with account '{server.state.account_id}' and token '{mock_token}'")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,284 @@
+import gap_client as gap
+import asyncio
+import httpx
+import json
+import logging
+import pytest
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+base_url = "https://gap.example"
+account_id = "123"
+
+
+def fake_gap_handler(calls):
+	"""
+	Minimal in-memory stand-in for the GAP API that records every request it sees
+	"""
+	audits = [{"id": i, "title": f"Audit {i}"} for i in range(1, 6)]
+	goals = {1: {"id": 1, "title": "Goal 1", "description": "first", "status": "not_started"}}
+	fields = [{"id": 1, "account_id": account_id, "type": "project_audit_goals", "fields": [{"name": "Evidence", "slug": "evidence"}]}]
+	per_page = 2
+	def handler(request):
+		calls.append(f"{request.method} {request.url.path}")
+		path = request.url.path
+		if path == "/auth/token":
+			form = urllib.parse.parse_qs(request.content.decode())
+			assert form.get("grant_type") == ["client_credentials"]
+			return httpx.Response(200, json={"access_token": "tok", "token_type": "Bearer", "expires_in": 3600})
+		if request.headers.get("Authorization") != "Bearer tok":
+			return httpx.Response(401, json={"message": "Unauthenticated"})
+		if path == f"/api-v1/account/change-account/{account_id}":
+			return httpx.Response(200, json={})
+		if path == f"/api-v1/{account_id}/audits" and request.method == "GET":
+			page = int(request.url.params.get("page", 1))
+			data = audits[(page - 1) * per_page:page * per_page]
+			last_page = (len(audits) + per_page - 1) // per_page
+			next_page_url = f"{base_url}{path}?page={page + 1}" if page < last_page else None
+			return httpx.Response(200, json={"data": data, "current_page": page, "last_page": last_page, "next_page_url": next_page_url})
+		if path == f"/api-v1/{account_id}/audits" and request.method == "POST":
+			body = json.loads(request.content)
+			audit = dict(body, id=len(audits) + 1)
+			audits.append(audit)
+			return httpx.Response(201, json=audit)
+		if path == f"/api-v1/{account_id}/audit-goals" and request.method == "GET":
+			return httpx.Response(200, json={"data": list(goals.values()), "current_page": 1, "last_page": 1, "next_page_url": None})
+		if path == f"/api-v1/{account_id}/audit-goals" and request.method == "POST":
+			goal = dict(json.loads(request.content), id=max(goals) + 1, status="not_started")
+			goals[goal["id"]] = goal
+			return httpx.Response(201, json=goal)
+		if path.startswith(f"/api-v1/{account_id}/audit-goals/") and request.method == "PUT":
+			goal = goals[int(path.rsplit("/", 1)[1])]
+			goal.update(json.loads(request.content))
+			return httpx.Response(200, json=goal)
+		if path == f"/api-v1/{account_id}/custom-fields" and request.method == "GET":
+			return httpx.Response(200, json={"data": fields, "current_page": 1, "last_page": 1, "next_page_url": None})
+		if path.startswith(f"/api-v1/{account_id}/audits/") and request.method == "DELETE":
+			return httpx.Response(500, text="boom")
+		return httpx.Response(404, json={"message": "Not found"})
+	return handler
+
+
+def make_client(calls, **kwargs):
+	return gap.AsyncClient(base_url=base_url, client_id="id", client_secret="secret", account_id=account_id, transport=httpx.MockTransport(fake_gap_handler(calls)), **kwargs)
+
+
+# Test cases
+#######################################################################
+
+
+@pytest.mark.asyncio
+async def test_async_get_audits_follows_pages():
+	calls = list()
+	async with make_client(calls) as client:
+		audits, audits_err = await client.get_audits()
+	assert not audits_err, audits_err
+	assert [a.get("id") for a in audits] == [1, 2, 3, 4, 5]
+	# One token fetch and one account change before the listing
+	assert calls[0] == "POST /auth/token"
+	assert calls[1] == f"POST /api-v1/account/change-account/{account_id}"
+	assert calls.count("POST /auth/token") == 1
+
+
+@pytest.mark.asyncio
+async def test_async_concurrent_calls_share_token_and_account():
+	calls = list()
+	async with make_client(calls) as client:
+		results = await asyncio.gather(*[client.get_audit_by_title(f"Audit {i}") for i in range(1, 6)])
+	for i, (audit, audit_err) in enumerate(results, start=1):
+		assert not audit_err, audit_err
+		assert audit.get("id") == i
+	assert calls.count("POST /auth/token") == 1
+	assert calls.count(f"POST /api-v1/account/change-account/{account_id}") == 1
+
+
+@pytest.mark.asyncio
+async def test_async_title_lookups_share_one_listing():
+	calls = list()
+	async with make_client(calls) as client:
+		for i in range(1, 6):
+			audit, audit_err = await client.get_audit_by_title(f"Audit {i}")
+			assert not audit_err, audit_err
+			assert audit.get("id") == i
+		created, created_err = await client.upsert_audit({"title": "New audit"})
+		assert not created_err, created_err
+		audit, audit_err = await client.get_audit_by_title("New audit")
+		assert audit.get("id") == created.get("id")
+		assert client.audit_index.stats()["misses"] == 1
+	# One listing of 3 pages answers every lookup, the created audit included
+	assert calls.count(f"GET /api-v1/{account_id}/audits") == 3
+
+
+@pytest.mark.asyncio
+async def test_async_upsert_audit_goals():
+	calls = list()
+	bodies = [
+		  {"title": "Goal 1", "description": "patched"}
+		, {"title": "Goal 2", "description": "created", "status": "not_started"}
+		, {"title": "Goal 2", "description": "created", "status": "not_started"}
+		, {"description": "no title"}
+	]
+	async with make_client(calls) as client:
+		results, err = await client.upsert_audit_goals(bodies, max_workers=2)
+		assert not err, err
+		assert [result_err for result, result_err in results[:3]] == [None, None, None]
+		assert results[0][0]["description"] == "patched"
+		assert results[2][0]["id"] == results[1][0]["id"]
+		assert results[3][1]
+		goal, goal_err = await client.upsert_audit_goal_by_title({"title": "Goal 2", "description": "created"})
+		assert goal["status"] == "not_started"
+		assert client.write_stats() == {"created": 1, "patched": 1, "unchanged": 2}
+	assert calls.count(f"GET /api-v1/{account_id}/audit-goals") == 1
+	assert calls.count(f"POST /api-v1/{account_id}/audit-goals") == 1
+
+
+@pytest.mark.asyncio
+async def test_async_custom_field_lookups():
+	calls = list()
+	async with make_client(calls) as client:
+		field, field_err = await client.find_custom_field("project_audit_goals", name="Evidence")
+		assert not field_err, field_err
+		assert field["slug"] == "evidence"
+		slugs, slugs_err = await client.custom_field_slugs("project_audit_goals", ["Evidence", "Missing"])
+		assert slugs == {"Evidence": "evidence"}
+	assert calls.count(f"GET /api-v1/{account_id}/custom-fields") == 1
+
+
+@pytest.mark.asyncio
+async def test_async_upsert_audit_creates_missing():
+	calls = list()
+	async with make_client(calls) as client:
+		audit, audit_err = await client.upsert_audit({"title": "New audit"})
+		assert not audit_err, audit_err
+		assert audit.get("id") == 6
+
+
+@pytest.mark.asyncio
+async def test_async_error_contract():
+	calls = list()
+	async with make_client(calls) as client:
+		result, err = await client.delete_audit(1)
+	assert result is None
+	assert "500" in err and "boom" in err
+
+
+@pytest.mark.asyncio
+async def test_async_non_json_body_is_an_error():
+	def handler(request):
+		if request.url.path.endswith("/change-account/123"):
+			return httpx.Response(200, json={})
+		return httpx.Response(200, text="<html>Down for maintenance</html>", headers={"Content-Type": "text/html"})
+	async with gap.AsyncClient(base_url=base_url, client_id=None, client_secret=None, account_id=account_id, client_token="tok", transport=httpx.MockTransport(handler)) as client:
+		audits, audits_err = await client.get_audits()
+		assert audits is None
+		assert "Invalid JSON" in audits_err
+		audit, audit_err = await client.create_audit({"title": "New audit"})
+		assert audit is None
+		assert "Invalid JSON" in audit_err
+
+
+@pytest.mark.asyncio
+async def test_async_client_token():
+	calls = list()
+	async with gap.AsyncClient(base_url=base_url, client_id=None, client_secret=None, account_id=account_id, client_token="tok", transport=httpx.MockTransport(fake_gap_handler(calls))) as client:
+		audits, audits_err = await client.get_audits()
+	assert not audits_err, audits_err
+	assert "POST /auth/token" not in calls
+
+
+@pytest.mark.asyncio
+async def test_async_iter_audits_stops_early():
+	calls = list()
+	# Without the title index a lookup pages only until it finds the title
+	async with make_client(calls, title_cache_ttl=0) as client:
+		audit, audit_err = await client.get_audit_by_title("Audit 1")
+		assert not audit_err, audit_err
+		assert audit.get("id") == 1
+		found = list()
+		async for audit, audit_err in client.iter_audits():
+			assert not audit_err, audit_err
+			found.append(audit.get("id"))
+		assert found == [1, 2, 3, 4, 5]
+	# Pages 1 and 2 for the lookup, then 3 pages for the full iteration
+	assert calls.count(f"GET /api-v1/{account_id}/audits") <= 5
+
+
+@pytest.mark.asyncio
+async def test_async_retries_throttled_calls():
+	calls = list()
+	handler = fake_gap_handler(calls)
+	throttled = {"left": 2}
+	def throttling_handler(request):
+		if request.url.path.endswith("/audits") and throttled["left"]:
+			throttled["left"] -= 1
+			calls.append("429")
+			return httpx.Response(429, headers={"Retry-After": "0"})
+		return handler(request)
+	policy = gap.RetryPolicy(max_attempts = 3, backoff_base = 0.001)
+	async with gap.AsyncClient(base_url=base_url, client_id="id", client_secret="secret", account_id=account_id, retry_policy=policy, transport=httpx.MockTransport(throttling_handler)) as client:
+		audits, audits_err = await client.get_audits()
+	assert not audits_err, audits_err
+	assert len(audits) == 5
+	assert calls.count("429") == 2
+
+
+@pytest.mark.asyncio
+async def test_async_token_cache_shared_between_clients(tmp_path):
+	calls = list()
+	for i in range(2):
+		async with make_client(calls, token_cache=str(tmp_path)) as client:
+			audits, audits_err = await client.get_audits()
+			assert not audits_err, audits_err
+	assert calls.count("POST /auth/token") == 1
+
+
+@pytest.mark.asyncio
+async def test_async_concurrent_start_fetches_once(tmp_path):
+	calls = list()
+	handler = fake_gap_handler(calls)
+	async def slow_token_handler(request):
+		if request.url.path == "/auth/token":
+			await asyncio.sleep(0.05)
+		return handler(request)
+	clients = [gap.AsyncClient(base_url=base_url, client_id="id", client_secret="secret", account_id=account_id, token_cache=str(tmp_path), transport=httpx.MockTransport(slow_token_handler)) for i in range(5)]
+	try:
+		results = await asyncio.wait_for(asyncio.gather(*[client.get_audits() for client in clients]), 5)
+	finally:
+		for client in clients:
+			await client.aclose()
+	assert all(not audits_err for audits, audits_err in results), results
+	assert calls.count("POST /auth/token") == 1
+
+
+@pytest.mark.asyncio
+async def test_async_token_cache_does_not_block_the_loop(tmp_path):
+	calls = list()
+	handler = fake_gap_handler(calls)
+	async def slow_token_handler(request):
+		if request.url.path == "/auth/token":
+			await asyncio.sleep(0.2)
+		return handler(request)
+	cache = gap.FileTokenCache(path=str(tmp_path))
+	clients = [gap.AsyncClient(base_url=base_url, client_id="id", client_secret="secret", account_id=account_id, token_cache=cache, transport=httpx.MockTransport(slow_token_handler)) for i in range(2)]
+	try:
+		results = await asyncio.wait_for(asyncio.gather(*[client.get_audits() for client in clients]), 5)
+	finally:
+		for client in clients:
+			await client.aclose()
+	assert all(not audits_err for audits, audits_err in results), results
+	# A lock held elsewhere must not stall the loop either
+	handle = cache.try_lock(cache.key(f"{base_url}/auth/token", "other", "all", base_url))
+	assert handle
+	async with gap.AsyncClient(base_url=base_url, client_id="other", client_secret="secret", account_id=account_id, token_cache=cache, transport=httpx.MockTransport(slow_token_handler)) as client:
+		task = asyncio.ensure_future(client.get_audits())
+		await asyncio.wait_for(asyncio.sleep(0.05), 1)
+		assert not task.done()
+		cache.unlock(handle)
+		audits, audits_err = await asyncio.wait_for(task, 5)
+	assert not audits_err, audits_err
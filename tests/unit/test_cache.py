@@ -0,0 +1,92 @@
+import gap_client as gap
+import logging
+import pytest
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Test cases
+#######################################################################
+
+
+def test_title_index_needs_a_listing_first():
+	index = gap.TitleIndex(ttl = 60)
+	fresh, record = index.get("A")
+	assert not fresh
+	index.put({"id": 1, "title": "A"})
+	fresh, record = index.get("A")
+	assert not fresh
+
+
+def test_title_index_lookup_and_updates():
+	index = gap.TitleIndex(ttl = 60)
+	index.fill([{"id": 1, "title": "A"}, {"id": 2, "title": "B"}, {"id": 3, "title": "A"}])
+	assert index.get("A") == (True, {"id": 1, "title": "A"})
+	assert index.get("C") == (True, None)
+	index.put({"id": 4, "title": "C"})
+	assert index.get("C") == (True, {"id": 4, "title": "C"})
+	# Patch renames, the old title must no longer resolve to the record
+	index.replace("2", {"id": 2, "title": "D"})
+	assert index.get("B") == (True, None)
+	assert index.get("D") == (True, {"id": 2, "title": "D"})
+	# Deleting the first of two duplicates falls back to the other one
+	index.discard(1)
+	assert index.get("A") == (True, {"id": 3, "title": "A"})
+
+
+def test_title_index_replace_without_record_invalidates():
+	index = gap.TitleIndex(ttl = 60)
+	index.fill([{"id": 1, "title": "A"}])
+	index.replace(1, {"message": "ok"})
+	fresh, record = index.get("A")
+	assert not fresh
+
+
+def test_title_index_expires():
+	index = gap.TitleIndex(ttl = 0.01)
+	index.fill([{"id": 1, "title": "A"}])
+	assert index.get("A")[0]
+	time.sleep(0.02)
+	assert not index.get("A")[0]
+
+
+def test_title_index_disabled():
+	index = gap.TitleIndex(ttl = 0)
+	index.fill([{"id": 1, "title": "A"}])
+	assert not index.is_enabled()
+	assert not index.get("A")[0]
+
+
+def test_custom_field_registry_indexes_by_name_and_slug():
+	registry = gap.CustomFieldRegistry(ttl = 60)
+	assert registry.get("project_audit_goals", name = "Owner") == (False, None)
+	owner = {"name": "Owner", "slug": "owner", "type": "project_audit_goals"}
+	other = {"name": "Owner", "slug": "owner-2", "type": "data_recepients"}
+	registry.fill([owner, other, dict(owner, slug = "owner-3")])
+	assert registry.get("project_audit_goals", name = "Owner") == (True, owner)
+	assert registry.get("data_recepients", slug = "owner-2") == (True, other)
+	assert registry.get("project_audit_goals", name = "Missing") == (True, None)
+	created = {"name": "Comment", "slug": "comment", "type": "project_audit_goals"}
+	registry.put(created)
+	assert registry.slugs("project_audit_goals", ["Owner", "Comment", "Missing"]) == {"Owner": "owner", "Comment": "comment"}
+	assert len(registry.fields("project_audit_goals")) == 3
+	registry.invalidate()
+	assert registry.get("project_audit_goals", name = "Owner") == (False, None)
+
+
+def test_lru_cache_evicts_least_recently_used():
+	cache = gap.LRUCache(maxsize = 2)
+	cache.put("a", 1)
+	cache.put("b", 2)
+	assert cache.get("a") == (True, 1)
+	cache.put("c", 3)
+	assert cache.get("b") == (False, None)
+	assert cache.get("c") == (True, 3)
+	stats = cache.stats()
+	assert (stats["size"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 1, 1)
+	cache.resize(1)
+	assert cache.stats()["size"] == 1
+	cache.resize(0)
+	cache.put("d", 4)
+	assert cache.get("d") == (False, None)
@@ -0,0 +1,266 @@
+import gap_client as gap
+import logging
+import pytest
+from ..mock_server import MockGapConfig, MockGapServer, mock_account_id, mock_token
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+def make_client(server, **kwargs):
+	return gap.Client(base_url=server.url, client_id="id", client_secret="secret", account_id=mock_account_id, client_token=mock_token, **kwargs)
+
+
+@pytest.fixture(scope='function')
+def mock_server(request):
+	server = MockGapServer(config=MockGapConfig(per_page=20)).start()
+	request.addfinalizer(server.stop)
+	return server
+
+
+# Test cases
+#######################################################################
+
+
+def test_mock_server_paginates_like_laravel(mock_server):
+	client = make_client(mock_server)
+	res = client.session.get(f"{client.api_url}/{mock_account_id}/audit-goals", params={"page": 2})
+	page = res.json()
+	assert page["current_page"] == 2
+	assert page["per_page"] == 20
+	assert page["total"] == len(mock_server.state.audit_goals)
+	assert page["last_page"] == -(-page["total"] // 20)
+	assert "page=3" in page["next_page_url"]
+	assert len(page["data"]) == 20
+
+
+def test_mock_server_rejects_unknown_token(mock_server):
+	client = gap.Client(base_url=mock_server.url, client_id="id", client_secret="secret", account_id=mock_account_id, client_token="wrong")
+	audits, err = client.get_audits()
+	assert not audits
+	assert "401" in err
+
+
+def test_account_changed_once_and_lazily(mock_server):
+	client = make_client(mock_server)
+	assert mock_server.state.request_counts.get("change_account") is None
+	audits, err = client.get_audits()
+	assert not err, err
+	goals, err = client.get_audit_goals()
+	assert not err, err
+	assert mock_server.state.request_counts["change_account"] == 1
+
+
+def test_lazy_account_change_sends_account_query(mock_server):
+	client = make_client(mock_server)
+	with client.tracing() as tracer:
+		audits, err = client.get_audits()
+		assert not err, err
+	change = tracer.exchanges()[0]
+	assert change["url"] == f"{mock_server.url}/api-v1/account/change-account/{mock_account_id}?account_id={mock_account_id}"
+
+
+def test_listing_fans_out_over_all_pages(mock_server):
+	client = make_client(mock_server, page_workers=4)
+	goals, err = client.get_audit_goals()
+	assert not err, err
+	assert [goal["id"] for goal in goals] == list(mock_server.state.audit_goals)
+
+
+def test_title_lookups_share_one_listing(mock_server):
+	client = make_client(mock_server)
+	titles = [goal["title"] for goal in list(mock_server.state.audit_goals.values())[:5]]
+	for title in titles:
+		goal, err = client.find_audit_goal_by_title(title)
+		assert goal and goal["title"] == title, err
+	pages = mock_server.state.request_counts["list_audit_goals"]
+	assert pages == -(-len(mock_server.state.audit_goals) // 20)
+
+
+def test_bulk_upsert_creates_and_patches(mock_server):
+	client = make_client(mock_server)
+	existing = next(iter(mock_server.state.audit_goals.values()))
+	bodies = [
+		  {"title": existing["title"], "description": "patched"}
+		, {"title": "Brand new goal", "description": "created"}
+	]
+	results, err = client.upsert_audit_goals(bodies)
+	assert not err, err
+	assert all(not result_err for result, result_err in results), results
+	assert mock_server.state.audit_goals[existing["id"]]["description"] == "patched"
+	assert mock_server.state.request_counts["create_audit_goal"] == 1
+	assert mock_server.state.request_counts["patch_audit_goal"] == 1
+
+
+def test_listing_survives_throttling():
+	config = MockGapConfig(per_page=20, throttle_rate=0.3, retry_after=0, random_seed=7)
+	with MockGapServer(config=config) as server:
+		policy = gap.RetryPolicy(max_attempts=10, backoff_base=0.001, backoff_max=0.01)
+		client = make_client(server, retry_policy=policy, retry_budget=gap.RetryBudget(initial=100))
+		goals, err = client.get_audit_goals()
+		assert not err, err
+		assert len(goals) == len(server.state.audit_goals)
+
+
+def test_upsert_skips_unchanged_goals(mock_server):
+	client = make_client(mock_server)
+	existing = next(iter(mock_server.state.audit_goals.values()))
+	same = {"title": existing["title"], "description": existing["description"], "guide": existing["guide"]}
+	goal, err = client.upsert_audit_goal_by_title(same)
+	assert not err, err
+	assert goal["id"] == existing["id"]
+	results, err = client.upsert_audit_goals([same, dict(same, title="Brand new goal")])
+	assert not err, err
+	goal, err = client.upsert_audit_goal_by_title(dict(same, description="changed"))
+	assert not err, err
+	assert mock_server.state.request_counts.get("patch_audit_goal") == 1
+	assert client.write_stats() == {"created": 1, "patched": 1, "unchanged": 2}
+
+
+def test_upsert_compares_repeated_titles_with_the_created_record(mock_server):
+	client = make_client(mock_server)
+	body = {"title": "Brand new goal", "description": "created", "status": "not_started"}
+	results, err = client.upsert_audit_goals([body, dict(body)])
+	assert not err, err
+	assert all(not result_err for result, result_err in results), results
+	# The raw record keeps status, so the repeated body is seen as unchanged
+	assert [result["status"] for result, result_err in results] == ["not_started", "not_started"]
+	assert mock_server.state.request_counts["create_audit_goal"] == 1
+	assert mock_server.state.request_counts.get("patch_audit_goal") is None
+	goal, err = client.upsert_audit_goal_by_title(dict(body, title="Another goal"))
+	assert not err, err
+	assert goal["status"] == "not_started" and "settings" in goal
+	assert client.write_stats() == {"created": 2, "patched": 0, "unchanged": 1}
+
+
+def test_upsert_skips_unchanged_audits(mock_server):
+	client = make_client(mock_server)
+	audit = next(iter(mock_server.state.audits.values()))
+	result, err = client.upsert_audit({"title": audit["title"], "description": audit["description"]})
+	assert not err, err
+	assert mock_server.state.request_counts.get("patch_audit") is None
+	assert client.write_stats()["unchanged"] == 1
+
+
+def test_upsert_custom_fields_creates_missing_in_one_call(mock_server):
+	client = make_client(mock_server)
+	names = ["Applicable", "Control Owner"] + [f"Column {i}" for i in range(80)]
+	fields, err = client.upsert_custom_fields("project_audit_goals", [{"name": name, "type": "text"} for name in names] + [{"name": "Column 0"}])
+	assert not err, err
+	assert [field["name"] for field in fields] == names + ["Column 0"]
+	assert all(field["slug"] for field in fields)
+	assert mock_server.state.request_counts["create_custom_fields"] == 1
+	fields, err = client.upsert_custom_fields("project_audit_goals", [{"name": "Column 5"}])
+	assert not err, err
+	assert fields[0]["name"] == "Column 5"
+	assert mock_server.state.request_counts["create_custom_fields"] == 1
+	fields, err = client.upsert_custom_fields("project_audit_goals", [{"name": "Bad", "type": "nope"}])
+	assert fields is None and "Invalid field type" in err
+
+
+def test_custom_field_registry_answers_without_listing(mock_server):
+	client = make_client(mock_server)
+	slugs, err = client.custom_field_slugs("project_audit_goals", ["Applicable", "Control Owner", "Missing"])
+	assert not err, err
+	assert set(slugs) == {"Applicable", "Control Owner"}
+	listings = mock_server.state.request_counts["list_custom_fields"]
+	created, err = client.create_custom_field("project_audit_goals", {"name": "Evidence", "type": "text"})
+	assert not err, err
+	field, err = client.find_custom_field("project_audit_goals", name="Evidence")
+	assert field == created[0]
+	field, err = client.find_custom_field("project_audit_goals", slug=slugs["Applicable"])
+	assert field["name"] == "Applicable"
+	fields, err = client.upsert_custom_fields("project_audit_goals", [{"name": "Evidence"}])
+	assert fields == created
+	assert mock_server.state.request_counts["list_custom_fields"] == listings
+	client.custom_field_registry.invalidate()
+	field, err = client.find_custom_field("project_audit_goals", name="Evidence")
+	assert field["slug"] == created[0]["slug"]
+	assert mock_server.state.request_counts["list_custom_fields"] > listings
+
+
+def test_tracing_captures_selected_calls_only(mock_server, tmp_path):
+	import http.client
+	client = make_client(mock_server)
+	audit = next(iter(mock_server.state.audits.values()))
+	path = str(tmp_path / "trace.jsonl")
+	with client.tracing(maxlen=10, path=path) as tracer:
+		result, err = client.patch_audit(audit["id"], {"title": audit["title"], "description": "traced"})
+		assert not err, err
+	client.get_audits()
+	exchanges = tracer.exchanges()
+	assert [exchange["method"] for exchange in exchanges] == ["POST", "PATCH"]
+	patch = exchanges[-1]
+	assert patch["status"] == 200 and "traced" in patch["request_body"] and "traced" in patch["response_body"]
+	assert patch["request_headers"]["Authorization"] == "<redacted>"
+	assert "_method" not in client.session.headers
+	assert http.client.HTTPConnection.debuglevel == 0
+	with open(path) as f:
+		assert len(f.readlines()) == 2
+
+
+def test_tracing_ignores_other_threads(mock_server):
+	import threading
+	client = make_client(mock_server, page_workers=4)
+	stop = threading.Event()
+	def list_fields():
+		while not stop.is_set():
+			client.get_custom_fields()
+	thread = threading.Thread(target=list_fields)
+	thread.start()
+	try:
+		with client.tracing() as tracer:
+			goals, err = client.get_audit_goals()
+			assert not err, err
+	finally:
+		stop.set()
+		thread.join()
+	urls = [exchange["url"] for exchange in tracer.exchanges()]
+	assert len(urls) == mock_server.state.request_counts["list_audit_goals"]
+	assert all("/audit-goals" in url for url in urls), urls
+
+
+def test_metrics_per_endpoint(mock_server):
+	client = make_client(mock_server)
+	goals, err = client.get_audit_goals()
+	assert not err, err
+	goal, err = client.find_audit_goal_by_title(goals[0]["title"])
+	assert not err, err
+	created, err = client.create_audit_goal({"title": "Measured goal"})
+	assert not err, err
+	endpoints = client.metrics_snapshot()["endpoints"]
+	listing = endpoints["audit-goals list"]
+	pages = -(-len(goals) // 20)
+	assert listing["requests"] == pages and listing["statuses"] == {"200": pages}
+	assert (listing["listings"], listing["pages"]) == (1, pages)
+	assert listing["bytes_received"] > 0 and listing["latency"]["count"] == pages
+	assert endpoints["audit-goals create"]["bytes_sent"] > 0
+	assert endpoints["change-account"]["requests"] == 1
+	assert client.metrics_snapshot()["caches"]["audit_goal_titles"]["hits"] == 1
+	assert 'gap_client_requests_total{endpoint="audit-goals create",status="201"} 1' in client.metrics_text()
+
+
+def test_spans_show_where_a_call_spends_time(mock_server):
+	collector = gap.SpanCollector()
+	client = make_client(mock_server, span_collector=collector, page_workers=4)
+	goals, err = client.get_audit_goals()
+	assert not err, err
+	pages = -(-len(goals) // 20)
+	spans = collector.last_trace()
+	by_id = {span.span_id: span for span in spans}
+	names = [span.name for span in spans]
+	assert [span.name for span in spans if span.parent_id is None] == ["get_audit_goals"]
+	assert (names.count("http"), names.count("json_decode"), names.count("change_account")) == (pages + 1, pages, 1)
+	assert "connect" in names
+	# Pages fetched on worker threads still nest under the call
+	assert {by_id[span.parent_id].name for span in spans if span.name == "json_decode"} == {"get_audit_goals"}
+	http = [span for span in spans if span.name == "http"][-1]
+	assert http.attributes["status"] == 200 and http.attributes["endpoint"] == "audit-goals list"
+	fields, err = client.get_custom_fields()
+	assert [span.name for span in collector.last_trace()].count("clean_custom_field") == len(fields)
+	with client.profile("cprofile") as capture:
+		client.get_audits()
+	assert "get_audits" in capture.report()
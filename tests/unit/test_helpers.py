@@ -0,0 +1,193 @@
+import gap_client as gap
+import logging
+import pytest
+import requests
+import threading
+import time
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+class FakeResponse:
+	def __init__(self, status_code, data):
+		self.status_code = status_code
+		self.data = data
+		self.text = str(data)
+
+	def raise_for_status(self):
+		if self.status_code >= 400:
+			raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+	def json(self):
+		return self.data
+
+
+class FakePagedSession:
+	"""
+	Serves items in Laravel style pages and keeps track of how many requests were in flight at the same time
+	"""
+	def __init__(self, items, per_page, with_page_count = True, delay = 0.0, fail_page = None):
+		self.items = items
+		self.per_page = per_page
+		self.with_page_count = with_page_count
+		self.delay = delay
+		self.fail_page = fail_page
+		self.urls = list()
+		self.in_flight = 0
+		self.max_in_flight = 0
+		self.lock = threading.Lock()
+
+	def get(self, url):
+		with self.lock:
+			self.urls.append(url)
+			self.in_flight += 1
+			self.max_in_flight = max(self.max_in_flight, self.in_flight)
+		try:
+			time.sleep(self.delay)
+			parts = urllib.parse.urlsplit(url)
+			page = int(dict(urllib.parse.parse_qsl(parts.query)).get("page", 1))
+			if page == self.fail_page:
+				return FakeResponse(502, "Bad gateway")
+			last_page = (len(self.items) + self.per_page - 1) // self.per_page
+			raw_result = {
+				  "data": self.items[(page - 1) * self.per_page:page * self.per_page]
+				, "current_page": page
+				, "next_page_url": gap.page_url(url, page + 1) if page < last_page else None
+			}
+			if self.with_page_count:
+				raw_result["last_page"] = last_page
+				raw_result["total"] = len(self.items)
+				raw_result["per_page"] = self.per_page
+			return FakeResponse(200, raw_result)
+		finally:
+			with self.lock:
+				self.in_flight -= 1
+
+
+# Test cases
+#######################################################################
+
+
+def test_page_url_keeps_other_parameters():
+	assert gap.page_url("https://x/api?include=goals", 3) == "https://x/api?include=goals&page=3"
+	assert gap.page_url("https://x/api?page=1", 2) == "https://x/api?page=2"
+
+
+def test_last_page_of():
+	assert gap.last_page_of({"last_page": 7}) == 7
+	assert gap.last_page_of({"total": 21, "per_page": 10}) == 3
+	assert gap.last_page_of({"next_page_url": "x"}) is None
+
+
+def test_generic_get_fans_out_in_page_order():
+	items = [{"id": i} for i in range(95)]
+	session = FakePagedSession(items, per_page = 10, delay = 0.02)
+	result, err = gap.generic_get(session, "https://x/api/items", name = "items", max_workers = 4)
+	assert not err, err
+	assert result == items
+	assert len(session.urls) == 10
+	assert 1 < session.max_in_flight <= 4
+
+
+def test_generic_get_sequential_without_page_count():
+	items = [{"id": i} for i in range(25)]
+	session = FakePagedSession(items, per_page = 10, with_page_count = False)
+	result, err = gap.generic_get(session, "https://x/api/items", name = "items", max_workers = 4)
+	assert not err, err
+	assert result == items
+	assert session.max_in_flight == 1
+
+
+def test_generic_get_flattens_and_cleans_sub_items():
+	items = [{"type": "project_audit_goals", "fields": [{"name": "A", "slug": "a"}, {"slug": "missing-name"}]}]
+	session = FakePagedSession(items, per_page = 10)
+	result, err = gap.generic_get(session, "https://x/api/custom-fields", name = "custom-fields", sub = "fields", clean_fun = gap.clean_custom_field, inherit = ["type"])
+	assert not err, err
+	assert [(f.get("name"), f.get("type")) for f in result] == [("A", "project_audit_goals")]
+
+
+def test_generic_get_reports_page_errors():
+	items = [{"id": i} for i in range(50)]
+	session = FakePagedSession(items, per_page = 10, fail_page = 3)
+	result, err = gap.generic_get(session, "https://x/api/items", name = "items", max_workers = 4)
+	assert result is None
+	assert "502" in err and "Bad gateway" in err
+
+
+def test_generic_iter_yields_all_items_in_order():
+	items = [{"id": i} for i in range(25)]
+	session = FakePagedSession(items, per_page = 10)
+	result = list()
+	for item, err in gap.generic_iter(session, "https://x/api/items", name = "items"):
+		assert not err, err
+		result.append(item)
+	assert result == items
+
+
+def test_generic_iter_stops_fetching_when_closed():
+	items = [{"id": i} for i in range(100)]
+	session = FakePagedSession(items, per_page = 10, delay = 0.01)
+	for item, err in gap.generic_iter(session, "https://x/api/items", name = "items"):
+		assert not err, err
+		break
+	time.sleep(0.05)
+	# The first page plus at most the one being prefetched
+	assert len(session.urls) <= 2
+
+
+def test_generic_iter_reports_page_errors():
+	items = [{"id": i} for i in range(30)]
+	session = FakePagedSession(items, per_page = 10, fail_page = 2)
+	pairs = list(gap.generic_iter(session, "https://x/api/items", name = "items"))
+	assert [item for item, err in pairs[:10]] == items[:10]
+	assert len(pairs) == 11
+	item, err = pairs[-1]
+	assert item is None and "502" in err
+
+
+@pytest.mark.parametrize("bs_parser", ["html5lib", "html.parser"])
+def test_analyze_html(bs_parser):
+	assert gap.analyze_html(None, bs_parser = bs_parser) == (dict(), False)
+	assert gap.analyze_html("  ", bs_parser = bs_parser) == (dict(), False)
+	assert gap.analyze_html('<div><br></div>', bs_parser = bs_parser) == (dict(), False)
+	assert gap.analyze_html('<style>p{}</style>&nbsp;', bs_parser = bs_parser) == (dict(), False)
+	assert gap.analyze_html('<p>See <a href="https://x/doc">the doc</a></p>', bs_parser = bs_parser) == ({"the doc": "https://x/doc"}, True)
+
+
+def test_analyze_html_skips_parsing_plain_text(monkeypatch):
+	def fail(*args, **kwargs):
+		raise AssertionError("parsed plain text")
+	monkeypatch.setattr(gap.helpers, "parse_soup", fail)
+	assert gap.analyze_html("Completely") == (dict(), True)
+	assert gap.has_visible_content("Yes")
+	assert gap.extract_links("No links here") == dict()
+
+
+def test_analyze_html_caches_by_content(monkeypatch):
+	calls = list()
+	parse_soup = gap.helpers.parse_soup
+	def counting_parse_soup(html, bs_parser = gap.default_bs_parser):
+		calls.append(html)
+		return parse_soup(html, bs_parser = bs_parser)
+	monkeypatch.setattr(gap.helpers, "parse_soup", counting_parse_soup)
+	monkeypatch.setattr(gap.helpers, "html_cache", gap.LRUCache(maxsize = 10))
+	cell = '<p>Shared <a href="https://x/policy">policy</a></p>'
+	links, visible = gap.analyze_html(cell)
+	links["mutated"] = "by caller"
+	assert gap.analyze_html(cell) == ({"policy": "https://x/policy"}, True)
+	assert gap.analyze_html(cell, bs_parser = "html.parser") == ({"policy": "https://x/policy"}, True)
+	assert gap.analyze_html(cell, use_cache = False)[1]
+	assert len(calls) == 3
+	stats = gap.helpers.html_cache.stats()
+	assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_changed_fields_normalizes():
+	record = {"id": 3, "title": "A", "description": None, "parent_id": "7", "status": "completed"}
+	assert gap.changed_fields({"title": " A ", "description": "", "parent_id": 7, "status": gap.Status.completed, "icon": None}, record) == list()
+	assert gap.changed_fields({"title": "B", "note": "new"}, record) == ["title", "note"]
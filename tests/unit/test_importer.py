@@ -0,0 +1,111 @@
+import gap_client as gap
+import csv
+import io
+import logging
+import os
+import pytest
+from ..mock_server import MockGapConfig, MockGapServer, mock_account_id, mock_token
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+here = os.path.dirname(__file__)
+soa_csv = os.path.join(here, "..", "data", "SoA.csv")
+
+
+@pytest.fixture(scope='function')
+def empty_server(request):
+	server = MockGapServer(config=MockGapConfig(per_page=50), seed=False).start()
+	request.addfinalizer(server.stop)
+	return server
+
+
+def make_client(server):
+	return gap.Client(base_url=server.url, client_id="id", client_secret="secret", account_id=mock_account_id, client_token=mock_token)
+
+
+# Test cases
+#######################################################################
+
+
+def test_import_soa_with_process_pool(empty_server):
+	client = make_client(empty_server)
+	audit, err = client.create_audit({"title": "SoA import"})
+	assert audit, err
+	snapshots = list()
+	report, err = gap.import_audit_goals(client, soa_csv, parent_id=audit["id"], map_workers=2, upload_workers=4, chunk_size=16, on_progress=snapshots.append)
+	assert not err, err
+	assert report["read"] == 164
+	assert report["errors"] == list()
+	assert report["uploaded"] == 164
+	assert report["custom_fields_created"] == ["Applicable", "Control Description", "Control Owner"]
+	goals = empty_server.state.audit_goals.values()
+	# Two titles appear twice in the file, the second row patches the goal of the first
+	assert len(goals) == 162
+	assert all(goal["parent_id"] == audit["id"] for goal in goals)
+	assert snapshots and snapshots[-1]["uploaded"] == 164
+
+
+def test_reimport_patches_and_reports_row_errors(empty_server):
+	client = make_client(empty_server)
+	text = "Title,Comments,Owner\nFirst,<p>one</p>,a\n,missing title,b\nSecond,two,c\n"
+	report, err = gap.import_audit_goals(client, io.StringIO(text), use_processes=False, upload_workers=2)
+	assert not err, err
+	assert report["uploaded"] == 2
+	assert [(number, message) for number, title, message in report["errors"]] == [(2, "No title for raw_audit_goal")]
+	report, err = gap.import_audit_goals(client, io.StringIO(text.replace("two", "changed")), use_processes=False)
+	assert not err, err
+	assert report["custom_fields_created"] == list()
+	# Only the row that changed is written
+	assert report["unchanged"] == 1
+	assert len(empty_server.state.audit_goals) == 2
+	assert empty_server.state.request_counts["create_audit_goal"] == 2
+	assert [goal["description"] for goal in empty_server.state.audit_goals.values()] == ["<p>one</p>", "changed"]
+
+
+def test_journal_round_trip(tmp_path):
+	with gap.ImportJournal(str(tmp_path / "journal.db")) as journal:
+		hash = gap.content_hash({"b": 1, "a": 2})
+		assert hash == gap.content_hash({"a": 2, "b": 1})
+		journal.pending("s", 1, "A", hash)
+		assert not journal.is_applied("s", 1, hash)
+		journal.applied("s", 1, "A", hash, 42)
+		assert journal.is_applied("s", 1, hash)
+		assert not journal.is_applied("s", 1, gap.content_hash({"a": 3}))
+		assert not journal.is_applied("other", 1, hash)
+		assert journal.get("s", 1)["server_id"] == "42"
+		assert journal.counts("s") == {"applied": 1}
+
+
+def test_journaled_import_resumes(empty_server, tmp_path):
+	client = make_client(empty_server)
+	journal_path = str(tmp_path / "journal.db")
+	# An import that died after the first 50 rows
+	with open(soa_csv, "r", encoding="utf-8-sig") as f:
+		reader = csv.DictReader(f)
+		partial = io.StringIO()
+		writer = csv.DictWriter(partial, fieldnames=reader.fieldnames)
+		writer.writeheader()
+		writer.writerows(row for number, row in zip(range(50), reader))
+	partial.seek(0)
+	report, err = gap.import_audit_goals(client, partial, use_processes=False, journal=journal_path)
+	assert not err, err
+	assert report["uploaded"] == 50
+	report, err = gap.import_audit_goals(client, soa_csv, use_processes=False, journal=journal_path)
+	assert not err, err
+	assert (report["skipped"], report["uploaded"]) == (50, 114)
+	# Nothing changed, so a rerun neither lists nor writes
+	counts = dict(empty_server.state.request_counts)
+	report, err = gap.import_audit_goals(client, soa_csv, use_processes=False, journal=journal_path)
+	assert not err, err
+	assert (report["skipped"], report["uploaded"]) == (164, 0)
+	assert empty_server.state.request_counts.get("list_audit_goals") == counts.get("list_audit_goals")
+	assert empty_server.state.request_counts.get("patch_audit_goal") == counts.get("patch_audit_goal")
+	with gap.ImportJournal(journal_path) as journal:
+		scope = f"{client.base_url}|{client.account_id}|None"
+		assert journal.counts(scope) == {"applied": 164}
+		assert journal.get(scope, 1)["server_id"]
@@ -0,0 +1,76 @@
+import gap_client as gap
+import logging
+import os
+import pytest
+import subprocess
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+# Milliseconds "import gap_client" may take on top of the interpreter's own startup
+import_budget_ms = float(os.environ.get("GAP_IMPORT_BUDGET_MS", 150))
+
+# Modules that must not be imported until a code path needs them
+lazy_dependencies = ["bs4", "html5lib", "requests", "urllib3", "requests_oauth2client", "jwskate", "cryptography", "httpx", "pprint"]
+
+
+def run_python(code, *flags):
+	cwd = os.path.dirname(os.path.dirname(gap.__file__))
+	return subprocess.run([sys.executable, *flags, "-c", code], cwd=cwd, capture_output=True, text=True, check=True)
+
+
+def import_time_ms():
+	"""
+	Cumulative import time of gap_client from python -X importtime, best of three runs
+	"""
+	best = None
+	for run in range(3):
+		lines = run_python("import gap_client", "-X", "importtime").stderr.splitlines()
+		for line in lines:
+			parts = [part.strip() for part in line.split("|")]
+			if len(parts) == 3 and parts[2] == "gap_client":
+				ms = int(parts[1]) / 1000
+				best = ms if best is None else min(best, ms)
+	return best
+
+
+# Test cases
+#######################################################################
+
+
+def test_import_does_not_load_heavy_dependencies():
+	code = f"import sys, gap_client; print(','.join(m for m in {lazy_dependencies!r} if m in sys.modules))"
+	assert run_python(code).stdout.strip() == ""
+
+
+def test_lazy_names_load_on_first_use():
+	code = "import sys, gap_client; gap_client.Client; print('requests' in sys.modules, 'requests_oauth2client' in sys.modules, 'httpx' in sys.modules)"
+	assert run_python(code).stdout.strip() == "True False False"
+	assert gap.CachedClientCredentialsAuth is gap.oauth.CachedClientCredentialsAuth
+	assert "AsyncClient" in dir(gap)
+	with pytest.raises(AttributeError):
+		gap.no_such_name
+
+
+def test_import_time_budget():
+	ms = import_time_ms()
+	assert ms is not None
+	assert ms < import_budget_ms, f"import gap_client took {ms:.1f} ms, the budget is {import_budget_ms:.0f} ms"
+
+
+def test_star_import_exports_lazy_names():
+	code = "import sys; from gap_client import *; print(Client.__name__, AsyncClient.__name__, GapSession.__name__, 'requests' in sys.modules)"
+	assert run_python(code).stdout.strip() == "Client AsyncClient GapSession True"
+	assert "Client" in gap.__all__
+	assert "WireTracer" in gap.__all__
+	assert set(gap.lazy_names) <= set(gap.__all__)
+	assert all(hasattr(gap, name) for name in gap.__all__)
+	for internal in ["logger", "worker_mapper", "span_ids", "null_span", "current_span", "current_collector", "Enum", "EnumMeta"]:
+		assert internal not in gap.__all__
+	code = "logger = 'mine'; from gap_client import *; print(logger)"
+	assert run_python(code).stdout.strip() == "mine"
@@ -0,0 +1,51 @@
+import gap_client as gap
+import io
+import logging
+import os
+import pytest
+import subprocess
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+class Exploding:
+	def __repr__(self):
+		raise AssertionError("formatted while logging was disabled")
+
+
+# Test cases
+#######################################################################
+
+
+def test_import_leaves_root_logger_alone():
+	code = "import logging, gap_client; root = logging.getLogger(); print(root.level, len(root.handlers))"
+	out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(gap.__file__)), capture_output=True, text=True, check=True).stdout
+	assert out == f"{logging.WARNING} 0\n"
+	assert any(isinstance(handler, logging.NullHandler) for handler in logging.getLogger(gap.library_logger_name).handlers)
+
+
+def test_pretty_is_formatted_only_when_emitted():
+	library_logger = logging.getLogger("gap_client.helpers")
+	level = library_logger.level
+	library_logger.setLevel(logging.WARNING)
+	try:
+		library_logger.debug("value: %s", gap.pretty(Exploding()))
+	finally:
+		library_logger.setLevel(level)
+	assert str(gap.pretty({"b": 1, "a": [1, 2]})) == "{'a': [1, 2], 'b': 1}"
+
+
+def test_enable_logging_is_scoped_to_the_library():
+	stream = io.StringIO()
+	handler = gap.enable_logging(level=logging.DEBUG, stream=stream, fmt="%(name)s %(message)s")
+	try:
+		logging.getLogger("gap_client.helpers").debug("from %s", "gap")
+		logging.getLogger("urllib3.connectionpool").warning("from urllib3")
+	finally:
+		gap.disable_logging(handler)
+	assert stream.getvalue() == "gap_client.helpers from gap\n"
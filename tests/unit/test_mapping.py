@@ -0,0 +1,70 @@
+import gap_client as gap
+import csv
+import logging
+import os
+import pytest
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+here = os.path.dirname(__file__)
+
+
+@pytest.fixture(scope='module')
+def soa_rows():
+	with open(os.path.join(here, "..", "data", "SoA.csv"), "r", encoding='utf-8-sig') as csvfile:
+		return list(csv.DictReader(csvfile, delimiter=',', quotechar='"'))
+
+
+# Test cases
+#######################################################################
+
+
+def test_soa_mapper_splits_fields_and_custom_fields(soa_rows):
+	mapper = gap.AuditGoalMapper(soa_rows[0].keys())
+	assert mapper.custom_fields == ["Applicable", "Control Description", "Control Owner"]
+	goal, custom_fields = mapper.map(soa_rows[3])
+	assert goal["title"] == "Policies for information security"
+	assert goal["status"] == str(gap.Status.in_progress)
+	assert goal["documentation"].startswith('<a href="')
+	# The comments cell holds only empty markup
+	assert goal["description"] == ""
+	assert custom_fields == {"Applicable": "Yes", "Control Description": soa_rows[3]["Control Description"], "Control Owner": "Management in general"}
+
+
+def test_status_translation(soa_rows):
+	statuses = [gap.map_audit_goal(row)[0]["status"] for row in soa_rows]
+	assert statuses.count(str(gap.Status.completed)) == 3
+	assert statuses.count(str(gap.Status.in_progress)) == 2
+	assert set(statuses) == {str(status) for status in gap.Status}
+
+
+def test_map_audit_goal_compiles_once_per_header(soa_rows):
+	gap.soa_mapper.cache_clear()
+	for row in soa_rows:
+		gap.map_audit_goal(row)
+	assert gap.soa_mapper.cache_info().misses == 1
+
+
+def test_user_spec():
+	spec = {
+		  "Name": "title"
+		, "Done": {"_name": "status", "_default": "not_started", "yes": "completed"}
+		, "Internal": None
+	}
+	mapper = gap.AuditGoalMapper(["Name", " Done ", "Internal", "Owner", ""], spec = spec)
+	goal, custom_fields = mapper.map({"Name": " Risk register ", " Done ": "yes", "Internal": "x", "Owner": "'Ops'", "": "junk"})
+	assert goal == {"title": "Risk register", "status": "completed"}
+	assert custom_fields == {"Owner": "Ops"}
+	goal, custom_fields = mapper.map({"Name": "Other", " Done ": "maybe"})
+	assert goal["status"] == "not_started"
+	assert custom_fields == {"Owner": None}
+
+
+def test_invalid_spec():
+	with pytest.raises(ValueError):
+		gap.AuditGoalMapper(["Name"], spec = {"Name": 42})
@@ -0,0 +1,46 @@
+import gap_client as gap
+import logging
+import pytest
+
+logger = logging.getLogger(__name__)
+
+
+# Test cases
+#######################################################################
+
+
+@pytest.mark.parametrize("method, url, name", [
+	  ("GET", "https://gap.example/api-v1/1/audits?page=3", "audits list")
+	, ("POST", "https://gap.example/api-v1/1/audit-goals", "audit-goals create")
+	, ("PATCH", "https://gap.example/api-v1/1/audits/42", "audits patch")
+	, ("PUT", "https://gap.example/api-v1/1/audit-goals/42", "audit-goals patch")
+	, ("GET", "https://gap.example/api-v1/1/custom-fields", "custom-fields list")
+	, ("POST", "https://gap.example/api-v1/account/change-account/1", "change-account")
+	, ("POST", "https://gap.example/auth/token", "token")
+	, ("GET", "https://gap.example/other/7/x", "GET /other/{id}/x")
+])
+def test_endpoint_name(method, url, name):
+	assert gap.endpoint_name(method, url) == name
+
+
+def test_registry_snapshot_and_prometheus_text():
+	registry = gap.MetricsRegistry(buckets=(0.1, 1.0))
+	registry.observe_request("audits list", 200, 0.05, 0, 1000)
+	registry.observe_request("audits list", 429, 2.0, 0, 10)
+	registry.observe_request("audits list", None, 0.5, error=OSError("reset"))
+	registry.observe_retry("audits list")
+	registry.observe_listing("audits list", 4)
+	registry.add_cache("titles", lambda: {"hits": 3, "misses": 1})
+	snapshot = registry.snapshot()
+	audits = snapshot["endpoints"]["audits list"]
+	assert (audits["requests"], audits["errors"], audits["retries"]) == (3, 1, 1)
+	assert audits["statuses"] == {"200": 1, "429": 1, "error": 1}
+	assert audits["latency"]["buckets"] == {"0.1": 1, "1.0": 2, "+Inf": 3}
+	assert (audits["bytes_received"], audits["pages_per_listing"]) == (1010, 4.0)
+	assert snapshot["caches"] == {"titles": {"hits": 3, "misses": 1}}
+	text = registry.prometheus_text()
+	assert '# TYPE gap_client_request_duration_seconds histogram' in text
+	assert 'gap_client_requests_total{endpoint="audits list",status="429"} 1' in text
+	assert 'gap_client_request_duration_seconds_bucket{endpoint="audits list",le="+Inf"} 3' in text
+	assert 'gap_client_listing_pages_total{endpoint="audits list"} 4' in text
+	assert 'gap_client_cache_hits_total{cache="titles"} 3' in text
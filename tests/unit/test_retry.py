@@ -0,0 +1,135 @@
+import gap_client as gap
+import email.utils
+import http.server
+import json
+import logging
+import pytest
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+class ScriptedHandler(http.server.BaseHTTPRequestHandler):
+	"""
+	Answers with the next status of the script, and records the requests it sees
+	"""
+	protocol_version = "HTTP/1.1"
+	script = list()
+	seen = list()
+
+	def respond(self):
+		length = int(self.headers.get("Content-Length") or 0)
+		if length:
+			self.rfile.read(length)
+		self.seen.append((self.command, self.headers.get("Idempotency-Key")))
+		status, headers = self.script.pop(0) if self.script else (200, dict())
+		body = json.dumps({"status": status}).encode()
+		self.send_response(status)
+		for k, v in headers.items():
+			self.send_header(k, v)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	do_GET = respond
+	do_POST = respond
+	do_PUT = respond
+
+	def log_message(self, format, *args):
+		pass
+
+
+@pytest.fixture(scope='function')
+def scripted_server(request):
+	ScriptedHandler.script = list()
+	ScriptedHandler.seen = list()
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+	thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+	thread.start()
+	def teardown():
+		server.shutdown()
+		server.server_close()
+	request.addfinalizer(teardown)
+	return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+fast_policy = gap.RetryPolicy(max_attempts = 4, backoff_base = 0.001, backoff_max = 0.01)
+
+
+# Test cases
+#######################################################################
+
+
+def test_parse_retry_after():
+	assert gap.parse_retry_after("3") == 3.0
+	assert gap.parse_retry_after(None) is None
+	assert gap.parse_retry_after("soon") is None
+	in_ten = email.utils.formatdate(time.time() + 10, usegmt=True)
+	assert 8 <= gap.parse_retry_after(in_ten) <= 10
+
+
+def test_backoff_grows_and_is_capped():
+	policy = gap.RetryPolicy(backoff_base = 1, backoff_max = 5, jitter = False)
+	assert [policy.delay(attempt) for attempt in range(1, 6)] == [1, 2, 4, 5, 5]
+	assert policy.delay(1, retry_after = 7) == 7
+	jittered = gap.RetryPolicy(backoff_base = 1, backoff_max = 5)
+	assert all(0 <= jittered.delay(3) <= 4 for i in range(20))
+
+
+def test_retries_get_until_success(scripted_server):
+	ScriptedHandler.script = [(503, dict()), (429, {"Retry-After": "0"}), (200, dict())]
+	session = gap.make_session(retry_policy = fast_policy)
+	res = session.get(scripted_server)
+	assert res.status_code == 200
+	assert len(ScriptedHandler.seen) == 3
+
+
+def test_gives_up_after_max_attempts(scripted_server):
+	ScriptedHandler.script = [(502, dict())] * 10
+	session = gap.make_session(retry_policy = fast_policy)
+	res = session.get(scripted_server)
+	assert res.status_code == 502
+	assert len(ScriptedHandler.seen) == 4
+
+
+def test_post_needs_idempotency_strategy(scripted_server):
+	ScriptedHandler.script = [(503, dict()), (200, dict())]
+	session = gap.make_session(retry_policy = fast_policy)
+	res = session.post(scripted_server, json = {"a": 1})
+	assert res.status_code == 503
+	assert len(ScriptedHandler.seen) == 1
+
+
+def test_post_retried_with_stable_idempotency_key(scripted_server):
+	ScriptedHandler.script = [(503, dict()), (200, dict())]
+	policy = gap.RetryPolicy(max_attempts = 3, backoff_base = 0.001, idempotency_header = "Idempotency-Key")
+	session = gap.make_session(retry_policy = policy)
+	res = session.post(scripted_server, json = {"a": 1})
+	assert res.status_code == 200
+	keys = [key for method, key in ScriptedHandler.seen]
+	assert len(keys) == 2 and keys[0] and keys[0] == keys[1]
+
+
+def test_per_call_override(scripted_server):
+	ScriptedHandler.script = [(503, dict()), (200, dict())]
+	session = gap.make_session(retry_policy = fast_policy)
+	res = session.get(scripted_server, retry = False)
+	assert res.status_code == 503
+
+
+def test_budget_stops_retry_storm(scripted_server):
+	ScriptedHandler.script = [(503, dict())] * 20
+	budget = gap.RetryBudget(ratio = 0.0, initial = 2)
+	session = gap.make_session(retry_policy = fast_policy, retry_budget = budget)
+	for i in range(3):
+		session.get(scripted_server)
+	# 3 calls, 2 retries in total before the budget ran dry
+	assert len(ScriptedHandler.seen) == 5
+	assert budget.retries == 2
+	assert budget.denied >= 1
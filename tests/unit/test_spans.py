@@ -0,0 +1,82 @@
+import gap_client as gap
+import logging
+import pytest
+
+logger = logging.getLogger(__name__)
+
+
+# Test cases
+#######################################################################
+
+
+def test_span_is_free_when_not_collecting():
+	assert gap.span("anything") is gap.null_span
+	assert gap.clean_custom_field({"name": "A"})[0]["name"] == "A"
+	assert gap.timed(gap.clean_custom_field) is gap.clean_custom_field
+
+
+def test_spans_nest_and_reach_hooks_and_exporters():
+	started = list()
+	traces = list()
+	collector = gap.SpanCollector(exporters=[traces.append])
+	collector.add_hook(before=lambda span: started.append(span.name))
+	with collector.activate():
+		with gap.span("call", kind="test") as call:
+			with gap.span("phase"):
+				gap.page_items({"data": [{"name": "A"}]}, name="custom-fields", clean_fun=gap.clean_custom_field)
+			with pytest.raises(ValueError):
+				with gap.span("failing"):
+					raise ValueError("boom")
+	assert started == ["call", "phase", "clean_custom_field", "failing"]
+	assert len(traces) == 1
+	by_name = {span.name: span for span in traces[0]}
+	assert by_name["clean_custom_field"].parent_id == by_name["phase"].span_id
+	assert by_name["phase"].parent_id == call.span_id
+	assert {span.trace_id for span in traces[0]} == {call.span_id}
+	assert by_name["failing"].error == "ValueError: boom"
+	assert call.duration >= by_name["phase"].duration
+	assert "  phase" in gap.format_trace(traces[0])
+
+
+def test_capture_modes():
+	with gap.capture("cprofile") as capture:
+		sorted(range(1000))
+	assert "sorted" in capture.report(limit=5)
+	with gap.capture("tracemalloc") as capture:
+		data = [bytes(1000) for i in range(100)]
+	assert capture.peak_bytes >= 100000
+	with pytest.raises(ValueError):
+		with gap.capture("perf"):
+			pass
+
+
+def test_opentelemetry_exporter():
+	sdk_trace = pytest.importorskip("opentelemetry.sdk.trace")
+	export = pytest.importorskip("opentelemetry.sdk.trace.export.in_memory_span_exporter")
+	memory = export.InMemorySpanExporter()
+	provider = sdk_trace.TracerProvider()
+	from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+	provider.add_span_processor(SimpleSpanProcessor(memory))
+	collector = gap.SpanCollector(exporters=[gap.OpenTelemetryExporter(provider.get_tracer("test"))])
+	with collector.span("call"):
+		with collector.span("phase"):
+			pass
+	spans = {span.name: span for span in memory.get_finished_spans()}
+	assert spans["phase"].parent.span_id == spans["call"].context.span_id
+
+
+def test_span_ending_after_its_root_is_exported_alone():
+	traces = list()
+	collector = gap.SpanCollector(exporters=[traces.append], max_flushed=2)
+	with collector.span("call") as call:
+		late = gap.Span("background", call)
+	late.finish()
+	collector.finish(late)
+	assert collector.pending == {}
+	assert [[span.name for span in spans] for spans in traces] == [["call"], ["background"]]
+	assert [span.name for span in collector.last_trace()] == ["call"]
+	for i in range(3):
+		with collector.span("other"):
+			pass
+	assert call.trace_id not in collector.flushed
+	assert len(collector.flushed) == 2
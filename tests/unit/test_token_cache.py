@@ -0,0 +1,90 @@
+import gap_client as gap
+import datetime
+import concurrent.futures
+import logging
+import pytest
+import requests
+import threading
+import time
+from requests_oauth2client import BearerToken
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+class FakeOAuth2Client:
+	"""
+	Stands in for OAuth2Client and counts how many tokens were requested
+	"""
+	def __init__(self, expires_in = 3600, delay = 0.0):
+		self.expires_in = expires_in
+		self.delay = delay
+		self.fetches = 0
+		self.lock = threading.Lock()
+
+	def client_credentials(self, **token_kwargs):
+		time.sleep(self.delay)
+		with self.lock:
+			self.fetches += 1
+			n = self.fetches
+		expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.expires_in)
+		return BearerToken(f"token-{n}", expires_at=expires_at)
+
+
+def make_auth(oauth_client, cache):
+	return gap.CachedClientCredentialsAuth(oauth_client, token_cache=cache, token_url="https://gap.example/auth/token", client_id="id", scope="all", resource="https://gap.example")
+
+
+def authorize(auth):
+	request = requests.Request("GET", "https://gap.example/api-v1/x").prepare()
+	return auth(request).headers["Authorization"]
+
+
+# Test cases
+#######################################################################
+
+
+def test_cache_round_trip_and_expiry(tmp_path):
+	cache = gap.FileTokenCache(path=str(tmp_path), leeway=10)
+	key = cache.key("https://a/token", "id", "all", "https://a")
+	assert key != cache.key("https://a/token", "other", "all", "https://a")
+	assert cache.load(key) is None
+	cache.save(key, "abc", time.time() + 3600)
+	assert cache.load(key).get("access_token") == "abc"
+	# Within leeway of expiring counts as expired
+	cache.save(key, "abc", time.time() + 5)
+	assert cache.load(key) is None
+
+
+def test_token_shared_between_clients(tmp_path):
+	cache = gap.FileTokenCache(path=str(tmp_path))
+	oauth_client = FakeOAuth2Client()
+	assert authorize(make_auth(oauth_client, cache)) == "Bearer token-1"
+	assert authorize(make_auth(oauth_client, cache)) == "Bearer token-1"
+	assert oauth_client.fetches == 1
+
+
+def test_expired_cache_entry_is_refreshed(tmp_path):
+	cache = gap.FileTokenCache(path=str(tmp_path), leeway=60)
+	oauth_client = FakeOAuth2Client(expires_in=30)
+	authorize(make_auth(oauth_client, cache))
+	authorize(make_auth(oauth_client, cache))
+	assert oauth_client.fetches == 2
+
+
+def test_concurrent_start_fetches_once(tmp_path):
+	cache = gap.FileTokenCache(path=str(tmp_path))
+	oauth_client = FakeOAuth2Client(delay=0.05)
+	with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+		headers = list(executor.map(lambda i: authorize(make_auth(oauth_client, cache)), range(16)))
+	assert set(headers) == {"Bearer token-1"}
+	assert oauth_client.fetches == 1
+
+
+def test_make_token_cache(tmp_path):
+	assert gap.make_token_cache(None) is None
+	assert gap.make_token_cache(True).path == gap.default_token_cache_dir
+	assert gap.make_token_cache(str(tmp_path)).path == str(tmp_path)
@@ -0,0 +1,85 @@
+import gap_client as gap
+import concurrent.futures
+import http.server
+import json
+import logging
+import pytest
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Test fixtures
+#######################################################################
+
+
+class JsonHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	def do_GET(self):
+		body = json.dumps({"path": self.path}).encode()
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+@pytest.fixture(scope='function')
+def json_server(request):
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), JsonHandler)
+	thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+	thread.start()
+	def teardown():
+		server.shutdown()
+		server.server_close()
+	request.addfinalizer(teardown)
+	return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# Test cases
+#######################################################################
+
+
+def test_session_reuses_connections(json_server):
+	session = gap.make_session()
+	for i in range(5):
+		res = session.get(f"{json_server}/{i}")
+		res.raise_for_status()
+	stats = gap.pool_stats(session)
+	assert stats["pools"] == 1
+	assert stats["requests"] == 5
+	assert stats["connections_created"] == 1
+	assert stats["connections_reused"] == 4
+
+
+def test_session_without_keep_alive(json_server):
+	session = gap.make_session(keep_alive = False)
+	for i in range(3):
+		session.get(f"{json_server}/{i}").raise_for_status()
+	stats = gap.pool_stats(session)
+	assert stats["connections_created"] == 3
+	assert stats["connections_reused"] == 0
+
+
+def test_blocking_pool_bounds_connections(json_server):
+	session = gap.make_session(pool_maxsize = 2, pool_block = True)
+	with concurrent.futures.ThreadPoolExecutor(max_workers = 8) as executor:
+		for res in executor.map(lambda i: session.get(f"{json_server}/{i}"), range(32)):
+			res.raise_for_status()
+	stats = gap.pool_stats(session)
+	assert stats["requests"] == 32
+	assert stats["connections_created"] <= 2
+
+
+def test_sessions_do_not_share_tracers(json_server):
+	one = gap.make_session()
+	other = gap.make_session()
+	with gap.tracing(one) as tracer:
+		other.get(f"{json_server}/other").raise_for_status()
+		one.get(f"{json_server}/one").raise_for_status()
+	assert [exchange["url"] for exchange in tracer.exchanges()] == [f"{json_server}/one"]
+	assert gap.session_tracers(one) == tuple()